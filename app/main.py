@@ -6,9 +6,13 @@ from app.database import Base, engine
 from app.routers import users, auth, assistants, messages, payments, webhook
 from app.routers.web_chat import router as web_chat
 from app.routers.analytics import router as analytics
+from app.routers.system import router as system
 from app.admin import setup_admin
 from app.admin.auth import AdminAuth
 from app.core.logging_config import configure_logging
+from app.services.clients import readiness
+from app.services.vector_backends import ensure_vector_stores
+from app.services.ingestion_queue import ingestion_queue
 
 import os
 import logging
@@ -63,6 +67,7 @@ app.include_router(payments, prefix="/payments")
 app.include_router(webhook, tags=["Webhooks"])
 app.include_router(web_chat, prefix="/web-chat", tags=["Web Chat"])
 app.include_router(analytics)
+app.include_router(system, prefix="/system", tags=["System"])
 
 logger.info("Setting up admin interface")
 admin = setup_admin(app)
@@ -70,6 +75,20 @@ admin.authentication_backend = AdminAuth(secret_key=os.getenv("SECRET_KEY", "you
 
 logger.info("AI Assistant API started successfully")
 
+@app.on_event("startup")
+async def start_background_initialization():
+    """Prepare remote resources in the background so workers accept requests right away"""
+    openai_configured = bool(os.getenv("OPENAI_API_KEY"))
+    readiness.set("openai", openai_configured, None if openai_configured else "OPENAI_API_KEY is not set")
+    readiness.start("vector_store", ensure_vector_stores)
+    # Also resumes the uploads left unfinished by stopped workers
+    await ingestion_queue.start()
+
+@app.on_event("shutdown")
+async def stop_ingestion_workers():
+    """Stop the background ingestion workers; unfinished uploads stay spooled for the next worker"""
+    await ingestion_queue.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "AI Assistant API is running"}
\ No newline at end of file
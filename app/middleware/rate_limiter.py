@@ -0,0 +1,294 @@
+from fastapi import HTTPException, Request
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+from dotenv import load_dotenv
+import ipaddress
+import math
+import os
+import threading
+import time
+import zlib
+import logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# A limit is (capacity, refill_rate): `capacity` requests may burst at once and
+# the bucket refills at `refill_rate` requests per second
+Limit = Tuple[float, float]
+# A bucket to take a token from: (key, capacity, refill_rate)
+Bucket = Tuple[str, float, float]
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_limit(value: str) -> Limit:
+    """Parse a limit written as "<requests>/<seconds>", e.g. "10/60" for 10 requests per minute"""
+    requests, seconds = value.split("/")
+    capacity = float(requests)
+    return capacity, capacity / float(seconds)
+
+
+def _limit_from_env(name: str, default: str) -> Limit:
+    return parse_limit(os.getenv(name, default))
+
+
+def parse_networks(value: str) -> List[Network]:
+    """Parse comma separated addresses and CIDR ranges, e.g. "10.0.0.0/8,127.0.0.1" """
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in value.split(",") if part.strip()]
+
+
+def _is_trusted(address: str, trusted_proxies: Sequence[Network]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(request: Request, trusted_proxies: Sequence[Network] = ()) -> Optional[str]:
+    """
+    Address of the client that sent a request
+
+    Behind a reverse proxy the connection comes from the proxy, so when the peer is one of
+    `trusted_proxies` the address is taken from X-Forwarded-For instead: the right-most
+    entry that isn't a trusted proxy. Entries left of it could be forged by the client.
+    """
+    address = request.client.host if request.client else None
+    if not address or not _is_trusted(address, trusted_proxies):
+        return address
+    forwarded = [part.strip() for part in ",".join(request.headers.getlist("x-forwarded-for")).split(",") if part.strip()]
+    for hop in reversed(forwarded):
+        if not _is_trusted(hop, trusted_proxies):
+            return hop
+        address = hop
+    return address
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class InMemoryBucketStore:
+    """
+    Token buckets kept in process memory.
+
+    Buckets are spread over independently locked shards so that concurrent
+    requests for different keys rarely wait on the same lock.
+    """
+
+    def __init__(self, shard_count: int = 64, max_keys_per_shard: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.max_keys_per_shard = max_keys_per_shard
+        self._shards: List[Tuple[threading.Lock, Dict[str, TokenBucket]]] = [
+            (threading.Lock(), {}) for _ in range(shard_count)
+        ]
+
+    def _shard(self, key: str) -> Tuple[threading.Lock, Dict[str, TokenBucket]]:
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def consume(self, buckets: Sequence[Bucket]) -> List[float]:
+        """
+        Take one token from each of the buckets, or from none of them if any is empty
+
+        Returns:
+            Seconds until each bucket has a token again, all 0.0 when the tokens were taken
+        """
+        now = self.clock()
+        # Locks are taken in shard order so concurrent requests can't deadlock
+        shards = sorted({zlib.crc32(key.encode()) % len(self._shards) for key, _, _ in buckets})
+        locks = [self._shards[index][0] for index in shards]
+        for lock in locks:
+            lock.acquire()
+        try:
+            refilled = [self._refill(key, capacity, refill_rate, now) for key, capacity, refill_rate in buckets]
+            waits = [
+                0.0 if bucket.tokens >= 1 else (1 - bucket.tokens) / refill_rate
+                for bucket, (_, _, refill_rate) in zip(refilled, buckets)
+            ]
+            if not any(waits):
+                for bucket in refilled:
+                    bucket.tokens -= 1
+            return waits
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _refill(self, key: str, capacity: float, refill_rate: float, now: float) -> TokenBucket:
+        """The bucket for `key` with the tokens added since its last update, the shard lock is held"""
+        _, buckets = self._shard(key)
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.max_keys_per_shard:
+                self._evict_idle(buckets, now, capacity, refill_rate)
+            bucket = buckets[key] = TokenBucket(capacity, now)
+        else:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * refill_rate)
+            bucket.updated_at = now
+        return bucket
+
+    @staticmethod
+    def _evict_idle(buckets: Dict[str, TokenBucket], now: float, capacity: float, refill_rate: float):
+        """Drop buckets that have refilled completely; they carry no state worth keeping"""
+        full_after = capacity / refill_rate
+        idle = [key for key, bucket in buckets.items() if now - bucket.updated_at >= full_after]
+        for key in idle:
+            del buckets[key]
+
+
+# Atomic update of several token buckets executed inside Redis: takes a token from
+# every bucket (KEYS[i], with ARGV capacity and rate at 2i and 2i+1) or from none
+_REDIS_TOKEN_BUCKETS = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local waits = {}
+local allowed = true
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local current = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    current = math.min(capacity, current + math.max(0, now - ts) * rate)
+    tokens[i] = current
+    if current >= 1 then
+        waits[i] = '0'
+    else
+        waits[i] = tostring((1 - current) / rate)
+        allowed = false
+    end
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    if allowed then
+        tokens[i] = tokens[i] - 1
+    end
+    redis.call('HSET', key, 'tokens', tokens[i], 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return waits
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by all workers through Redis"""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the 'redis' package is not installed")
+
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(_REDIS_TOKEN_BUCKETS)
+
+    def consume(self, buckets: Sequence[Bucket]) -> List[float]:
+        """Take one token from each of the buckets, or from none of them (see InMemoryBucketStore)"""
+        args = [time.time()]
+        for _, capacity, refill_rate in buckets:
+            args.extend([capacity, refill_rate])
+        waits = self.script(keys=[self.prefix + key for key, _, _ in buckets], args=args)
+        return [float(wait) for wait in waits]
+
+
+class RateLimiter:
+    """
+    Applies per-client, per-IP and per-business token buckets to a request.
+
+    Limits are grouped by scope so that cheap endpoints (history polling) and
+    expensive ones (chat turns that call OpenAI) can be limited separately.
+    """
+
+    def __init__(self, store, limits: Dict[str, Dict[str, Limit]], trusted_proxies: Sequence[Network] = ()):
+        self.store = store
+        self.limits = limits
+        self.trusted_proxies = trusted_proxies
+
+    def check(self, scope: str, keys: Dict[str, Optional[str]]) -> Tuple[bool, float]:
+        """
+        Consume a token from every bucket that applies to this request
+
+        Tokens are only taken when every bucket has one, so a request rejected by one
+        limit doesn't use up the others.
+
+        Args:
+            scope: Limit group, e.g. "chat" or "session"
+            keys: Mapping of key type (client, ip, business) to its value
+
+        Returns:
+            Tuple of (allowed, retry_after_seconds)
+        """
+        key_types = []
+        buckets = []
+        for key_type, value in keys.items():
+            limit = self.limits.get(scope, {}).get(key_type)
+            if not value or not limit:
+                continue
+            capacity, refill_rate = limit
+            key_types.append(key_type)
+            buckets.append((f"{scope}:{key_type}:{value}", capacity, refill_rate))
+        if not buckets:
+            return True, 0.0
+
+        waits = self.store.consume(buckets)
+        if any(waits):
+            exceeded = ", ".join(f"{key_type}={keys[key_type]}" for key_type, wait in zip(key_types, waits) if wait)
+            logger.warning(f"Rate limit exceeded for scope={scope}, {exceeded}")
+            return False, max(waits)
+
+        return True, 0.0
+
+    def dependency(self, scope: str):
+        """Build a FastAPI dependency that enforces the limits of `scope`"""
+        async def enforce_rate_limit(request: Request):
+            keys = {
+                "client": request.query_params.get("client_id"),
+                "ip": client_ip(request, self.trusted_proxies),
+                "business": request.path_params.get("business_unique_id")
+            }
+            allowed, retry_after = self.check(scope, keys)
+            if not allowed:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests. Please slow down and try again shortly.",
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+                )
+
+        return enforce_rate_limit
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Create the web chat rate limiter from environment configuration"""
+    redis_url = os.getenv("RATE_LIMIT_REDIS_URL")
+    if redis_url:
+        logger.info("Using Redis backed rate limiter shared across workers")
+        store = RedisBucketStore(redis_url)
+    else:
+        store = InMemoryBucketStore()
+
+    limits = {
+        # Chat turns trigger embedding and completion requests
+        "chat": {
+            "client": _limit_from_env("RATE_LIMIT_CHAT_CLIENT", "10/60"),
+            "ip": _limit_from_env("RATE_LIMIT_CHAT_IP", "30/60"),
+            "business": _limit_from_env("RATE_LIMIT_CHAT_BUSINESS", "300/60")
+        },
+        # Session setup and history polling only touch memory and the database
+        "session": {
+            "client": _limit_from_env("RATE_LIMIT_SESSION_CLIENT", "120/60"),
+            "ip": _limit_from_env("RATE_LIMIT_SESSION_IP", "300/60"),
+            "business": _limit_from_env("RATE_LIMIT_SESSION_BUSINESS", "3000/60")
+        }
+    }
+    # Reverse proxies whose X-Forwarded-For header is trusted for the "ip" limits; uvicorn's
+    # --proxy-headers with --forwarded-allow-ips does the same for request.client instead
+    trusted_proxies = parse_networks(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", ""))
+    return RateLimiter(store, limits, trusted_proxies)
+
+
+web_chat_rate_limiter = create_rate_limiter()
@@ -5,6 +5,8 @@ from app.models.payment import Payment
 from app.models.subscription_plans import SubscriptionPlan
 from app.models.token import BlacklistedToken
 from app.models.analytics import ConversationAnalytics
+from app.models.knowledge import KnowledgeDocument, KnowledgeChunk, ChunkText, IngestJobRecord
+from app.models.faq import FAQEntry
 
 __all__ = [
     'User',
@@ -13,5 +15,10 @@ __all__ = [
     'Payment',
     'SubscriptionPlan',
     'BlacklistedToken',
-    'ConversationAnalytics'
+    'ConversationAnalytics',
+    'KnowledgeDocument',
+    'KnowledgeChunk',
+    'ChunkText',
+    'IngestJobRecord',
+    'FAQEntry'
 ]
\ No newline at end of file
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.database import Base
+from datetime import datetime
+
+# Import this to avoid circular imports but don't use it directly
+import app.models.assistant
+
+class FAQEntry(Base):
+    """A frequently asked question of an assistant with its pre-generated answer"""
+    __tablename__ = "faq_entries"
+    __table_args__ = (UniqueConstraint("assistant_id", "language", "normalized_question", name="uq_faq_entry_question"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    assistant_id = Column(Integer, ForeignKey("assistants.id", ondelete="CASCADE"), nullable=False, index=True)
+    language = Column(String, nullable=False)
+    normalized_question = Column(String, nullable=False)
+    question = Column(String, nullable=False)  # Most common wording, used to generate the answer
+    answer = Column(String, nullable=False)
+    frequency = Column(Integer, nullable=False, default=0)
+    # Knowledge chunks the answer was generated from; the answer is regenerated when they change
+    source_ids = Column(JSON, nullable=False, default=list)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    assistant = relationship("AIAssistant")
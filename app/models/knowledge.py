@@ -0,0 +1,85 @@
+from sqlalchemy import Column, Integer, String, Text, JSON, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.database import Base
+from datetime import datetime
+
+# Import this to avoid circular imports but don't use it directly
+import app.models.business_profile
+
+class KnowledgeDocument(Base):
+    """One uploaded file in a business profile's knowledge base"""
+    __tablename__ = "knowledge_documents"
+    __table_args__ = (UniqueConstraint("business_profile_id", "filename", name="uq_knowledge_document_filename"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    business_profile_id = Column(Integer, ForeignKey("business_profiles.id", ondelete="CASCADE"), nullable=False, index=True)
+    namespace = Column(String, nullable=False)
+    # Prefix of the document's chunk vector IDs (<document_id>#<content_hash>)
+    document_id = Column(String, nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    file_hash = Column(String, nullable=False)  # sha256 of the uploaded bytes
+    size_bytes = Column(Integer, nullable=False, default=0)
+    chunk_count = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="processing")  # processing, ready or failed
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    business_profile = relationship("BusinessProfile")
+    chunks = relationship(
+        "KnowledgeChunk",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="KnowledgeChunk.chunk_index"
+    )
+
+class KnowledgeChunk(Base):
+    """A chunk of a knowledge document and the ID of its vector"""
+    __tablename__ = "knowledge_chunks"
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("knowledge_documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    vector_id = Column(String, nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    token_count = Column(Integer, nullable=False, default=0)
+
+    document = relationship("KnowledgeDocument", back_populates="chunks")
+
+class ChunkText(Base):
+    """
+    Text and metadata of a vector store chunk, keyed by namespace and vector ID.
+    Vectors only carry the chunk's document ID, the text is fetched from here after retrieval.
+    """
+    __tablename__ = "chunk_texts"
+
+    namespace = Column(String, primary_key=True)
+    vector_id = Column(String, primary_key=True)
+    text = Column(Text, nullable=False)
+    chunk_metadata = Column("metadata", JSON, nullable=False, default=dict)
+
+class IngestJobRecord(Base):
+    """
+    Durable state of a background knowledge upload (see ingestion_queue.py), so any
+    worker can report it and unfinished jobs are picked up again after a restart
+    """
+    __tablename__ = "ingest_jobs"
+
+    id = Column(String, primary_key=True)
+    business_profile_id = Column(Integer, ForeignKey("business_profiles.id", ondelete="CASCADE"), nullable=False, index=True)
+    namespace = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    path = Column(String, nullable=False)  # spooled upload
+    kind = Column(String, nullable=False, default="document")  # document or snapshot
+    document_id = Column(Integer, nullable=True)  # catalog document to replace
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, done or failed
+    stage = Column(String, nullable=False, default="queued")
+    progress = Column(JSON, nullable=False, default=dict)
+    report = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    # Worker process holding the job and when it last renewed its claim
+    claimed_by = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
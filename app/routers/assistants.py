@@ -1,18 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, File, UploadFile, Form
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.models.assistant import AIAssistant
 from app.models.business_profile import BusinessProfile
 from app.models.analytics import ConversationAnalytics
 from app.schemas.assistant import AssistantCreate, AssistantResponse, AssistantQuery, BusinessProfileBase
+from app.schemas.knowledge import KnowledgeDocumentResponse
 from app.dependencies import get_current_user, get_db
 from app.middleware.subscription_middleware import verify_active_subscription
 from app.services.ai_service import AIService
-from app.services.file_processor import process_file
-from app.services.vector_store import store_embeddings
+from app.services.embedding_models import embedding_model_for, record_embedding_model
+from app.services.faq_index import faq_index, refresh_faq_for_business
+from app.services.ingestion_queue import INGEST_MAX_UPLOAD_BYTES, UploadTooLargeError, ingestion_queue
+from app.services.knowledge_catalog import delete_document, get_document, list_documents
+from app.services.knowledge_snapshot import SNAPSHOT_DTYPES, SNAPSHOT_MAX_BYTES, check_snapshot_model, export_namespace, read_header
 from PyPDF2 import PdfReader
 import io
 import os
+import asyncio
+import tempfile
 import logging
 from dotenv import load_dotenv
 import time
@@ -252,14 +261,18 @@ async def chat_with_assistant(
         logger.info(f"[CHAT] Getting AI response for assistant_id={assistant_id}")
         start_time = time.time()
         
-        # Pass the db session to the AI service
-        response = await ai_service.get_response(
-            query.text,
-            config,
-            assistant_id,
-            user.id,
-            db=db  # Pass database session
-        )
+        # Frequent questions have a pre-generated answer
+        # The lookup may query the database, so keep it off the event loop
+        response = await run_in_threadpool(faq_index.lookup, db, assistant.id, language, query.text)
+        if response is None:
+            # Pass the db session to the AI service
+            response = await ai_service.get_response(
+                query.text,
+                config,
+                assistant_id,
+                user.id,
+                db=db  # Pass database session
+            )
         
         elapsed_time = time.time() - start_time
         logger.info(f"[CHAT] Response generated in {elapsed_time:.2f} seconds")
@@ -273,16 +286,8 @@ async def chat_with_assistant(
         logger.error(f"[CHAT] Error getting AI response: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/{assistant_id}/upload-knowledge")
-async def upload_knowledge(
-    assistant_id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    user=Depends(verify_active_subscription)  # Require active subscription
-):
-    """Upload knowledge base document for an assistant"""
-    logger.info(f"Knowledge base upload started for assistant_id={assistant_id}, file={file.filename}")
-    
+def get_owned_business_profile(assistant_id: int, user, db: Session) -> BusinessProfile:
+    """Business profile of one of the user's assistants, or a 404/400 error"""
     assistant = db.query(AIAssistant).filter(
         AIAssistant.id == assistant_id, 
         AIAssistant.user_id == user.id
@@ -291,19 +296,15 @@ async def upload_knowledge(
     if not assistant:
         logger.warning(f"Assistant not found: assistant_id={assistant_id}, user_id={user.id}")
         raise HTTPException(status_code=404, detail="Assistant not found")
-        
-    # Get business profile if it exists
-    business_profile = None
-    if hasattr(assistant, 'business_profile') and assistant.business_profile:
-        business_profile = assistant.business_profile
-        logger.info(f"Using existing business profile: profile_id={business_profile.id}")
     
-    # If no business profile exists, create one
-    if not business_profile:
+    if not assistant.business_profile:
         logger.warning(f"No business profile found for assistant_id={assistant_id}")
         raise HTTPException(status_code=400, detail="Assistant has no business profile. Please create one first.")
+    
+    logger.info(f"Using existing business profile: profile_id={assistant.business_profile.id}")
+    return assistant.business_profile
 
-    # Validate file type
+def validate_knowledge_file(file: UploadFile):
     if not file.filename.endswith(('.pdf', '.docx', '.txt')):
         logger.warning(f"Invalid file type: {file.filename}")
         raise HTTPException(
@@ -311,27 +312,49 @@ async def upload_knowledge(
             detail="Unsupported file type. Please upload PDF, DOCX, or TXT files."
         )
 
+async def queue_uploaded_file(business_profile: BusinessProfile, namespace: str, file: UploadFile, document_id: int = None):
+    """Spool an uploaded file for the background ingestion workers, streamed from the request's temporary file"""
+    if file.size == 0:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
     try:
-        logger.info(f"Processing file: {file.filename}")
-        # Process the uploaded file
-        processed_data = await process_file(file)
-        if not processed_data:
-            logger.error(f"Failed to extract text from file: {file.filename}")
-            raise HTTPException(status_code=400, detail="Could not extract text from file")
-        
-        logger.info(f"Text extracted from file, length: {len(processed_data)} characters")
-        
-        # Store embeddings in vector database with business profile namespace
+        return await ingestion_queue.submit(
+            business_profile.id, namespace, file.filename, file.file,
+            document_id=document_id, max_bytes=INGEST_MAX_UPLOAD_BYTES
+        )
+    except UploadTooLargeError:
+        raise HTTPException(status_code=413, detail=f"Documents can be at most {INGEST_MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+
+def ingest_job_response(assistant_id: int, job) -> dict:
+    response = job.as_dict()
+    response["status_url"] = f"/assistants/{assistant_id}/ingest-jobs/{job.id}"
+    return response
+
+@router.post("/{assistant_id}/upload-knowledge", status_code=202)
+async def upload_knowledge(
+    assistant_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    user=Depends(verify_active_subscription)  # Require active subscription
+):
+    """
+    Upload knowledge base document for an assistant
+    
+    The file is ingested in the background; poll the returned status_url for progress.
+    A file with the name of an existing document replaces that document.
+    """
+    logger.info(f"Knowledge base upload started for assistant_id={assistant_id}, file={file.filename}")
+    
+    business_profile = get_owned_business_profile(assistant_id, user, db)
+    validate_knowledge_file(file)
+
+    try:
+        # Embeddings are stored with the business profile namespace
         namespace = f"business_{business_profile.id}"
-        logger.info(f"Storing embeddings in namespace: {namespace}")
-        
-        knowledge_base_id = store_embeddings(processed_data, namespace=namespace)
-        logger.info(f"Knowledge base created with ID: {knowledge_base_id}")
-        
-        # Update business profile with knowledge base reference
-        business_profile.knowledge_base = {"id": knowledge_base_id, "namespace": namespace}
+        # Fix the namespace's embedding model before its first document is ingested
+        business_profile.knowledge_base = record_embedding_model(business_profile.knowledge_base, namespace)
         db.commit()
-        logger.info(f"Business profile updated with knowledge base reference")
+        job = await queue_uploaded_file(business_profile, namespace, file)
+        logger.info(f"Knowledge base upload queued as job {job.id} in namespace: {namespace}")
         
         # Generate chat path and full URL for the business profile
         chat_path = f"/web-chat/simplified/{business_profile.unique_id}"
@@ -340,10 +363,9 @@ async def upload_knowledge(
         # Ensure unique_id is a string
         business_profile.unique_id = str(business_profile.unique_id)
         
-        logger.info(f"Knowledge base upload completed successfully for assistant_id={assistant_id}")
-        
         return {
-            "message": "Knowledge base updated successfully",
+            "message": "Knowledge base upload accepted",
+            "job": ingest_job_response(assistant_id, job),
             "chat_url": chat_url,
             "chat_path": chat_path,
             "business_profile": {
@@ -353,7 +375,146 @@ async def upload_knowledge(
                 "unique_id": business_profile.unique_id
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         logger.error(f"Error uploading knowledge base: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{assistant_id}/ingest-jobs/{job_id}")
+def get_ingest_job(assistant_id: int, job_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    """Status and stage-level progress of a knowledge base upload"""
+    business_profile = get_owned_business_profile(assistant_id, user, db)
+    job = ingestion_queue.get(job_id)
+    if not job or job.business_profile_id != business_profile.id:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return ingest_job_response(assistant_id, job)
+
+@router.get("/{assistant_id}/knowledge-documents", response_model=List[KnowledgeDocumentResponse])
+def get_knowledge_documents(assistant_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    """List the documents in an assistant's knowledge base"""
+    business_profile = get_owned_business_profile(assistant_id, user, db)
+    return list_documents(db, business_profile.id)
+
+@router.put("/{assistant_id}/knowledge-documents/{document_id}", status_code=202)
+async def replace_knowledge_document(
+    assistant_id: int,
+    document_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    user=Depends(verify_active_subscription)  # Require active subscription
+):
+    """Replace a knowledge base document with a new version, re-embedding only changed chunks"""
+    business_profile = get_owned_business_profile(assistant_id, user, db)
+    document = get_document(db, business_profile.id, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    validate_knowledge_file(file)
+    
+    try:
+        job = await queue_uploaded_file(business_profile, document.namespace, file, document_id=document.id)
+        return {
+            "message": "Document replacement accepted",
+            "job": ingest_job_response(assistant_id, job)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error replacing knowledge document {document_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{assistant_id}/knowledge-documents/{document_id}")
+async def delete_knowledge_document(
+    assistant_id: int,
+    document_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """Delete a document and its vectors from an assistant's knowledge base"""
+    business_profile = get_owned_business_profile(assistant_id, user, db)
+    document = get_document(db, business_profile.id, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    try:
+        deleted = await delete_document(db, document)
+        # FAQ answers built from the document's chunks are regenerated
+        background_tasks.add_task(refresh_faq_for_business, business_profile.id)
+        return {"message": "Document deleted successfully", "deleted_vectors": deleted}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error deleting knowledge document {document_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{assistant_id}/knowledge-snapshot")
+async def export_knowledge_snapshot(
+    assistant_id: int,
+    dtype: str = "float32",
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Download an assistant's knowledge base as a snapshot: its embeddings plus chunk texts,
+    which can be imported into another assistant, environment or vector backend without
+    re-embedding. dtype=float16 halves the size.
+    """
+    business_profile = get_owned_business_profile(assistant_id, user, db)
+    knowledge_base = business_profile.knowledge_base or {}
+    namespace = knowledge_base.get("namespace")
+    if not namespace:
+        raise HTTPException(status_code=404, detail="Assistant has no knowledge base")
+    if dtype not in SNAPSHOT_DTYPES:
+        raise HTTPException(status_code=400, detail=f"dtype must be one of: {', '.join(SNAPSHOT_DTYPES)}")
+    
+    fd, path = tempfile.mkstemp(suffix=".kbsnap")
+    os.close(fd)
+    try:
+        header = await asyncio.to_thread(export_namespace, namespace, path, embedding_model_for(knowledge_base), dtype)
+    except Exception as e:
+        os.remove(path)
+        logger.error(f"Error exporting knowledge snapshot of namespace {namespace}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"Exported knowledge snapshot of assistant {assistant_id} with {header.count} vectors")
+    return FileResponse(
+        path,
+        media_type="application/octet-stream",
+        filename=f"{namespace}.kbsnap",
+        background=BackgroundTask(os.remove, path)
+    )
+
+@router.post("/{assistant_id}/knowledge-snapshot", status_code=202)
+async def import_knowledge_snapshot(
+    assistant_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    user=Depends(verify_active_subscription)  # Require active subscription
+):
+    """
+    Queue a knowledge base snapshot for import into an assistant's knowledge base, without
+    any embedding calls. Documents with the same file name are replaced. Poll the returned
+    status_url for the import's progress.
+    """
+    business_profile = get_owned_business_profile(assistant_id, user, db)
+    namespace = f"business_{business_profile.id}"
+    
+    try:
+        snapshot_model = (await asyncio.to_thread(read_header, file.file)).model
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # Queries are embedded with the knowledge base's model, the snapshot must match it
+        check_snapshot_model(business_profile.knowledge_base, snapshot_model)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    file.file.seek(0)
+    
+    try:
+        job = await ingestion_queue.submit(
+            business_profile.id, namespace, file.filename or f"{namespace}.kbsnap", file.file,
+            kind="snapshot", max_bytes=SNAPSHOT_MAX_BYTES
+        )
+    except UploadTooLargeError:
+        raise HTTPException(status_code=413, detail=f"Snapshots can be at most {SNAPSHOT_MAX_BYTES // (1024 * 1024)} MB")
+    return ingest_job_response(assistant_id, job)
@@ -7,25 +7,23 @@ from app.models.user import User
 from app.schemas.message import MessageCreate, MessageResponse
 from app.dependencies import get_current_user, get_db
 from dotenv import load_dotenv
-from openai import OpenAI
-import os
 from datetime import datetime
 import time
 from app.models.business_profile import BusinessProfile
 from app.services.vector_store import search_similar_texts
+from app.services.embedding_models import embedding_model_for
+from app.services.embedding_service import EmbeddingService
+from app.services.faq_index import faq_index
 from app.services.analytics_service import AnalyticsService
+from app.services.clients import get_openai_client
 import logging
-from app.services.ai_service import get_business_temperature
+from app.services.ai_service import CHAT_SYSTEM_PROMPT, get_business_temperature
 from fastapi import Request
+from starlette.concurrency import run_in_threadpool
 
 
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-if not client.api_key:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
-
 router = APIRouter()
 analytics_service = AnalyticsService()
 
@@ -82,15 +80,26 @@ async def chat_with_ai(
     try:
         start_time = time.time()
         
-        # Step 3: Get and format chat history
-        formatted_messages = prepare_chat_context(assistant.id, message.content, db)
-        
-        # Step 4: Get AI response
-        # Get the business type from assistant profile if available
-        business_type = getattr(assistant, 'business_type', 'selling')
-        
-        # Get AI response with business-type specific temperature
-        ai_response = get_ai_response(formatted_messages, assistant.model, business_type)
+        # Frequent questions have a pre-generated answer
+        # The lookup may query the database, so keep it off the event loop
+        ai_response = await run_in_threadpool(faq_index.lookup, db, assistant.id, assistant.language, message.content)
+        
+        if ai_response is None:
+            # Step 3: Get and format chat history
+            # The query is embedded on the event loop, batched with concurrent chat turns;
+            # the rest of the pipeline makes blocking calls, so keep it off the event loop
+            query_embedding = await embed_chat_query(business_profile, message.content)
+            formatted_messages = await run_in_threadpool(
+                prepare_chat_context, assistant.id, message.content, db,
+                user_id=current_user.id, query_embedding=query_embedding, current_message_id=db_message.id
+            )
+            
+            # Step 4: Get AI response
+            # Get the business type from assistant profile if available
+            business_type = getattr(assistant, 'business_type', 'selling')
+            
+            # Get AI response with business-type specific temperature
+            ai_response = await run_in_threadpool(get_ai_response, formatted_messages, assistant.model, business_type)
         
         # Step 5: Save and return AI response
         response = save_and_format_response(db_message, ai_response, db)
@@ -141,8 +150,43 @@ def save_initial_message(user_query: str, assistant_id: int, user_id: int, db: S
     db.refresh(db_message)
     return db_message
 
-def prepare_chat_context(assistant_id: int, current_message: str, db: Session) -> list:
-    """Get chat history and format it for the AI model."""
+# Number of previous messages (user and assistant turns) included as context
+CONTEXT_HISTORY_MESSAGES = 10
+
+async def embed_chat_query(business_profile: Optional[BusinessProfile], query: str) -> Optional[List[float]]:
+    """
+    Embed the query of a chat turn for prepare_chat_context, batched with the queries of
+    concurrent chat turns. Returns None when there is no knowledge base to search, or when
+    embedding failed (prepare_chat_context then embeds the query itself).
+    """
+    if not business_profile or not business_profile.knowledge_base:
+        return None
+    try:
+        return await EmbeddingService.aget_query_embedding(query, embedding_model_for(business_profile.knowledge_base))
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Error embedding chat query: {str(e)}")
+        return None
+
+def prepare_chat_context(
+    assistant_id: int,
+    current_message: str,
+    db: Session,
+    history: Optional[List[dict]] = None,
+    user_id: Optional[int] = None,
+    query_embedding: Optional[List[float]] = None,
+    current_message_id: Optional[int] = None
+) -> list:
+    """
+    Get chat history and format it for the AI model.
+    
+    History is taken from `history` (e.g. an in-memory web chat session) when given.
+    Otherwise it is loaded from the database for this user's conversation with the
+    assistant only, so separate conversations never see each other's turns.
+    `query_embedding` is the embedding of `current_message` when the caller already
+    has it (see embed_chat_query); otherwise it is embedded here.
+    `current_message_id` is the stored row of the turn being answered, which is left
+    out of the history since `current_message` is added as the last message.
+    """
     try:
         logger = logging.getLogger(__name__)
         logger.info(f"Preparing chat context for assistant_id={assistant_id}")
@@ -156,7 +200,7 @@ def prepare_chat_context(assistant_id: int, current_message: str, db: Session) -
         # Initialize context with system message
         formatted_messages = [{
             "role": "system",
-            "content": "You are a helpful AI assistant for a business. Use the provided business knowledge to answer questions accurately."
+            "content": CHAT_SYSTEM_PROMPT
         }]
         
         # If we have a business profile with knowledge base, search for relevant information
@@ -173,7 +217,13 @@ def prepare_chat_context(assistant_id: int, current_message: str, db: Session) -
                 
                 # Search for relevant documents using the business-specific namespace
                 logger.info(f"Searching knowledge base for relevant documents with query: {current_message[:100]}...")
-                relevant_docs = search_similar_texts(current_message, namespace=namespace)
+                relevant_docs = search_similar_texts(
+                    current_message,
+                    namespace=namespace,
+                    similarity_threshold=business_profile.knowledge_base.get('similarity_threshold'),
+                    embedding_model=embedding_model_for(business_profile.knowledge_base),
+                    query_embedding=query_embedding
+                )
                 
                 if relevant_docs:
                     logger.info(f"Found {len(relevant_docs)} relevant documents in knowledge base")
@@ -199,19 +249,25 @@ def prepare_chat_context(assistant_id: int, current_message: str, db: Session) -
         else:
             logger.info(f"No business profile found for assistant_id={assistant_id}")
         
-        # Get recent chat history
-        chat_history = db.query(Message).filter(
-            Message.assistant_id == assistant_id
-        ).order_by(Message.timestamp.desc()).limit(5).all()
-        
-        logger.info(f"Retrieved {len(chat_history)} previous messages for chat context")
-        
-        # Add chat history
-        for msg in reversed(chat_history):
-            formatted_messages.extend([
-                {"role": "user", "content": msg.user_query},
-                {"role": "assistant", "content": msg.ai_response}
-            ])
+        # Add recent chat history
+        if history is not None:
+            formatted_messages.extend(history[-CONTEXT_HISTORY_MESSAGES:])
+            logger.info(f"Using {len(history[-CONTEXT_HISTORY_MESSAGES:])} session messages for chat context")
+        elif user_id is not None:
+            filters = [Message.assistant_id == assistant_id, Message.user_id == user_id]
+            if current_message_id is not None:
+                filters.append(Message.id != current_message_id)
+            chat_history = db.query(Message).filter(*filters).order_by(Message.timestamp.desc()).limit(CONTEXT_HISTORY_MESSAGES // 2).all()
+            
+            logger.info(f"Retrieved {len(chat_history)} previous messages for chat context")
+            
+            for msg in reversed(chat_history):
+                formatted_messages.extend([
+                    {"role": "user", "content": msg.user_query},
+                    {"role": "assistant", "content": msg.ai_response}
+                ])
+        else:
+            logger.info("No conversation given, preparing context without chat history")
         
         # Add current message
         formatted_messages.append({"role": "user", "content": current_message})
@@ -241,7 +297,7 @@ def get_ai_response(formatted_messages: list, model: str, business_type: str = "
         )
         logger.info(f"Request includes knowledge base information: {has_knowledge_base}")
         
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model=model,
             messages=formatted_messages,
             temperature=temperature,  # Use business-type specific temperature
@@ -375,7 +431,9 @@ async def update_message(
         db_message.user_query = message.content
         
         # Get new AI response for the updated message
-        formatted_messages = prepare_chat_context(db_message.assistant_id, message.content, db)
+        formatted_messages = prepare_chat_context(
+            db_message.assistant_id, message.content, db, user_id=db_message.user_id, current_message_id=db_message.id
+        )
         assistant = db.query(AIAssistant).filter(AIAssistant.id == db_message.assistant_id).first()
         ai_response = get_ai_response(formatted_messages, assistant.model)
         db_message.ai_response = ai_response
@@ -0,0 +1,35 @@
+from typing import Optional
+from fastapi import APIRouter, Depends
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from app.middleware.admin_middleware import verify_admin
+from app.services.chunk_store import chunk_store
+from app.services.clients import readiness
+from app.services.embedding_cache import query_embedding_cache
+from app.services.faq_index import faq_index
+from app.services.query_embedding_batcher import query_embedding_batcher
+from app.services.vector_store import get_index_stats, get_ingest_stats
+
+router = APIRouter()
+
+@router.get("/metrics", dependencies=[Depends(verify_admin)])
+async def get_metrics():
+    """Runtime metrics of in-process caches and ingest counters per namespace (admin only)"""
+    return {
+        "embedding_cache": query_embedding_cache.stats(),
+        "query_batching": query_embedding_batcher.stats(),
+        "chunk_cache": chunk_store.stats(),
+        "faq": faq_index.stats(),
+        "ingest": get_ingest_stats()
+    }
+
+@router.get("/index-stats", dependencies=[Depends(verify_admin)])
+async def index_stats(namespace: Optional[str] = None):
+    """Vector counts per namespace reported by the vector store, a network call for remote backends (admin only)"""
+    return await run_in_threadpool(get_index_stats, namespace)
+
+@router.get("/ready")
+async def get_readiness():
+    """Whether background initialization has finished; 503 until it has"""
+    report = readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
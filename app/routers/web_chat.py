@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy.orm import Session
 from typing import Dict, List, Optional
 import uuid
 import json
+import os
 from datetime import datetime
 import time
 
@@ -11,8 +12,13 @@ from app.models.business_profile import BusinessProfile
 from app.models.assistant import AIAssistant
 from app.models.user import User
 from app.schemas.message import MessageCreate, MessageResponse
-from app.routers.messages import prepare_chat_context, get_ai_response
+from app.routers.messages import prepare_chat_context, embed_chat_query, get_ai_response, CONTEXT_HISTORY_MESSAGES
 from app.services.analytics_service import AnalyticsService
+from app.services.chat_session_store import ChatSession
+from app.services.faq_index import faq_index
+from app.middleware.rate_limiter import web_chat_rate_limiter
+from app.services.session_turns import SessionTurnQueue, SessionQueueFullError, TurnSupersededError
+from starlette.concurrency import run_in_threadpool
 import logging
 
 # Set up logging
@@ -22,13 +28,22 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # Store chat sessions in memory (in production, this would be in a database)
-# Key: unique_id + client_id, Value: chat session data
-chat_sessions = {}
+# Key: unique_id + client_id, Value: ChatSession
+chat_sessions: Dict[str, ChatSession] = {}
 
 # Initialize analytics service
 analytics_service = AnalyticsService()
 
-@router.post("/start-chat/{business_unique_id}")
+# These endpoints are public, so limit how fast a single client, IP or business can call them
+chat_rate_limit = Depends(web_chat_rate_limiter.dependency("chat"))
+session_rate_limit = Depends(web_chat_rate_limiter.dependency("session"))
+
+# Serializes turns within a chat session so each turn sees the previous answer
+session_turns = SessionTurnQueue(max_queue_depth=int(os.getenv("WEB_CHAT_MAX_QUEUED_TURNS", "3")))
+# Drop a queued message when the client sends a newer one before it started
+SUPERSEDE_QUEUED_TURNS = os.getenv("WEB_CHAT_SUPERSEDE_TURNS", "false").lower() == "true"
+
+@router.post("/start-chat/{business_unique_id}", dependencies=[session_rate_limit])
 async def start_chat_session(
     business_unique_id: str,
     client_id: Optional[str] = None,
@@ -62,12 +77,10 @@ async def start_chat_session(
     session_key = f"{business_unique_id}_{client_id}"
     
     # Store session information
-    chat_sessions[session_key] = {
-        "business_profile_id": business_profile.id,
-        "assistant_id": assistant.id,
-        "created_at": datetime.utcnow(),
-        "messages": []
-    }
+    chat_sessions[session_key] = ChatSession(
+        business_profile_id=business_profile.id,
+        assistant_id=assistant.id
+    )
     
     # Return session information
     return {
@@ -77,7 +90,7 @@ async def start_chat_session(
         "session_key": session_key
     }
 
-@router.post("/chat/{business_unique_id}")
+@router.post("/chat/{business_unique_id}", dependencies=[chat_rate_limit])
 async def chat_with_business_assistant(
     business_unique_id: str,
     message: MessageCreate,
@@ -123,12 +136,10 @@ async def chat_with_business_assistant(
             raise HTTPException(status_code=404, detail="AI assistant not found")
             
         # Create new session
-        chat_sessions[session_key] = {
-            "business_profile_id": business_profile.id,
-            "assistant_id": assistant.id,
-            "created_at": datetime.utcnow(),
-            "messages": []
-        }
+        chat_sessions[session_key] = ChatSession(
+            business_profile_id=business_profile.id,
+            assistant_id=assistant.id
+        )
         
         logger.info(f"New web chat session created for business_id={business_profile.id}, assistant_id={assistant.id}")
         
@@ -151,11 +162,11 @@ async def chat_with_business_assistant(
     
     # Get business profile and assistant
     business_profile = db.query(BusinessProfile).filter(
-        BusinessProfile.id == session["business_profile_id"]
+        BusinessProfile.id == session.business_profile_id
     ).first()
     
     assistant = db.query(AIAssistant).filter(
-        AIAssistant.id == session["assistant_id"]
+        AIAssistant.id == session.assistant_id
     ).first()
     
     if not business_profile or not assistant:
@@ -170,94 +181,40 @@ async def chat_with_business_assistant(
     else:
         logger.warning(f"Business profile {business_profile.id} has no knowledge base configured")
     
-    # Store user message in session
-    session["messages"].append({
-        "role": "user",
-        "content": message.content,
-        "timestamp": datetime.utcnow().isoformat()
-    })
+    # Turns of the same session run one after another, different sessions run in parallel
+    ai_response = await run_session_turn(
+        session_key,
+        lambda: process_chat_turn(session, business_profile, assistant, client_id, message.content, db)
+    )
     
-    try:
-        start_time = time.time()
-        
-        # Prepare chat context with business profile knowledge
-        logger.info(f"Preparing chat context for web chat with assistant_id={assistant.id}")
-        formatted_messages = prepare_chat_context(assistant.id, message.content, db)
-        
-        # Get AI response
-        logger.info(f"Getting AI response for web chat with model={assistant.model}")
-        ai_response = get_ai_response(formatted_messages, assistant.model)
-        
-        # Calculate response time
-        response_time = time.time() - start_time
-        logger.info(f"Response generated in {response_time:.2f} seconds")
-        
-        # Store AI response in session
-        session["messages"].append({
-            "role": "assistant",
-            "content": ai_response,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-        
-        # Update analytics
-        message_count = len(session["messages"])
-        logger.info(f"Web chat session now has {message_count} messages")
-        
-        await analytics_service.record_analytics_direct(
-            db=db,
-            assistant_id=assistant.id,
-            business_profile_id=business_profile.id,
-            client_session_id=client_id,
-            message_count=message_count,
-            response_time=response_time
-        )
-        
-        # Log a preview of the response
-        response_preview = ai_response[:200] + "..." if len(ai_response) > 200 else ai_response
-        logger.info(f"Web chat response: {response_preview}")
-        
-        # Return the response
-        return {
-            "content": ai_response,
-            "role": "assistant",
-            "client_id": client_id,
-            "business_unique_id": business_unique_id,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-    except Exception as e:
-        logger.error(f"Error processing web chat: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
+    # Log a preview of the response
+    response_preview = ai_response[:200] + "..." if len(ai_response) > 200 else ai_response
+    logger.info(f"Web chat response: {response_preview}")
+    
+    # Return the response
+    return {
+        "content": ai_response,
+        "role": "assistant",
+        "client_id": client_id,
+        "business_unique_id": business_unique_id,
+        "timestamp": datetime.utcnow().isoformat()
+    }
 
-@router.get("/history/{business_unique_id}")
+@router.get("/history/{business_unique_id}", dependencies=[session_rate_limit])
 async def get_chat_history(
     business_unique_id: str,
-    client_id: str
+    client_id: str,
+    since: Optional[int] = Query(None, ge=0, description="Cursor from a previous response; only newer messages are returned"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Maximum number of messages to return")
 ):
     """
     Get the chat history for a business-client session.
     This endpoint is used by the web chat interface to load previous messages.
+    Pass the returned next_cursor as `since` when polling to receive only new messages.
     """
-    # Create session key
-    session_key = f"{business_unique_id}_{client_id}"
-    
-    # Verify session exists
-    if session_key not in chat_sessions:
-        # Return empty history if no session exists yet
-        return {
-            "business_unique_id": business_unique_id,
-            "client_id": client_id,
-            "messages": []
-        }
-    
-    # Return chat history
-    return {
-        "business_unique_id": business_unique_id,
-        "client_id": client_id,
-        "messages": chat_sessions[session_key]["messages"]
-    }
+    return build_history_response(business_unique_id, client_id, since, limit)
 
-@router.get("/simplified/{business_unique_id}")
+@router.get("/simplified/{business_unique_id}", dependencies=[session_rate_limit])
 async def get_simplified_chat_page(
     business_unique_id: str,
     db: Session = Depends(get_db)
@@ -289,12 +246,10 @@ async def get_simplified_chat_page(
     session_key = f"{business_unique_id}_{client_id}"
     
     # Store session information
-    chat_sessions[session_key] = {
-        "business_profile_id": business_profile.id,
-        "assistant_id": assistant.id,
-        "created_at": datetime.utcnow(),
-        "messages": []
-    }
+    chat_sessions[session_key] = ChatSession(
+        business_profile_id=business_profile.id,
+        assistant_id=assistant.id
+    )
     
     # Return everything the frontend needs to start a chat
     return {
@@ -306,7 +261,7 @@ async def get_simplified_chat_page(
         "welcome_message": f"Welcome to {business_profile.business_name}! How can I assist you today?"
     }
 
-@router.post("/simplified-chat/{business_unique_id}")
+@router.post("/simplified-chat/{business_unique_id}", dependencies=[chat_rate_limit])
 async def simplified_chat_with_business_assistant(
     business_unique_id: str,
     request: Request,
@@ -353,12 +308,10 @@ async def simplified_chat_with_business_assistant(
             raise HTTPException(status_code=404, detail="AI assistant not found")
             
         # Create new session
-        chat_sessions[session_key] = {
-            "business_profile_id": business_profile.id,
-            "assistant_id": assistant.id,
-            "created_at": datetime.utcnow(),
-            "messages": []
-        }
+        chat_sessions[session_key] = ChatSession(
+            business_profile_id=business_profile.id,
+            assistant_id=assistant.id
+        )
         
         logger.info(f"New web chat session created for business_id={business_profile.id}, assistant_id={assistant.id}")
         
@@ -379,48 +332,104 @@ async def simplified_chat_with_business_assistant(
     
     # Get business profile and assistant
     business_profile = db.query(BusinessProfile).filter(
-        BusinessProfile.id == session["business_profile_id"]
+        BusinessProfile.id == session.business_profile_id
     ).first()
     
     assistant = db.query(AIAssistant).filter(
-        AIAssistant.id == session["assistant_id"]
+        AIAssistant.id == session.assistant_id
     ).first()
     
     if not business_profile or not assistant:
         logger.warning(f"Business profile or assistant not found for session: {session_key}")
         raise HTTPException(status_code=404, detail="Business profile or assistant not found")
     
-    # Store user message in session
-    session["messages"].append({
-        "role": "user",
-        "content": message.content,
+    # Turns of the same session run one after another, different sessions run in parallel
+    ai_response = await run_session_turn(
+        session_key,
+        lambda: process_chat_turn(session, business_profile, assistant, client_id, message.content, db)
+    )
+    
+    # Return the response with everything needed for the frontend
+    return {
+        "content": ai_response,
+        "role": "assistant",
+        "client_id": client_id,
+        "business_unique_id": business_unique_id,
+        "business_name": business_profile.business_name,
         "timestamp": datetime.utcnow().isoformat()
-    })
+    }
+
+@router.get("/simplified-history/{business_unique_id}", dependencies=[session_rate_limit])
+async def get_simplified_chat_history(
+    business_unique_id: str,
+    client_id: str,
+    since: Optional[int] = Query(None, ge=0, description="Cursor from a previous response; only newer messages are returned"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Maximum number of messages to return")
+):
+    """
+    Simplified endpoint to get chat history using just business_unique_id and client_id.
+    This is designed to work with the simplified chat flow.
+    """
+    return build_history_response(business_unique_id, client_id, since, limit)
+
+async def run_session_turn(session_key: str, turn) -> str:
+    """Run a chat turn through the session's turn queue, mapping queue errors to HTTP errors."""
+    try:
+        return await session_turns.run(session_key, turn, supersede=SUPERSEDE_QUEUED_TURNS)
+    except SessionQueueFullError:
+        raise HTTPException(
+            status_code=429,
+            detail="Previous messages are still being processed. Please wait for a response.",
+            headers={"Retry-After": "1"}
+        )
+    except TurnSupersededError:
+        raise HTTPException(status_code=409, detail="Message was superseded by a newer message")
+
+async def process_chat_turn(
+    session: ChatSession,
+    business_profile: BusinessProfile,
+    assistant: AIAssistant,
+    client_id: str,
+    content: str,
+    db: Session
+) -> str:
+    """Run a single chat turn for a web chat session and return the AI response."""
+    # Take the conversation so far from the session before adding the new message
+    history = session.recent_messages(CONTEXT_HISTORY_MESSAGES)
+    
+    # Store user message in session
+    session.add_message("user", content)
     
     try:
         start_time = time.time()
         
-        # Prepare chat context with business profile knowledge
-        logger.info(f"Preparing chat context for web chat with assistant_id={assistant.id}")
-        formatted_messages = prepare_chat_context(assistant.id, message.content, db)
-        
-        # Get AI response
-        logger.info(f"Getting AI response for web chat with model={assistant.model}")
-        ai_response = get_ai_response(formatted_messages, assistant.model)
+        # Frequent questions have a pre-generated answer
+        # The lookup may query the database, so keep it off the event loop
+        ai_response = await run_in_threadpool(faq_index.lookup, db, assistant.id, assistant.language, content)
+        
+        if ai_response is None:
+            # Prepare chat context with business profile knowledge
+            # The query is embedded on the event loop, batched with concurrent chat turns;
+            # the rest of the pipeline makes blocking calls, so keep it off the event loop
+            logger.info(f"Preparing chat context for web chat with assistant_id={assistant.id}")
+            query_embedding = await embed_chat_query(business_profile, content)
+            formatted_messages = await run_in_threadpool(
+                prepare_chat_context, assistant.id, content, db, history=history, query_embedding=query_embedding
+            )
+            
+            # Get AI response
+            logger.info(f"Getting AI response for web chat with model={assistant.model}")
+            ai_response = await run_in_threadpool(get_ai_response, formatted_messages, assistant.model)
         
         # Calculate response time
         response_time = time.time() - start_time
         logger.info(f"Response generated in {response_time:.2f} seconds")
         
         # Store AI response in session
-        session["messages"].append({
-            "role": "assistant",
-            "content": ai_response,
-            "timestamp": datetime.utcnow().isoformat()
-        })
+        session.add_message("assistant", ai_response)
         
         # Update analytics
-        message_count = len(session["messages"])
+        message_count = len(session)
         logger.info(f"Web chat session now has {message_count} messages")
         
         await analytics_service.record_analytics_direct(
@@ -432,46 +441,41 @@ async def simplified_chat_with_business_assistant(
             response_time=response_time
         )
         
-        # Return the response with everything needed for the frontend
-        return {
-            "content": ai_response,
-            "role": "assistant",
-            "client_id": client_id,
-            "business_unique_id": business_unique_id,
-            "business_name": business_profile.business_name,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        return ai_response
         
     except Exception as e:
         logger.error(f"Error processing web chat: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
-@router.get("/simplified-history/{business_unique_id}")
-async def get_simplified_chat_history(
+def build_history_response(
     business_unique_id: str,
-    client_id: str
-):
-    """
-    Simplified endpoint to get chat history using just business_unique_id and client_id.
-    This is designed to work with the simplified chat flow.
-    """
+    client_id: str,
+    since: Optional[int] = None,
+    limit: Optional[int] = None
+) -> Dict:
+    """Build a history page for a session, starting after the `since` cursor if given."""
     # Create session key
     session_key = f"{business_unique_id}_{client_id}"
+    session = chat_sessions.get(session_key)
     
-    # Verify session exists
-    if session_key not in chat_sessions:
-        # Return empty history if no session exists yet
+    # Return empty history if no session exists yet
+    if session is None:
         return {
             "business_unique_id": business_unique_id,
             "client_id": client_id,
-            "messages": []
+            "messages": [],
+            "next_cursor": since or 0,
+            "has_more": False
         }
     
-    # Return chat history
+    messages, next_cursor = session.history(since=since, limit=limit)
+    
     return {
         "business_unique_id": business_unique_id,
         "client_id": client_id,
-        "messages": chat_sessions[session_key]["messages"]
+        "messages": messages,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor < len(session)
     }
 
 
@@ -0,0 +1,18 @@
+from typing import Optional
+from pydantic import BaseModel
+from datetime import datetime
+
+class KnowledgeDocumentResponse(BaseModel):
+    id: int
+    document_id: str
+    filename: str
+    file_hash: str
+    size_bytes: int
+    chunk_count: int
+    status: str
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
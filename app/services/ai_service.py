@@ -1,15 +1,18 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_core.documents import Document
-from langchain_community.vectorstores import Chroma
+from langchain_openai import ChatOpenAI
 from app.models.message import Message
 import os
 from dotenv import load_dotenv
 import json
+import asyncio
 from fastapi import APIRouter
 from typing import Dict, List
 from datetime import datetime
 import logging
-from app.services.vector_store import search_similar_texts
+from app.services.vector_store import add_to_knowledge_base, search_similar_texts
+from app.services.embedding_service import EmbeddingService
+from app.services.vector_backends import get_vector_store
+from app.services.embedding_models import DEFAULT_EMBEDDING_MODEL, EmbeddingModel, embedding_model_for
+from app.services.clients import get_chat_model
 from app.models.business_profile import BusinessProfile
 from sqlalchemy.orm import Session
 
@@ -18,6 +21,9 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# System prompt of knowledge-grounded chat answers, shared by the chat endpoints and the FAQ index
+CHAT_SYSTEM_PROMPT = "You are a helpful AI assistant for a business. Use the provided business knowledge to answer questions accurately."
+
 # Add this function to determine temperature based on business type
 def get_business_temperature(business_type: str) -> float:
     """
@@ -135,10 +141,15 @@ class PromptEngine:
         return prompt
 
 class ResponseGenerator:
-    def __init__(self, model: ChatOpenAI, api_key: str = None):
-        self.model = model
+    def __init__(self, model: ChatOpenAI = None, api_key: str = None):
+        self._model = model
         # Store API key directly or get from environment if not provided
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+
+    @property
+    def model(self) -> ChatOpenAI:
+        # The shared chat model is created on first use, not at import
+        return self._model or get_chat_model()
     
     async def generate_response(self, prompt: str, temperature: float = None) -> str:
         """Generate response with optional temperature override."""
@@ -219,21 +230,22 @@ class ResponseOptimizer:
 class AIService:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
-        self.model = ChatOpenAI(api_key=self.api_key, temperature=0.7)
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
         self.vector_store = None
         self.conversations = {}  # Store by assistant_id
         self.context_manager = ContextManager()
         self.prompt_engine = PromptEngine()
         # Pass API key to ResponseGenerator
-        self.response_generator = ResponseGenerator(self.model, self.api_key)
+        self.response_generator = ResponseGenerator(api_key=self.api_key)
         self.response_optimizer = ResponseOptimizer()
 
-    def initialize_knowledge_base(self, documents):
-        """Initialize vector store with documents"""
-        doc_objects = [Document(page_content=doc, metadata={}) for doc in documents]
-        self.vector_store = Chroma(embedding_function=self.embeddings)
-        self.vector_store.add_documents(documents=doc_objects)
+    @property
+    def model(self) -> ChatOpenAI:
+        return self.response_generator.model
+
+    def initialize_knowledge_base(self, documents, namespace: str = None, embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL):
+        """Add documents to the knowledge base of a namespace in its configured vector store"""
+        self.vector_store = get_vector_store(namespace, embedding_model.dimensions)
+        add_to_knowledge_base(documents, namespace=namespace, embedding_model=embedding_model)
 
     async def get_response(self, query, config, assistant_id, user_id, db=None):
         logger.info(f"[AI_SERVICE] Generating response for query: {query[:100]}...")
@@ -269,7 +281,17 @@ class AIService:
                         
                         # Search for relevant documents
                         logger.info(f"[AI_SERVICE] Searching for relevant knowledge with query: {query[:100]}...")
-                        relevant_docs = search_similar_texts(query, namespace=namespace)
+                        embedding_model = embedding_model_for(business_profile.knowledge_base)
+                        # Embedded together with concurrent chat turns, then searched off the event loop
+                        query_embedding = await EmbeddingService.aget_query_embedding(query, embedding_model)
+                        relevant_docs = await asyncio.to_thread(
+                            search_similar_texts,
+                            query,
+                            namespace=namespace,
+                            similarity_threshold=business_profile.knowledge_base.get('similarity_threshold'),
+                            embedding_model=embedding_model,
+                            query_embedding=query_embedding
+                        )
                         
                         if relevant_docs:
                             logger.info(f"[AI_SERVICE] Found {len(relevant_docs)} relevant documents")
@@ -0,0 +1,344 @@
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from collections import Counter
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import fcntl
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import uuid
+import logging
+from .vector_backends import Match
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Words plus compounds joined by . - / @ + so "SKU-1042", "19.99" and "info@shop.com" stay whole
+_TOKEN = re.compile(r"\w+(?:[.\-/@+]\w+)*")
+_PART = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms of `text`; compounds are indexed whole and by their parts"""
+    terms = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        terms.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Namespace:
+    """Inverted index of the chunks of one namespace"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.metadata: Dict[str, Dict] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def add(self, chunk_id: str, text: str, metadata: Dict):
+        self.add_terms(chunk_id, dict(Counter(tokenize(text))), metadata)
+
+    def add_terms(self, chunk_id: str, terms: Dict[str, int], metadata: Dict):
+        """Index a chunk by its term frequencies"""
+        self.remove([chunk_id])
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = frequency
+        self.doc_terms[chunk_id] = terms
+        self.metadata[chunk_id] = metadata
+        self.doc_lengths[chunk_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[chunk_id]
+
+    def remove(self, chunk_ids: Iterable[str]) -> int:
+        removed = 0
+        for chunk_id in chunk_ids:
+            terms = self.doc_terms.pop(chunk_id, None)
+            if terms is None:
+                continue
+            for term in terms:
+                posting = self.postings[term]
+                del posting[chunk_id]
+                if not posting:
+                    del self.postings[term]
+            del self.metadata[chunk_id]
+            self.total_length -= self.doc_lengths.pop(chunk_id)
+            removed += 1
+        return removed
+
+    def apply(self, change: Dict):
+        """Apply a logged change: {"add": {chunk_id: {"terms", "metadata"}}} and/or {"remove": [chunk_id, ...]}"""
+        for chunk_id, entry in change.get("add", {}).items():
+            self.add_terms(chunk_id, entry["terms"], entry["metadata"])
+        self.remove(change.get("remove", []))
+
+    def entries(self) -> Dict:
+        """Every chunk as one "add" change, the compacted form of the namespace's log"""
+        return {"add": {chunk_id: {"terms": terms, "metadata": self.metadata[chunk_id]} for chunk_id, terms in self.doc_terms.items()}}
+
+    def copy(self) -> "BM25Namespace":
+        """A copy to serialize outside the lock; entries are replaced on update, never changed in place"""
+        ns = BM25Namespace(self.k1, self.b)
+        ns.doc_terms = dict(self.doc_terms)
+        ns.metadata = dict(self.metadata)
+        return ns
+
+    def search(self, query: str, top_k: int) -> List[Match]:
+        if not self.doc_terms or top_k <= 0:
+            return []
+
+        count = len(self.doc_terms)
+        average_length = self.total_length / count or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, frequency in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [Match(chunk_id, score, self.metadata[chunk_id]) for chunk_id, score in best]
+
+
+class LogPosition(NamedTuple):
+    """How much of a namespace's log has been applied"""
+    generation: str
+    # Bytes of the log applied
+    offset: int
+    # End of the compacted entries, the changes appended since follow them
+    base_end: int
+
+
+class BM25Index:
+    """
+    Lexical index of knowledge base chunks, one BM25Namespace per namespace.
+
+    Built at ingest time next to the vectors and kept in sync incrementally. Each
+    namespace is persisted in `data_dir` as an append-only log of JSON lines: a header
+    naming the log's generation, the compacted entries, then one line per change. A
+    write appends its change holding a lock file, so writers in different processes
+    never lose each other's postings, and workers apply the lines other workers
+    appended since they last read the log. Once the changes outgrow the compacted
+    entries, the log is rewritten as a new generation.
+
+    Logs are read and parsed outside the lock searches take, which is only held while
+    the parsed changes are applied or a reloaded namespace is swapped in.
+    """
+
+    # Changes appended before the log is compacted: at least this many bytes, or as many as the compacted entries
+    COMPACT_MIN_BYTES = 1024 * 1024
+
+    def __init__(self, data_dir: Optional[str] = None):
+        self.data_dir = data_dir
+        self._namespaces: Dict[str, BM25Namespace] = {}
+        self._positions: Dict[str, LogPosition] = {}
+        # Size and modification time of each log when it was last read
+        self._stamps: Dict[str, Tuple[int, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, namespace: str, suffix: str = ".jsonl") -> str:
+        return os.path.join(self.data_dir, f"{namespace or '__default__'}{suffix}")
+
+    def _stamp(self, namespace: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self._path(namespace))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _get_namespace(self, namespace: str) -> BM25Namespace:
+        """In-memory index of a namespace, with the changes other workers logged applied"""
+        if self.data_dir:
+            stamp = self._stamp(namespace)
+            if stamp is not None and stamp != self._stamps.get(namespace):
+                self._catch_up(namespace, stamp)
+            elif stamp is None and namespace not in self._namespaces:
+                self._load_legacy(namespace)
+        with self._lock:
+            return self._namespaces.setdefault(namespace, BM25Namespace())
+
+    def _catch_up(self, namespace: str, stamp: Tuple[int, int, int]):
+        """Read the log past the applied position, then apply it under the lock"""
+        with self._lock:
+            position = self._positions.get(namespace)
+        read = self._read_log(namespace, position)
+        if read is None:
+            return
+        loaded, changes, read_position = read
+        with self._lock:
+            if self._positions.get(namespace) != position:
+                # Another thread applied the log meanwhile
+                return
+            if loaded is not None:
+                self._namespaces[namespace] = loaded
+            else:
+                ns = self._namespaces.setdefault(namespace, BM25Namespace())
+                for change in changes:
+                    ns.apply(change)
+            self._positions[namespace] = read_position
+            self._stamps[namespace] = stamp
+
+    def _read_log(self, namespace: str, position: Optional[LogPosition]) -> Optional[Tuple[Optional[BM25Namespace], List[Dict], LogPosition]]:
+        """
+        Changes logged after `position`; when the log has another generation, it is loaded
+        whole into a new namespace instead, with no changes left to apply
+
+        Returns:
+            (loaded namespace or None, changes, position after them), None without a log
+        """
+        path = self._path(namespace)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            # A compaction replaces the file, this one file is read to the end either way
+            generation = json.loads(f.readline())["generation"]
+            loaded = None
+            if position is not None and position.generation == generation:
+                offset, base_end = position.offset, position.base_end
+                f.seek(offset)
+            else:
+                loaded = BM25Namespace()
+                loaded.apply(json.loads(f.readline()))
+                offset = base_end = f.tell()
+            data = f.read()
+        # A line still being appended is read next time
+        data = data[:data.rfind(b"\n") + 1]
+        changes = [json.loads(line) for line in data.splitlines()]
+        if loaded is not None:
+            for change in changes:
+                loaded.apply(change)
+            changes = []
+            logger.info(f"Loaded lexical index {path} with {len(loaded)} chunks")
+        return loaded, changes, LogPosition(generation, offset + len(data), base_end)
+
+    def _load_legacy(self, namespace: str):
+        """Namespaces saved as one JSON file before logs were introduced, logged on the next write"""
+        path = self._path(namespace, ".json")
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        ns = BM25Namespace()
+        ns.apply({"add": data})
+        with self._lock:
+            self._namespaces.setdefault(namespace, ns)
+        logger.info(f"Loaded lexical index {path} with {len(ns)} chunks")
+
+    @contextmanager
+    def _write_lock(self, namespace: str) -> Iterator[None]:
+        """Serialize writers of a namespace across processes"""
+        if not self.data_dir:
+            yield
+            return
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(self._path(namespace, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, namespace: str, change: Dict) -> LogPosition:
+        """Log a change, called holding the write lock after catching up with the log; returns the position after it"""
+        with self._lock:
+            position = self._positions.get(namespace)
+        if position is None:
+            position = self._compact(namespace)
+        with open(self._path(namespace), "ab") as f:
+            f.write(json.dumps(change).encode("utf-8") + b"\n")
+            return position._replace(offset=f.tell())
+
+    def _compact(self, namespace: str) -> LogPosition:
+        """Rewrite the log as a new generation holding the namespace's current entries"""
+        with self._lock:
+            ns = self._namespaces.setdefault(namespace, BM25Namespace()).copy()
+        generation = uuid.uuid4().hex
+        path = self._path(namespace)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps({"generation": generation}).encode("utf-8") + b"\n")
+            f.write(json.dumps(ns.entries()).encode("utf-8") + b"\n")
+            offset = f.tell()
+        os.replace(tmp_path, path)
+        legacy_path = self._path(namespace, ".json")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+        position = LogPosition(generation, offset, offset)
+        with self._lock:
+            self._positions[namespace] = position
+        return position
+
+    def _write(self, namespace: str, change: Dict):
+        """Apply a change in memory, logged first when the index is persisted"""
+        position = self._append(namespace, change) if self.data_dir else None
+        with self._lock:
+            self._namespaces.setdefault(namespace, BM25Namespace()).apply(change)
+            if position is not None:
+                self._positions[namespace] = position
+        if position is not None and position.offset - position.base_end > max(position.base_end, self.COMPACT_MIN_BYTES):
+            self._compact(namespace)
+
+    def add(self, entries: List[Tuple[str, str, Dict]], namespace: str = None):
+        """Index or re-index chunks given as (chunk_id, text, metadata) tuples"""
+        if not entries:
+            return
+        # Tokenized before taking any lock
+        change = {"add": {chunk_id: {"terms": dict(Counter(tokenize(text))), "metadata": metadata} for chunk_id, text, metadata in entries}}
+        with self._write_lock(namespace):
+            self._get_namespace(namespace)
+            self._write(namespace, change)
+
+    def delete(self, chunk_ids: List[str], namespace: str = None) -> int:
+        with self._write_lock(namespace):
+            ns = self._get_namespace(namespace)
+            with self._lock:
+                removed = [chunk_id for chunk_id in dict.fromkeys(chunk_ids) if chunk_id in ns.doc_terms]
+            if removed:
+                self._write(namespace, {"remove": removed})
+            return len(removed)
+
+    def search(self, query: str, top_k: int = 5, namespace: str = None) -> List[Match]:
+        """Top-k chunks by BM25 score"""
+        ns = self._get_namespace(namespace)
+        with self._lock:
+            return ns.search(query, top_k)
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Match]], top_k: int, k: int = 60) -> List[Match]:
+    """
+    Merge ranked result lists: each result scores 1 / (k + rank) per list it appears in.
+    Only ranks matter, so BM25 and cosine scores never have to be made comparable.
+    Metadata and values are taken from the first list a result appears in.
+    """
+    scores: Dict[str, float] = {}
+    matches: Dict[str, Match] = {}
+    for results in result_lists:
+        for rank, match in enumerate(results, start=1):
+            scores[match.id] = scores.get(match.id, 0.0) + 1.0 / (k + rank)
+            matches.setdefault(match.id, match)
+
+    best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+    return [Match(match_id, score, matches[match_id].metadata, matches[match_id].values) for match_id, score in best]
+
+
+bm25_index = BM25Index(os.getenv("BM25_INDEX_DIR", "data/bm25"))
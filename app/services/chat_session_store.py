@@ -0,0 +1,96 @@
+from typing import Dict, List, Optional, Tuple
+from array import array
+from datetime import datetime, timezone
+import time
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Roles are stored as small integer codes instead of repeating the strings per message
+ROLES = ("user", "assistant", "system")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+
+def _now_ms() -> int:
+    """Current UTC time as epoch milliseconds"""
+    return time.time_ns() // 1_000_000
+
+
+def _format_timestamp(timestamp_ms: int) -> str:
+    """Format epoch milliseconds the same way datetime.utcnow().isoformat() does"""
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class ChatSession:
+    """
+    In-memory state for a single web chat conversation (one business + one client).
+
+    Messages are kept column-wise: a byte array of role codes, an array of epoch
+    millisecond timestamps and a list of contents. Dicts and ISO timestamps are only
+    built for the messages actually returned to a client.
+
+    Messages are only ever appended, so a message's position in the session is a
+    stable cursor that the widget can send back to fetch just the new messages.
+    """
+    __slots__ = ("business_profile_id", "assistant_id", "created_at", "_roles", "_timestamps", "_contents")
+
+    def __init__(self, business_profile_id: int, assistant_id: int):
+        self.business_profile_id = business_profile_id
+        self.assistant_id = assistant_id
+        self.created_at = datetime.utcnow()
+        self._roles = array("b")
+        self._timestamps = array("q")
+        self._contents: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._contents)
+
+    def add_message(self, role: str, content: str) -> None:
+        """Append a message to the session"""
+        self._roles.append(ROLE_CODES[role])
+        self._timestamps.append(_now_ms())
+        self._contents.append(content)
+
+    def _serialize(self, start: int, end: int) -> List[Dict]:
+        """Build response dicts for the messages in [start, end)"""
+        return [
+            {
+                "role": ROLES[self._roles[i]],
+                "content": self._contents[i],
+                "timestamp": _format_timestamp(self._timestamps[i])
+            }
+            for i in range(start, end)
+        ]
+
+    def recent_messages(self, limit: int) -> List[Dict]:
+        """Get the last `limit` messages as role/content pairs, ready to use as model context"""
+        start = max(len(self) - limit, 0)
+        return [
+            {"role": ROLES[self._roles[i]], "content": self._contents[i]}
+            for i in range(start, len(self))
+        ]
+
+    def history(self, since: Optional[int] = None, limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """
+        Get a page of messages from the session
+
+        Args:
+            since: Cursor returned by a previous call; only messages after it are returned
+            limit: Maximum number of messages to return. Without a cursor this is the
+                most recent page, with a cursor it is the next page after the cursor
+
+        Returns:
+            Tuple of (messages, next_cursor)
+        """
+        total = len(self)
+
+        if since is None:
+            start = max(total - limit, 0) if limit else 0
+            end = total
+        else:
+            start = min(max(since, 0), total)
+            end = min(start + limit, total) if limit else total
+
+        # Only the requested range is serialized, the full history is never copied
+        return self._serialize(start, end), end
@@ -0,0 +1,175 @@
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from collections import OrderedDict
+from dotenv import load_dotenv
+import os
+import threading
+import logging
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models.knowledge import ChunkText
+from .vector_backends import Match
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Size of the in-process LRU of recently retrieved chunk texts
+CHUNK_CACHE_MAX_MB = int(os.getenv("CHUNK_CACHE_MAX_MB", "32"))
+# Vector IDs per IN (...) clause, stays below SQLite's bound parameter limit
+QUERY_BATCH_SIZE = 500
+
+# A chunk to store: (vector ID, text, metadata)
+ChunkEntry = Tuple[str, str, Dict]
+
+
+class ChunkStore:
+    """
+    Chunk texts in the application database, keyed by namespace and vector ID
+
+    Vector metadata only holds a chunk's document ID, which keeps query responses
+    small and clear of per-vector metadata size limits. After retrieval the texts of
+    all matches are fetched in one query, with hot chunks served from an LRU.
+    Vector IDs are content hashes, so a cached text never goes stale: a chunk with a
+    changed text gets a new ID.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, max_bytes: int = 32 * 1024 * 1024):
+        self.session_factory = session_factory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: Tuple[str, str], entry: Dict):
+        size = len(entry["text"].encode("utf-8"))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes_used -= previous["size"]
+            self._entries[key] = {**entry, "size": size}
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes_used -= evicted["size"]
+
+    def _forget(self, keys: Iterable[Tuple[str, str]]):
+        with self._lock:
+            for key in keys:
+                evicted = self._entries.pop(key, None)
+                if evicted is not None:
+                    self.bytes_used -= evicted["size"]
+
+    def put(self, chunks: Sequence[ChunkEntry], namespace: str = None):
+        """Store or replace the texts of `chunks`"""
+        namespace = namespace or ""
+        if not chunks:
+            return
+        ids = [chunk_id for chunk_id, _, _ in chunks]
+        with self.session_factory() as db:
+            for start in range(0, len(ids), QUERY_BATCH_SIZE):
+                db.query(ChunkText).filter(
+                    ChunkText.namespace == namespace,
+                    ChunkText.vector_id.in_(ids[start:start + QUERY_BATCH_SIZE])
+                ).delete(synchronize_session=False)
+            db.add_all([
+                ChunkText(namespace=namespace, vector_id=chunk_id, text=text, chunk_metadata=metadata or {})
+                for chunk_id, text, metadata in chunks
+            ])
+            db.commit()
+        self._forget((namespace, chunk_id) for chunk_id in ids)
+
+    def get_many(self, chunk_ids: Sequence[str], namespace: str = None, remember: bool = True) -> Dict[str, Dict]:
+        """
+        Look up chunk texts, from the LRU when possible and otherwise in one bulk query.
+        Bulk reads such as snapshot exports pass remember=False to leave the LRU to hot chunks.
+
+        Returns:
+            {vector_id: {"text": ..., "metadata": {...}}} for the chunks that are stored
+        """
+        namespace = namespace or ""
+        found = {}
+        missing = []
+        with self._lock:
+            for chunk_id in dict.fromkeys(chunk_ids):
+                entry = self._entries.get((namespace, chunk_id))
+                if entry is None:
+                    missing.append(chunk_id)
+                    continue
+                self._entries.move_to_end((namespace, chunk_id))
+                found[chunk_id] = {"text": entry["text"], "metadata": entry["metadata"]}
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            with self.session_factory() as db:
+                rows = []
+                for start in range(0, len(missing), QUERY_BATCH_SIZE):
+                    rows.extend(db.query(ChunkText.vector_id, ChunkText.text, ChunkText.chunk_metadata).filter(
+                        ChunkText.namespace == namespace,
+                        ChunkText.vector_id.in_(missing[start:start + QUERY_BATCH_SIZE])
+                    ).all())
+            for chunk_id, text, metadata in rows:
+                entry = {"text": text, "metadata": metadata or {}}
+                found[chunk_id] = entry
+                if remember:
+                    self._remember((namespace, chunk_id), entry)
+        return found
+
+    def delete(self, chunk_ids: Sequence[str], namespace: str = None) -> int:
+        """Remove the texts of deleted chunks"""
+        namespace = namespace or ""
+        chunk_ids = list(chunk_ids)
+        deleted = 0
+        with self.session_factory() as db:
+            for start in range(0, len(chunk_ids), QUERY_BATCH_SIZE):
+                deleted += db.query(ChunkText).filter(
+                    ChunkText.namespace == namespace,
+                    ChunkText.vector_id.in_(chunk_ids[start:start + QUERY_BATCH_SIZE])
+                ).delete(synchronize_session=False)
+            db.commit()
+        self._forget((namespace, chunk_id) for chunk_id in chunk_ids)
+        return deleted
+
+    def hydrate(self, matches: List[Match], namespace: str = None) -> List[Match]:
+        """
+        Fill in the text and chunk metadata of retrieved matches
+
+        Matches of vectors stored before chunk texts moved out of the vector
+        metadata still carry their text and are left as they are. Matches whose
+        text is missing (e.g. a vector outliving its deleted document) are dropped,
+        so every returned match has a text.
+        """
+        pending = [match for match in matches if "text" not in match.metadata]
+        if not pending:
+            return matches
+        entries = self.get_many([match.id for match in pending], namespace)
+        missing = set()
+        for match in pending:
+            entry = entries.get(match.id)
+            if entry is None:
+                logger.warning(f"No stored text for chunk {match.id} in namespace: {namespace}")
+                missing.add(match.id)
+                continue
+            match.metadata = {**entry["metadata"], **match.metadata, "text": entry["text"]}
+        if missing:
+            matches = [match for match in matches if match.id not in missing]
+        return matches
+
+    def stats(self) -> Dict:
+        """Cache hit rate and memory usage, for the metrics endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+chunk_store = ChunkStore(max_bytes=CHUNK_CACHE_MAX_MB * 1024 * 1024)
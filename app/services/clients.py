@@ -0,0 +1,99 @@
+from typing import Callable, Dict, Optional
+from openai import AsyncOpenAI, OpenAI
+from dotenv import load_dotenv
+import asyncio
+import os
+import threading
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client(name: str, factory: Callable[[], object]):
+    """Return the shared client called `name`, creating it on first use"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                logger.info(f"Creating {name} client")
+                client = _clients[name] = factory()
+    return client
+
+
+def get_openai_client() -> OpenAI:
+    return _get_client("openai", lambda: OpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    return _get_client("async_openai", lambda: AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+
+
+def get_pinecone_client():
+    def create():
+        from pinecone import Pinecone
+        return Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return _get_client("pinecone", create)
+
+
+def get_chat_model():
+    """Default LangChain chat model used by the AI service"""
+    def create():
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(api_key=os.getenv("OPENAI_API_KEY"), temperature=0.7)
+    return _get_client("chat_model", create)
+
+
+class Readiness:
+    """
+    Tracks whether the remote resources the app depends on are usable.
+
+    Workers start serving immediately; slow or failing setup steps run as background
+    tasks and are retried until they succeed, while /system/ready reports their state.
+    """
+
+    def __init__(self, retry_interval: float = 2.0, max_retry_interval: float = 60.0):
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.checks: Dict[str, Dict] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def set(self, name: str, ready: bool, error: Optional[str] = None):
+        self.checks[name] = {"ready": ready, "error": error}
+
+    def start(self, name: str, setup: Callable[[], None]) -> asyncio.Task:
+        """Run the blocking `setup` in a thread until it succeeds, without waiting for it"""
+        self.set(name, False, "starting")
+        task = self._tasks[name] = asyncio.create_task(self._run(name, setup))
+        return task
+
+    async def _run(self, name: str, setup: Callable[[], None]):
+        delay = self.retry_interval
+        while True:
+            try:
+                await asyncio.to_thread(setup)
+                self.set(name, True)
+                logger.info(f"{name} is ready")
+                return
+            except Exception as e:
+                self.set(name, False, str(e))
+                logger.warning(f"{name} is not ready, retrying in {delay:.0f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+
+    @property
+    def ready(self) -> bool:
+        return all(check["ready"] for check in self.checks.values())
+
+    def report(self) -> Dict:
+        return {"ready": self.ready, "checks": dict(self.checks)}
+
+
+readiness = Readiness()
@@ -0,0 +1,166 @@
+from typing import List, Optional
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from dotenv import load_dotenv
+import asyncio
+import hashlib
+import os
+import logging
+from .clients import get_async_openai_client
+from .embedding_models import DEFAULT_EMBEDDING_MODEL, EmbeddingModel
+from .text_chunker import Tokenizer, get_tokenizer
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# OpenAI accepts up to 2048 inputs and 300k tokens per embeddings request; stay well below
+MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))
+MAX_BATCH_ITEMS = int(os.getenv("EMBEDDING_BATCH_ITEMS", "512"))
+MAX_CONCURRENT_BATCHES = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+MAX_ATTEMPTS = 6
+
+
+def chunk_vector_id(document_id: str, text: str) -> str:
+    """
+    Vector ID of a document chunk, keyed by a hash of its content. A chunk that is
+    unchanged in a new version of the document keeps its ID, and its embedding.
+    """
+    return f"{document_id}#{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
+
+def make_document_id(namespace: Optional[str], source: str) -> str:
+    """
+    Deterministic document ID derived from the namespace and the source name, so every
+    upload of the same file replaces the previous version of that document.
+    """
+    digest = hashlib.sha256()
+    for part in (namespace or "", source):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:24]
+
+
+def _is_retryable(exception: BaseException) -> bool:
+    """Rate limits, server errors and connection problems are worth retrying"""
+    if isinstance(exception, (RateLimitError, APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(exception, APIStatusError) and exception.status_code >= 500
+
+
+_jittered_backoff = wait_random_exponential(multiplier=0.5, max=30)
+
+
+def _wait_before_retry(retry_state) -> float:
+    """Jittered exponential backoff, but never shorter than the server's Retry-After"""
+    wait = _jittered_backoff(retry_state)
+    exception = retry_state.outcome.exception()
+    response = getattr(exception, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(wait, float(retry_after)) if retry_after else wait
+    except ValueError:
+        return wait
+
+
+class EmbeddingBatcher:
+    """
+    Embeds large lists of texts with as few and as parallel requests as possible.
+
+    Texts are grouped into batches bounded by token count and item count, a bounded
+    number of batches are sent concurrently, and failed batches are retried with
+    jittered exponential backoff on rate limits and server errors.
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI = None,
+        model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL,
+        max_batch_tokens: int = MAX_BATCH_TOKENS,
+        max_batch_items: int = MAX_BATCH_ITEMS,
+        max_concurrency: int = MAX_CONCURRENT_BATCHES,
+        tokenizer: Tokenizer = None
+    ):
+        self._client = client
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_concurrency = max_concurrency
+        self._tokenizer = tokenizer
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # The shared client is created on first use, not at import
+        return self._client or get_async_openai_client()
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        # tiktoken may download its vocabulary, so this also waits for first use
+        return self._tokenizer or get_tokenizer(self.model.name)
+
+    def make_batches(self, texts: List[str], token_counts: Optional[List[int]] = None) -> List[List[int]]:
+        """
+        Group text indexes into batches that stay within the token and item limits; texts
+        are only tokenized when their `token_counts` aren't given
+        """
+        batches = []
+        current = []
+        current_tokens = 0
+
+        for i, text in enumerate(texts):
+            tokens = token_counts[i] if token_counts is not None else self.tokenizer.count(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_items):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _request(self, texts: List[str], model: EmbeddingModel) -> List[List[float]]:
+        async for attempt in AsyncRetrying(
+            retry=retry_if_exception(_is_retryable),
+            wait=_wait_before_retry,
+            stop=stop_after_attempt(MAX_ATTEMPTS),
+            reraise=True
+        ):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    logger.warning(f"Retrying embedding batch of {len(texts)} texts (attempt {attempt.retry_state.attempt_number})")
+                response = await self.client.embeddings.create(input=texts, **model.request_params())
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def embed(self, texts: List[str], model: Optional[EmbeddingModel] = None, token_counts: Optional[List[int]] = None) -> List[List[float]]:
+        """
+        Generate embeddings for `texts`, returned in the same order
+        
+        Args:
+            texts: Texts to embed
+            model: Model (and dimensions) to embed with, defaults to the batcher's model
+            token_counts: Token count of each text when already known (e.g. TextChunk.token_count)
+        """
+        if not texts:
+            return []
+        model = model or self.model
+
+        # Tokenizing (and loading the tokenizer) is blocking, so it runs in a thread
+        batches = await asyncio.to_thread(self.make_batches, texts, token_counts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        logger.info(f"Embedding {len(texts)} texts in {len(batches)} batches with concurrency {self.max_concurrency}")
+
+        async def run_batch(batch: List[int]):
+            async with semaphore:
+                vectors = await self._request([texts[i] for i in batch], model)
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = vector
+
+        await asyncio.gather(*(run_batch(batch) for batch in batches))
+        return embeddings
+
+
+embedding_batcher = EmbeddingBatcher()
@@ -0,0 +1,233 @@
+from typing import Dict, List, Optional
+from collections import OrderedDict
+from dotenv import load_dotenv
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+import logging
+from .quantization import check_precision, decode_vector, encode_vector
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Bounds of the persistent tier; older entries are pruned first
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "100000"))
+EMBEDDING_CACHE_MAX_AGE_DAYS = float(os.getenv("EMBEDDING_CACHE_MAX_AGE_DAYS", "30"))
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a query so trivial variations (case, spacing, unicode forms) share a cache entry"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+def cache_key(model: str, text: str) -> str:
+    return f"{model}:{hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()}"
+
+
+class SQLiteEmbeddingStore:
+    """
+    Persistent cache tier in a SQLite file. Every worker on the host opens the
+    same file, so an embedding computed by one worker is reused by all of them.
+
+    Entries older than `max_age_days` are ignored, and the file is pruned down to
+    the `max_rows` newest entries when it is opened and every `prune_every` writes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_rows: Optional[int] = EMBEDDING_CACHE_MAX_ROWS,
+        max_age_days: Optional[float] = EMBEDDING_CACHE_MAX_AGE_DAYS,
+        prune_every: int = 1000
+    ):
+        self.path = path
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self.prune_every = prune_every
+        self._writes = 0
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+                "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embedding_cache_created_at ON embedding_cache (created_at)")
+        self.prune()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _cutoff(self) -> str:
+        """SQLite modifier of datetime('now') for the oldest entry still served"""
+        return f"-{self.max_age_days * 86400:.0f} seconds"
+
+    def get(self, key: str) -> Optional[bytes]:
+        if self.max_age_days:
+            row = self._connection().execute(
+                "SELECT vector FROM embedding_cache WHERE key = ? AND created_at >= datetime('now', ?)",
+                (key, self._cutoff())
+            ).fetchone()
+        else:
+            row = self._connection().execute("SELECT vector FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, data: bytes):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO embedding_cache (key, vector) VALUES (?, ?)", (key, data))
+        # Counted per worker, so with several workers the file is pruned more often
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self) -> int:
+        """
+        Delete expired entries and the oldest entries beyond `max_rows`
+
+        Returns:
+            Number of deleted entries
+        """
+        deleted = 0
+        with self._connection() as conn:
+            if self.max_age_days:
+                deleted += conn.execute(
+                    "DELETE FROM embedding_cache WHERE created_at < datetime('now', ?)", (self._cutoff(),)
+                ).rowcount
+            if self.max_rows is not None:
+                deleted += conn.execute(
+                    "DELETE FROM embedding_cache WHERE key IN ("
+                    "SELECT key FROM embedding_cache ORDER BY created_at DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,)
+                ).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} entries from the persistent embedding cache")
+        return deleted
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of embeddings keyed by (model, normalized text hash).
+
+    The first tier is an in-process LRU of packed byte strings bounded by total
+    size, the optional second tier is shared by all workers (see SQLiteEmbeddingStore).
+    Embeddings are packed at `precision`: float32, float16 (half the size, cosine
+    error around 1e-4) or int8 (a quarter of the size).
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        persistent_store: Optional[SQLiteEmbeddingStore] = None,
+        precision: str = "float32"
+    ):
+        self.max_bytes = max_bytes
+        self.persistent_store = persistent_store
+        self.precision = check_precision(precision)
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, data: bytes):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes_used -= len(previous)
+            self._entries[key] = data
+            self.bytes_used += len(data)
+            while self.bytes_used > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes_used -= len(evicted)
+
+    def _key(self, model: str, text: str) -> str:
+        # Entries packed at different precisions never share a key in the persistent tier
+        key = cache_key(model, text)
+        return key if self.precision == "float32" else f"{key}:{self.precision}"
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Look up an embedding, checking memory first and then the persistent tier"""
+        key = self._key(model, text)
+
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return decode_vector(data, self.precision)
+
+        if self.persistent_store is not None:
+            try:
+                data = self.persistent_store.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Persistent embedding cache lookup failed: {str(e)}")
+                data = None
+            if data is not None:
+                self.persistent_hits += 1
+                self._remember(key, data)
+                return decode_vector(data, self.precision)
+
+        self.misses += 1
+        return None
+
+    def set(self, model: str, text: str, vector: List[float]):
+        """Store an embedding in both tiers"""
+        key = self._key(model, text)
+        data = encode_vector(vector, self.precision)
+        self._remember(key, data)
+
+        if self.persistent_store is not None:
+            try:
+                self.persistent_store.set(key, data)
+            except sqlite3.Error as e:
+                logger.warning(f"Persistent embedding cache write failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        """Hit rates and memory usage, for the metrics endpoint"""
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0,
+            "persistent_tier": self.persistent_store is not None,
+            "precision": self.precision
+        }
+
+
+def create_embedding_cache() -> EmbeddingCache:
+    """Create the query embedding cache from environment configuration"""
+    path = os.getenv("EMBEDDING_CACHE_PATH")
+    persistent_store = None
+    if path:
+        try:
+            persistent_store = SQLiteEmbeddingStore(path)
+            logger.info(f"Using persistent embedding cache at {path}")
+        except sqlite3.Error as e:
+            logger.error(f"Could not open persistent embedding cache at {path}: {str(e)}")
+
+    max_bytes = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "64")) * 1024 * 1024
+    precision = os.getenv("EMBEDDING_CACHE_PRECISION", "float16")
+    return EmbeddingCache(max_bytes=max_bytes, persistent_store=persistent_store, precision=precision)
+
+
+query_embedding_cache = create_embedding_cache()
@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional, Sequence
+from dataclasses import dataclass
+from dotenv import load_dotenv
+import os
+import numpy as np
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Native embedding dimensions of the supported OpenAI models
+NATIVE_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+# Models that return shortened embeddings through the `dimensions` request parameter
+SHORTENABLE_MODELS = {"text-embedding-3-small", "text-embedding-3-large"}
+
+
+@dataclass(frozen=True)
+class EmbeddingModel:
+    """An embedding model and the number of dimensions its vectors are stored with"""
+    name: str
+    dimensions: int
+
+    @property
+    def shortened(self) -> bool:
+        return self.dimensions != NATIVE_DIMENSIONS[self.name]
+
+    @property
+    def key(self) -> str:
+        """Identifies the embedding space, e.g. for cache keys: text-embedding-3-small@512"""
+        return f"{self.name}@{self.dimensions}" if self.shortened else self.name
+
+    def request_params(self) -> Dict:
+        """Parameters of an OpenAI embeddings request for this model"""
+        params = {"model": self.name}
+        if self.shortened:
+            params["dimensions"] = self.dimensions
+        return params
+
+    def as_dict(self) -> Dict:
+        return {"embedding_model": self.name, "embedding_dimensions": self.dimensions}
+
+
+def get_embedding_model(name: str, dimensions: Optional[int] = None) -> EmbeddingModel:
+    """
+    Validate a model name and dimension count
+
+    Raises:
+        ValueError: For unknown models, or dimensions the model can't produce
+    """
+    if name not in NATIVE_DIMENSIONS:
+        raise ValueError(f"Unknown embedding model {name!r}, expected one of {', '.join(NATIVE_DIMENSIONS)}")
+    native = NATIVE_DIMENSIONS[name]
+    dimensions = int(dimensions) if dimensions else native
+    if dimensions != native and name not in SHORTENABLE_MODELS:
+        raise ValueError(f"{name} only produces {native}-dimensional embeddings")
+    if not 0 < dimensions <= native:
+        raise ValueError(f"{name} embeddings can have between 1 and {native} dimensions, got {dimensions}")
+    return EmbeddingModel(name, dimensions)
+
+
+def shorten_embedding(vector: Sequence[float], dimensions: int) -> List[float]:
+    """
+    Shorten a text-embedding-3 vector the way the API's `dimensions` parameter does:
+    keep the first `dimensions` values and re-normalize to unit length
+    """
+    values = np.asarray(vector, dtype=np.float32)[:dimensions]
+    norm = np.linalg.norm(values)
+    return (values / norm if norm > 0 else values).tolist()
+
+
+# Knowledge bases built before the model was recorded were embedded with ada-002
+LEGACY_EMBEDDING_MODEL = EmbeddingModel("text-embedding-ada-002", 1536)
+
+# Model for new knowledge bases; text-embedding-3 models accept e.g. EMBEDDING_DIMENSIONS=512
+# to shrink the index and speed up search (see app/tests/embedding_dimension_benchmark.py)
+DEFAULT_EMBEDDING_MODEL = get_embedding_model(
+    os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002"),
+    os.getenv("EMBEDDING_DIMENSIONS") or None
+)
+
+
+def embedding_model_for(knowledge_base: Optional[Dict]) -> EmbeddingModel:
+    """
+    Model a business's knowledge base was built with, so queries are embedded the same way
+
+    The model is recorded in `knowledge_base` by record_embedding_model (or set there before
+    the first upload to choose it). Knowledge bases that have a namespace but no recorded
+    model predate the registry; those without either haven't been built yet.
+    """
+    knowledge_base = knowledge_base or {}
+    if knowledge_base.get("embedding_model"):
+        return get_embedding_model(knowledge_base["embedding_model"], knowledge_base.get("embedding_dimensions"))
+    if knowledge_base.get("namespace"):
+        return LEGACY_EMBEDDING_MODEL
+    return DEFAULT_EMBEDDING_MODEL
+
+
+def record_embedding_model(knowledge_base: Optional[Dict], namespace: str) -> Dict:
+    """
+    Knowledge base settings with the namespace and its embedding model recorded
+
+    The model is fixed when the namespace is created; later uploads keep it.
+    """
+    knowledge_base = dict(knowledge_base or {})
+    model = embedding_model_for(knowledge_base)
+    knowledge_base.update(model.as_dict())
+    knowledge_base["namespace"] = namespace
+    return knowledge_base
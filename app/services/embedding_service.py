@@ -1,41 +1,27 @@
 from typing import List, Dict
-from openai import OpenAI
-import os
-import time
-from pinecone import Pinecone
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+import asyncio
+import hashlib
+from .clients import get_openai_client
+from .embedding_cache import query_embedding_cache
+from .embedding_models import DEFAULT_EMBEDDING_MODEL, EmbeddingModel
+from .query_embedding_batcher import query_embedding_batcher
 
 class EmbeddingService:
-    @staticmethod
-    def get_index_stats(index_name: str = "business-knowledge-base") -> Dict:
-        """
-        Get statistics about the index including vector counts per namespace
-        """
-        try:
-            index = pc.Index(index_name)
-            return index.describe_index_stats()
-        except Exception as e:
-            print(f"Error getting index stats: {str(e)}")
-            raise
+    """
+    Embedding generation. Storing and searching vectors goes through the
+    VectorStore backends (see vector_backends.py)
+    """
 
     @staticmethod
-    def generate_embeddings(texts: List[str]) -> List[List[float]]:
+    def generate_embeddings(texts: List[str], model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL) -> List[List[float]]:
         """
-        Generate embeddings for a list of texts using OpenAI's text-embedding-ada-002 model
+        Generate embeddings for a list of texts with `model` (OpenAI's text-embedding-ada-002
+        unless EMBEDDING_MODEL is set)
         """
         try:
-            response = client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=texts
+            response = get_openai_client().embeddings.create(
+                input=texts,
+                **model.request_params()
             )
             return [embedding.embedding for embedding in response.data]
         except Exception as e:
@@ -43,82 +29,51 @@ class EmbeddingService:
             raise
 
     @staticmethod
-    def wait_for_index_ready(index_name: str):
+    def get_query_embedding(query: str, model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL) -> List[float]:
         """
-        Wait for the index to be ready
+        Get the embedding for a search query, served from the embedding cache when possible.
+        `model` must be the model the searched namespace was built with.
         """
-        while not pc.describe_index(index_name).status['ready']:
-            time.sleep(1)
+        embedding = query_embedding_cache.get(model.key, query)
+        if embedding is None:
+            embedding = EmbeddingService.generate_embeddings([query], model)[0]
+            query_embedding_cache.set(model.key, query, embedding)
+        return embedding
 
     @staticmethod
-    def upsert_to_pinecone(vectors: List[Dict], index_name: str = "business-knowledge-base", namespace: str = None):
+    async def aget_query_embedding(query: str, model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL) -> List[float]:
         """
-        Upsert vectors to Pinecone index
+        Async get_query_embedding for the chat path: cache misses are embedded together with
+        the queries of concurrent chat turns in one request (see QueryEmbeddingBatcher).
+        The cache can go to its SQLite tier, so it is used from a thread, off the event loop
         """
-        try:
-            # Wait for index to be ready
-            EmbeddingService.wait_for_index_ready(index_name)
-            
-            # Get the index
-            index = pc.Index(index_name)
-            
-            # Prepare upsert parameters
-            upsert_params = {"vectors": vectors}
-            if namespace:
-                upsert_params["namespace"] = namespace
-                
-            # Perform upsert
-            index.upsert(**upsert_params)
-            
-            # Log the operation
-            stats = EmbeddingService.get_index_stats(index_name)
-            print(f"Upserted {len(vectors)} vectors. Current index stats: {stats}")
-        except Exception as e:
-            print(f"Error upserting to Pinecone: {str(e)}")
-            raise
+        embedding = await asyncio.to_thread(query_embedding_cache.get, model.key, query)
+        if embedding is None:
+            embedding = await query_embedding_batcher.embed(query, model)
+            await asyncio.to_thread(query_embedding_cache.set, model.key, query, embedding)
+        return embedding
 
     @staticmethod
-    def prepare_vectors(texts: List[str], metadata: List[Dict] = None) -> List[Dict]:
+    def prepare_vectors(
+        texts: List[str],
+        metadata: List[Dict] = None,
+        ids: List[str] = None,
+        model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL
+    ) -> List[Dict]:
         """
-        Prepare vectors for Pinecone upsert
+        Prepare vectors for a vector store upsert.
+        Without explicit ids, each vector is keyed by a hash of its text so that
+        separate calls never overwrite each other's vectors.
         """
-        embeddings = EmbeddingService.generate_embeddings(texts)
+        embeddings = EmbeddingService.generate_embeddings(texts, model)
         vectors = []
-        
+
         for i, embedding in enumerate(embeddings):
             vector = {
-                "id": f"vec_{i}",
+                "id": ids[i] if ids else f"vec_{hashlib.sha256(texts[i].encode('utf-8')).hexdigest()[:32]}",
                 "values": embedding,
                 "metadata": metadata[i] if metadata else {"text": texts[i]}
             }
             vectors.append(vector)
-        
-        return vectors
 
-    @staticmethod
-    def search_similar_texts(query: str, top_k: int = 5, index_name: str = "business-knowledge-base", namespace: str = None) -> List[Dict]:
-        """
-        Search for similar texts in Pinecone index
-        """
-        try:
-            # Generate embedding for the query
-            query_embedding = EmbeddingService.generate_embeddings([query])[0]
-            
-            # Search in Pinecone
-            index = pc.Index(index_name)
-            
-            # Prepare query parameters
-            query_params = {
-                "vector": query_embedding,
-                "top_k": top_k,
-                "include_metadata": True
-            }
-            if namespace:
-                query_params["namespace"] = namespace
-                
-            results = index.query(**query_params)
-            
-            return results.matches
-        except Exception as e:
-            print(f"Error searching similar texts: {str(e)}")
-            raise 
\ No newline at end of file
+        return vectors
@@ -0,0 +1,319 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+import logging
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models.assistant import AIAssistant
+from app.models.business_profile import BusinessProfile
+from app.models.faq import FAQEntry
+from app.models.message import Message
+from .ai_service import CHAT_SYSTEM_PROMPT, get_business_temperature
+from .clients import get_openai_client
+from .embedding_models import embedding_model_for
+from .vector_backends import Match
+from .vector_store import search_similar_texts
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Answer frequent questions from the FAQ index before retrieval and generation
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+# A normalized question needs this many occurrences in the lookback window to get an answer
+FAQ_MIN_FREQUENCY = int(os.getenv("FAQ_MIN_FREQUENCY", "3"))
+FAQ_MAX_ENTRIES = int(os.getenv("FAQ_MAX_ENTRIES", "50"))
+FAQ_LOOKBACK_DAYS = int(os.getenv("FAQ_LOOKBACK_DAYS", "90"))
+# Seconds a worker serves an assistant's answers from memory before reloading them
+FAQ_CACHE_TTL = float(os.getenv("FAQ_CACHE_TTL", "60"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+# Questions that refer back to earlier turns ("how much is it?") can't have a fixed answer.
+# Only assistants in these languages get an FAQ; the words of every language are checked,
+# since customers often mix in English
+_CONTEXT_WORDS = {
+    "en": {"it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "she", "him", "her"},
+    "ru": {
+        "он", "она", "оно", "они", "его", "её", "ее", "их", "ему", "ей", "им", "ним", "ней", "нее", "нему", "них",
+        "это", "этот", "эта", "эти", "этого", "этой", "этому", "этим", "этих", "тот", "та", "то", "те", "того", "той", "тех"
+    },
+}
+_ALL_CONTEXT_WORDS = set().union(*_CONTEXT_WORDS.values())
+
+
+def normalize_question(text: str) -> str:
+    """Case, punctuation, spacing and unicode forms don't distinguish questions"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+
+
+def is_context_free(normalized_question: str, language: str = "en") -> bool:
+    """Whether a question can be answered on its own; never for languages without context words"""
+    if language not in _CONTEXT_WORDS:
+        return False
+    return bool(normalized_question) and not _ALL_CONTEXT_WORDS.intersection(normalized_question.split())
+
+
+def mine_frequent_questions(
+    db: Session,
+    assistant_id: int,
+    language: str = "en",
+    min_frequency: int = FAQ_MIN_FREQUENCY,
+    limit: int = FAQ_MAX_ENTRIES,
+    lookback_days: int = FAQ_LOOKBACK_DAYS
+) -> List[Tuple[str, str, int]]:
+    """
+    Most frequent questions asked to an assistant in the lookback window
+
+    Follow-up questions can only be told apart in the languages of _CONTEXT_WORDS, so
+    nothing is mined for assistants in other languages.
+
+    Returns:
+        (normalized question, most common wording, frequency) tuples, most frequent first
+    """
+    if language not in _CONTEXT_WORDS:
+        logger.info(f"No FAQ for assistant {assistant_id}: follow-up questions in '{language}' can't be detected")
+        return []
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    counts: Counter = Counter()
+    wordings: Dict[str, Counter] = defaultdict(Counter)
+    rows = db.query(Message.user_query).filter(
+        Message.assistant_id == assistant_id,
+        Message.timestamp >= since
+    ).yield_per(1000)
+    for (query,) in rows:
+        normalized = normalize_question(query or "")
+        if is_context_free(normalized, language):
+            counts[normalized] += 1
+            wordings[normalized][query.strip()] += 1
+
+    return [
+        (normalized, wordings[normalized].most_common(1)[0][0], count)
+        for normalized, count in counts.most_common(limit)
+        if count >= min_frequency
+    ]
+
+
+def retrieve_faq_sources(question: str, business_profile: BusinessProfile) -> List[Match]:
+    """Knowledge a chat about `question` would be answered from"""
+    knowledge_base = business_profile.knowledge_base or {}
+    if not knowledge_base.get("namespace"):
+        return []
+    return search_similar_texts(
+        question,
+        namespace=knowledge_base["namespace"],
+        similarity_threshold=knowledge_base.get("similarity_threshold"),
+        embedding_model=embedding_model_for(knowledge_base)
+    )
+
+
+def generate_faq_answer(
+    question: str,
+    language: str,
+    assistant: AIAssistant,
+    business_profile: BusinessProfile,
+    sources: Sequence[Match]
+) -> str:
+    """Answer a question the way the chat endpoints do, from the same knowledge"""
+    messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
+    if sources:
+        messages.append({
+            "role": "system",
+            "content": "\n".join(f"Business Knowledge: {match.metadata.get('text', '')}" for match in sources)
+        })
+    messages.append({"role": "system", "content": f"Answer in the language with code '{language}'."})
+    messages.append({"role": "user", "content": question})
+
+    # Errors propagate, so a failed generation is never stored as an answer
+    response = get_openai_client().chat.completions.create(
+        model=assistant.model,
+        messages=messages,
+        temperature=get_business_temperature(business_profile.business_type),
+        max_tokens=1000
+    )
+    return response.choices[0].message.content
+
+
+def _answer(entry: FAQEntry, assistant: AIAssistant, business_profile: BusinessProfile, force: bool = False) -> bool:
+    """(Re)generate an entry's answer if its knowledge changed; returns whether it did"""
+    sources = retrieve_faq_sources(entry.question, business_profile)
+    source_ids = sorted(match.id for match in sources)
+    if not force and entry.answer and source_ids == sorted(entry.source_ids or []):
+        return False
+    entry.answer = generate_faq_answer(entry.question, entry.language, assistant, business_profile, sources)
+    entry.source_ids = source_ids
+    return True
+
+
+def rebuild_faq(db: Session, assistant_id: int) -> Dict:
+    """
+    Mine an assistant's frequent questions and pre-generate their answers
+
+    Answers of questions that stay frequent are kept unless their knowledge changed,
+    and questions that are no longer frequent are dropped.
+
+    Returns:
+        Counts of the questions, generated and reused answers and removed entries
+    """
+    assistant = db.query(AIAssistant).filter(AIAssistant.id == assistant_id).first()
+    if assistant is None or assistant.business_profile is None:
+        raise ValueError(f"Assistant {assistant_id} has no business profile")
+    business_profile = assistant.business_profile
+    language = assistant.language
+
+    existing = {
+        entry.normalized_question: entry
+        for entry in db.query(FAQEntry).filter(FAQEntry.assistant_id == assistant_id, FAQEntry.language == language)
+    }
+    stats = {"questions": 0, "generated": 0, "reused": 0, "removed": 0}
+    for normalized, question, frequency in mine_frequent_questions(db, assistant_id, language):
+        entry = existing.pop(normalized, None)
+        if entry is None:
+            entry = FAQEntry(
+                assistant_id=assistant_id,
+                language=language,
+                normalized_question=normalized,
+                question=question,
+                answer="",
+                source_ids=[]
+            )
+            db.add(entry)
+        entry.question = question
+        entry.frequency = frequency
+        if _answer(entry, assistant, business_profile):
+            stats["generated"] += 1
+        else:
+            stats["reused"] += 1
+        stats["questions"] += 1
+        db.commit()
+
+    for entry in existing.values():
+        db.delete(entry)
+        stats["removed"] += 1
+    db.commit()
+    faq_index.invalidate(assistant_id)
+    logger.info(f"Rebuilt FAQ of assistant {assistant_id}: {stats}")
+    return stats
+
+
+def refresh_faq_answers(db: Session, assistant_id: int) -> int:
+    """
+    Regenerate the answers whose knowledge changed, e.g. after a document upload or delete
+
+    Returns:
+        Number of regenerated answers
+    """
+    assistant = db.query(AIAssistant).filter(AIAssistant.id == assistant_id).first()
+    if assistant is None or assistant.business_profile is None:
+        return 0
+    regenerated = 0
+    for entry in db.query(FAQEntry).filter(FAQEntry.assistant_id == assistant_id).all():
+        if _answer(entry, assistant, assistant.business_profile):
+            regenerated += 1
+            db.commit()
+    faq_index.invalidate(assistant_id)
+    if regenerated:
+        logger.info(f"Regenerated {regenerated} FAQ answers of assistant {assistant_id} after a knowledge change")
+    return regenerated
+
+
+def refresh_faq_for_business(business_profile_id: int):
+    """Refresh a business's FAQ answers in a session of its own, for background tasks"""
+    db = SessionLocal()
+    try:
+        business_profile = db.query(BusinessProfile).filter(BusinessProfile.id == business_profile_id).first()
+        if business_profile is not None and business_profile.assistant_id is not None:
+            refresh_faq_answers(db, business_profile.assistant_id)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error refreshing FAQ answers of business profile {business_profile_id}: {str(e)}", exc_info=True)
+    finally:
+        db.close()
+
+
+class FAQIndex:
+    """
+    In-memory lookup of pre-generated answers by assistant, language and normalized question
+
+    Each assistant's answers are loaded with one query and reloaded after FAQ_CACHE_TTL
+    seconds, or right away in the worker that changed them.
+    """
+
+    def __init__(self, ttl: float = FAQ_CACHE_TTL):
+        self.ttl = ttl
+        self._answers: Dict[int, Tuple[float, Dict[Tuple[str, str], str]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, db: Session, assistant_id: int) -> Dict[Tuple[str, str], str]:
+        cached = self._answers.get(assistant_id)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        rows = db.query(FAQEntry.language, FAQEntry.normalized_question, FAQEntry.answer).filter(
+            FAQEntry.assistant_id == assistant_id
+        ).all()
+        answers = {(language, normalized): answer for language, normalized, answer in rows if answer}
+        with self._lock:
+            self._answers[assistant_id] = (time.monotonic(), answers)
+        return answers
+
+    def lookup(self, db: Session, assistant_id: int, language: str, question: str) -> Optional[str]:
+        """Pre-generated answer to `question`, or None when it has to be answered live"""
+        if not FAQ_ENABLED:
+            return None
+        try:
+            answer = self._load(db, assistant_id).get((language, normalize_question(question)))
+        except Exception as e:
+            # The FAQ is an optimization, chat keeps working without it
+            logger.error(f"FAQ lookup failed for assistant {assistant_id}: {str(e)}")
+            return None
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            logger.info(f"Answered question of assistant {assistant_id} from the FAQ index")
+        return answer
+
+    def invalidate(self, assistant_id: int):
+        with self._lock:
+            self._answers.pop(assistant_id, None)
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "assistants": len(self._answers)}
+
+
+faq_index = FAQIndex()
+
+
+if __name__ == "__main__":
+    # Offline job: python -m app.services.faq_index [assistant_id ...]
+    import app.models
+    import app.models.user_subscription
+    import app.models.knowledge
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        assistant_ids = [int(arg) for arg in sys.argv[1:]] or [
+            assistant_id for (assistant_id,) in session.query(BusinessProfile.assistant_id).filter(
+                BusinessProfile.assistant_id.isnot(None)
+            )
+        ]
+        for assistant_id in assistant_ids:
+            try:
+                logger.info(f"Rebuilt FAQ of assistant {assistant_id}: {rebuild_faq(session, assistant_id)}")
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error rebuilding FAQ of assistant {assistant_id}: {str(e)}", exc_info=True)
+    finally:
+        session.close()
@@ -3,30 +3,88 @@ import PyPDF2
 import docx
 import io
 import logging
+from app.services.text_chunker import PAGE_BREAK
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+def extract_pdf_text(contents: bytes) -> str:
+    pdf_file = io.BytesIO(contents)
+    
+    # Create PDF reader object
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    logger.info(f"PDF loaded with {len(pdf_reader.pages)} pages")
+    
+    # Extract text from all pages, keeping page boundaries for chunking
+    pages = []
+    for i, page in enumerate(pdf_reader.pages):
+        page_text = page.extract_text()
+        pages.append(page_text)
+        logger.debug(f"Extracted {len(page_text)} characters from page {i+1}")
+    text = PAGE_BREAK.join(pages)
+    
+    logger.info(f"PDF processing complete. Total extracted text: {len(text)} characters")
+    # Strip whitespace but keep leading/trailing page breaks so page numbers stay correct
+    return text.strip(" \t\r\n")
+
+def extract_docx_text(contents: bytes) -> str:
+    doc_file = io.BytesIO(contents)
+    
+    # Create document object
+    doc = docx.Document(doc_file)
+    logger.info(f"DOCX loaded with {len(doc.paragraphs)} paragraphs")
+    
+    # Extract text from all paragraphs
+    text = ""
+    for i, para in enumerate(doc.paragraphs):
+        # Mark headings so the chunker can split the document into sections
+        style_name = para.style.name if para.style is not None else ""
+        if style_name.startswith("Heading") and para.text.strip():
+            level = style_name.replace("Heading", "").strip()
+            text += "\n" + "#" * (int(level) if level.isdigit() else 1) + " " + para.text + "\n\n"
+        else:
+            text += para.text + "\n"
+        logger.debug(f"Extracted paragraph {i+1}: {len(para.text)} characters")
+    
+    logger.info(f"DOCX processing complete. Total extracted text: {len(text)} characters")
+    return text.strip()
+
+def extract_txt_text(contents: bytes) -> str:
+    text = contents.decode('utf-8').strip()
+    logger.info(f"TXT processing complete. Total extracted text: {len(text)} characters")
+    return text
+
+def extract_text(filename: str, contents: bytes) -> str:
+    """
+    Extract the text of a PDF, DOCX or TXT file from its bytes
+    
+    This is CPU-bound, so callers on the event loop should run it in a thread.
+    """
+    try:
+        logger.info(f"Starting file processing for: {filename}")
+        if filename.endswith('.pdf'):
+            text = extract_pdf_text(contents)
+        elif filename.endswith('.docx'):
+            text = extract_docx_text(contents)
+        elif filename.endswith('.txt'):
+            text = extract_txt_text(contents)
+        else:
+            error_msg = f"Unsupported file type: {filename}"
+            logger.error(error_msg)
+            raise ValueError("Unsupported file type. Please upload PDF, DOCX, or TXT files.")
+        
+        logger.info(f"File processing complete for {filename}. Text length: {len(text)} characters")
+        return text
+    except Exception as e:
+        logger.error(f"Error processing file {filename}: {str(e)}", exc_info=True)
+        raise Exception(f"Error processing file: {str(e)}")
+
 async def process_pdf(file: UploadFile) -> str:
     try:
         logger.info(f"Processing PDF file: {file.filename}")
         # Read the uploaded file into memory
         contents = await file.read()
-        pdf_file = io.BytesIO(contents)
-        
-        # Create PDF reader object
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        logger.info(f"PDF loaded with {len(pdf_reader.pages)} pages")
-        
-        # Extract text from all pages
-        text = ""
-        for i, page in enumerate(pdf_reader.pages):
-            page_text = page.extract_text()
-            text += page_text + "\n"
-            logger.debug(f"Extracted {len(page_text)} characters from page {i+1}")
-        
-        logger.info(f"PDF processing complete. Total extracted text: {len(text)} characters")
-        return text.strip()
+        return extract_pdf_text(contents)
     except Exception as e:
         logger.error(f"Error processing PDF {file.filename}: {str(e)}", exc_info=True)
         raise Exception(f"Error processing PDF: {str(e)}")
@@ -36,20 +94,7 @@ async def process_docx(file: UploadFile) -> str:
         logger.info(f"Processing DOCX file: {file.filename}")
         # Read the uploaded file into memory
         contents = await file.read()
-        doc_file = io.BytesIO(contents)
-        
-        # Create document object
-        doc = docx.Document(doc_file)
-        logger.info(f"DOCX loaded with {len(doc.paragraphs)} paragraphs")
-        
-        # Extract text from all paragraphs
-        text = ""
-        for i, para in enumerate(doc.paragraphs):
-            text += para.text + "\n"
-            logger.debug(f"Extracted paragraph {i+1}: {len(para.text)} characters")
-        
-        logger.info(f"DOCX processing complete. Total extracted text: {len(text)} characters")
-        return text.strip()
+        return extract_docx_text(contents)
     except Exception as e:
         logger.error(f"Error processing DOCX {file.filename}: {str(e)}", exc_info=True)
         raise Exception(f"Error processing DOCX: {str(e)}")
@@ -59,29 +104,11 @@ async def process_txt(file: UploadFile) -> str:
         logger.info(f"Processing TXT file: {file.filename}")
         # Read the uploaded file into memory
         contents = await file.read()
-        text = contents.decode('utf-8').strip()
-        logger.info(f"TXT processing complete. Total extracted text: {len(text)} characters")
-        return text
+        return extract_txt_text(contents)
     except Exception as e:
         logger.error(f"Error processing TXT {file.filename}: {str(e)}", exc_info=True)
         raise Exception(f"Error processing TXT: {str(e)}")
 
 async def process_file(file: UploadFile) -> str:
-    try:
-        logger.info(f"Starting file processing for: {file.filename}")
-        if file.filename.endswith('.pdf'):
-            text = await process_pdf(file)
-        elif file.filename.endswith('.docx'):
-            text = await process_docx(file)
-        elif file.filename.endswith('.txt'):
-            text = await process_txt(file)
-        else:
-            error_msg = f"Unsupported file type: {file.filename}"
-            logger.error(error_msg)
-            raise ValueError("Unsupported file type. Please upload PDF, DOCX, or TXT files.")
-        
-        logger.info(f"File processing complete for {file.filename}. Text length: {len(text)} characters")
-        return text
-    except Exception as e:
-        logger.error(f"Error processing file {file.filename}: {str(e)}", exc_info=True)
-        raise Exception(f"Error processing file: {str(e)}") 
\ No newline at end of file
+    contents = await file.read()
+    return extract_text(file.filename, contents)
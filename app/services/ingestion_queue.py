@@ -0,0 +1,527 @@
+from typing import IO, Awaitable, Callable, Deque, Dict, List, Optional, Union
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import or_
+import asyncio
+import logging
+import os
+import re
+import socket
+import uuid
+from app.database import SessionLocal
+from app.models.business_profile import BusinessProfile
+from app.models.knowledge import IngestJobRecord, KnowledgeDocument
+from .embedding_models import embedding_model_for
+from .faq_index import refresh_faq_for_business
+from .file_processor import extract_text
+from .knowledge_catalog import get_document, ingest_document, restore_documents
+from .knowledge_snapshot import check_snapshot_model, import_snapshot, read_header
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Uploads wait here until a worker has ingested them; every worker process must see the same directory
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "data/uploads")
+# Documents ingested at the same time by this process
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+# Documents of one business ingested at the same time, so one tenant's bulk upload
+# can't occupy every worker
+INGEST_TENANT_CONCURRENCY = int(os.getenv("INGEST_TENANT_CONCURRENCY", "1"))
+# Seconds between saving the progress of this process's jobs (which renews its claim on them)
+INGEST_JOB_SYNC_SECONDS = float(os.getenv("INGEST_JOB_SYNC_SECONDS", "2"))
+# Unfinished jobs whose claim wasn't renewed for this long are taken over by another worker
+INGEST_JOB_LEASE_SECONDS = float(os.getenv("INGEST_JOB_LEASE_SECONDS", "60"))
+
+_UNSAFE_FILENAME = re.compile(r"[^\w.\-]")
+UNFINISHED = ("queued", "running")
+# Uploads are copied to the spool directory this many bytes at a time
+SPOOL_COPY_BYTES = 1024 * 1024
+# Largest knowledge document accepted for ingestion
+INGEST_MAX_UPLOAD_BYTES = int(float(os.getenv("INGEST_MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+
+
+class UploadTooLargeError(Exception):
+    """An upload exceeded the size limit while it was being spooled"""
+
+
+@dataclass
+class IngestJob:
+    """
+    An uploaded file waiting for or going through ingestion
+
+    Stages run queued -> parsing -> chunking -> embedding -> upserting -> refreshing_faq
+    -> done, refreshing_faq only when chunks changed. Chunking, embedding and upserting
+    overlap for large documents, so `progress` counts the chunks that completed each of them.
+    Snapshot imports run queued -> importing -> cataloguing -> refreshing_faq -> done.
+    """
+    id: str
+    business_profile_id: int
+    namespace: str
+    filename: str
+    path: str
+    kind: str = "document"  # a document to ingest, or a knowledge snapshot to import
+    # Catalog document to replace, instead of the document with the same file name
+    document_id: Optional[int] = None
+    status: str = "queued"  # queued, running, done or failed
+    stage: str = "queued"
+    progress: Dict[str, int] = field(default_factory=lambda: {"chunking": 0, "embedding": 0, "upserting": 0})
+    report: Optional[Dict] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @classmethod
+    def from_record(cls, record: IngestJobRecord) -> "IngestJob":
+        return cls(
+            id=record.id,
+            business_profile_id=record.business_profile_id,
+            namespace=record.namespace,
+            filename=record.filename,
+            path=record.path,
+            kind=record.kind,
+            document_id=record.document_id,
+            status=record.status,
+            stage=record.stage,
+            progress=dict(record.progress or {}),
+            report=record.report,
+            error=record.error,
+            created_at=record.created_at,
+            started_at=record.started_at,
+            finished_at=record.finished_at
+        )
+
+    def advance(self, stage: str, chunks: int = 0):
+        """Progress callback for store_embeddings"""
+        self.stage = stage
+        if stage in self.progress:
+            self.progress[stage] += chunks
+
+    def state(self) -> Dict:
+        """Columns of the job's IngestJobRecord that change while it runs"""
+        return {
+            "status": self.status,
+            "stage": self.stage,
+            "progress": dict(self.progress),
+            "report": self.report,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+    def as_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": dict(self.progress),
+            "report": self.report,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+def _equals(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+class IngestionQueue:
+    """
+    Spools uploads to disk and ingests them on a pool of background workers
+
+    A tenant's jobs beyond `tenant_concurrency` wait in a per-tenant backlog instead of
+    the shared queue, so they never hold a worker that another tenant could use.
+
+    Every job has an IngestJobRecord, so any worker process can report its status.
+    The process holding a job saves its progress every `sync_interval` seconds, which
+    renews its claim; unfinished jobs whose claim is older than `lease` (their process
+    stopped or crashed) are claimed and run again by another process, from the upload
+    left in the spool directory. A stopping process hands its jobs back right away.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[IngestJob], Awaitable[Dict]],
+        spool_dir: str = INGEST_SPOOL_DIR,
+        workers: int = INGEST_WORKERS,
+        tenant_concurrency: int = INGEST_TENANT_CONCURRENCY,
+        session_factory: Callable = SessionLocal,
+        sync_interval: float = INGEST_JOB_SYNC_SECONDS,
+        lease: float = INGEST_JOB_LEASE_SECONDS
+    ):
+        self.handler = handler
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.tenant_concurrency = tenant_concurrency
+        self.session_factory = session_factory
+        self.sync_interval = sync_interval
+        self.lease = lease
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Unfinished jobs held by this process
+        self.jobs: Dict[str, IngestJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._active: Dict[int, int] = defaultdict(int)
+        self._backlog: Dict[int, Deque[IngestJob]] = defaultdict(deque)
+
+    def _spool(self, job_id: str, filename: str, contents: Union[bytes, IO[bytes]], max_bytes: Optional[int] = None) -> str:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f"{job_id}-{_UNSAFE_FILENAME.sub('_', filename)}")
+        try:
+            with open(path, "wb") as f:
+                if isinstance(contents, bytes):
+                    if max_bytes is not None and len(contents) > max_bytes:
+                        raise UploadTooLargeError(f"Upload is larger than {max_bytes} bytes")
+                    f.write(contents)
+                    return path
+                written = 0
+                while True:
+                    block = contents.read(SPOOL_COPY_BYTES)
+                    if not block:
+                        return path
+                    written += len(block)
+                    if max_bytes is not None and written > max_bytes:
+                        raise UploadTooLargeError(f"Upload is larger than {max_bytes} bytes")
+                    f.write(block)
+        except BaseException:
+            os.remove(path)
+            raise
+
+    async def start(self):
+        """Start the workers, which also picks up the jobs left unfinished by stopped processes"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sync_loop()))
+        logger.info(f"Started {self.workers} ingestion workers as {self.worker_id}")
+
+    async def submit(
+        self,
+        business_profile_id: int,
+        namespace: str,
+        filename: str,
+        contents: Union[bytes, IO[bytes]],
+        document_id: Optional[int] = None,
+        kind: str = "document",
+        max_bytes: Optional[int] = None
+    ) -> IngestJob:
+        """
+        Spool an upload and queue it for ingestion
+
+        Args:
+            contents: The uploaded bytes, or a file to copy them from
+            document_id: Catalog document to replace
+            kind: "document", or "snapshot" for a knowledge snapshot to import
+            max_bytes: Size limit of the upload
+
+        Returns:
+            The queued IngestJob
+
+        Raises:
+            UploadTooLargeError: If the upload exceeds `max_bytes`; nothing is queued
+        """
+        await self.start()
+        job_id = uuid.uuid4().hex
+        path = await asyncio.to_thread(self._spool, job_id, filename, contents, max_bytes)
+        job = IngestJob(
+            id=job_id,
+            business_profile_id=business_profile_id,
+            namespace=namespace,
+            filename=filename,
+            path=path,
+            kind=kind,
+            document_id=document_id
+        )
+        await asyncio.to_thread(self._insert, job)
+        self._enqueue(job)
+        logger.info(f"Queued {kind} job {job.id} for {filename} ({os.path.getsize(path)} bytes) in namespace: {namespace}")
+        return job
+
+    def _enqueue(self, job: IngestJob):
+        self.jobs[job.id] = job
+        if self._active[job.business_profile_id] < self.tenant_concurrency:
+            self._active[job.business_profile_id] += 1
+            self._queue.put_nowait(job)
+        else:
+            self._backlog[job.business_profile_id].append(job)
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        """A job of this process, or the saved state of a job of any process"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        db = self.session_factory()
+        try:
+            record = db.get(IngestJobRecord, job_id)
+            return IngestJob.from_record(record) if record is not None else None
+        finally:
+            db.close()
+
+    def _insert(self, job: IngestJob):
+        db = self.session_factory()
+        try:
+            db.add(IngestJobRecord(
+                id=job.id,
+                business_profile_id=job.business_profile_id,
+                namespace=job.namespace,
+                filename=job.filename,
+                path=job.path,
+                kind=job.kind,
+                document_id=job.document_id,
+                created_at=job.created_at,
+                claimed_by=self.worker_id,
+                heartbeat_at=datetime.utcnow(),
+                **job.state()
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def _save(self, jobs: List[IngestJob]):
+        """Save the state of jobs held by this process, renewing the claim on them"""
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            for job in jobs:
+                # A periodic save that ran late must not undo the final save of a job
+                db.query(IngestJobRecord).filter(
+                    IngestJobRecord.id == job.id,
+                    IngestJobRecord.claimed_by == self.worker_id,
+                    IngestJobRecord.status.in_(UNFINISHED)
+                ).update({**job.state(), "heartbeat_at": now}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim_abandoned(self) -> List[IngestJob]:
+        """Claim unfinished jobs whose process stopped renewing its claim"""
+        db = self.session_factory()
+        claimed = []
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.lease)
+            abandoned = db.query(IngestJobRecord).filter(
+                IngestJobRecord.status.in_(UNFINISHED),
+                or_(IngestJobRecord.heartbeat_at.is_(None), IngestJobRecord.heartbeat_at < cutoff)
+            ).order_by(IngestJobRecord.created_at).all()
+            for record in abandoned:
+                # Only one of the processes claiming a job at the same time matches the old claim
+                updated = db.query(IngestJobRecord).filter(
+                    IngestJobRecord.id == record.id,
+                    _equals(IngestJobRecord.claimed_by, record.claimed_by),
+                    _equals(IngestJobRecord.heartbeat_at, record.heartbeat_at)
+                ).update({
+                    "claimed_by": self.worker_id,
+                    "heartbeat_at": datetime.utcnow(),
+                    "status": "queued",
+                    "stage": "queued",
+                    "progress": {"chunking": 0, "embedding": 0, "upserting": 0}
+                }, synchronize_session=False)
+                db.commit()
+                if updated:
+                    db.refresh(record)
+                    claimed.append(IngestJob.from_record(record))
+        finally:
+            db.close()
+        return claimed
+
+    def _fail_lost(self, job: IngestJob):
+        """Fail a claimed job whose upload is gone, and the catalog document it was ingesting"""
+        db = self.session_factory()
+        try:
+            document = db.get(KnowledgeDocument, job.document_id) if job.document_id else db.query(KnowledgeDocument).filter(
+                KnowledgeDocument.business_profile_id == job.business_profile_id,
+                KnowledgeDocument.filename == job.filename
+            ).first()
+            if document is not None and document.status == "processing":
+                document.status = "failed"
+                document.error = job.error
+            db.query(IngestJobRecord).filter(IngestJobRecord.id == job.id).update(job.state(), synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _release_all(self, job_ids: List[str]):
+        """Hand this process's unfinished jobs back, for the next process to claim at once"""
+        db = self.session_factory()
+        try:
+            db.query(IngestJobRecord).filter(
+                IngestJobRecord.id.in_(job_ids),
+                IngestJobRecord.claimed_by == self.worker_id,
+                IngestJobRecord.status.in_(UNFINISHED)
+            ).update({"claimed_by": None, "heartbeat_at": None}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                if self.jobs:
+                    await asyncio.to_thread(self._save, list(self.jobs.values()))
+                for job in await asyncio.to_thread(self._claim_abandoned):
+                    if os.path.exists(job.path):
+                        logger.info(f"Resuming ingest job {job.id} for {job.filename}")
+                        self._enqueue(job)
+                        continue
+                    job.status = job.stage = "failed"
+                    job.error = "The uploaded file is no longer available, please upload it again"
+                    job.finished_at = datetime.utcnow()
+                    await asyncio.to_thread(self._fail_lost, job)
+                    logger.error(f"Ingest job {job.id} lost its spooled upload {job.path}")
+            except Exception as e:
+                logger.error(f"Syncing ingest jobs failed: {str(e)}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._release(job.business_profile_id)
+                self._queue.task_done()
+
+    def _release(self, business_profile_id: int):
+        """Hand the tenant's slot to its next waiting job, or free it"""
+        backlog = self._backlog[business_profile_id]
+        if backlog:
+            self._queue.put_nowait(backlog.popleft())
+        else:
+            del self._backlog[business_profile_id]
+            self._active[business_profile_id] -= 1
+            if not self._active[business_profile_id]:
+                del self._active[business_profile_id]
+
+    async def _run(self, job: IngestJob):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        logger.info(f"Ingest job {job.id} started for {job.filename}")
+        await asyncio.to_thread(self._save, [job])
+        try:
+            job.report = await self.handler(job)
+            job.stage = "done"
+            job.status = "done"
+            logger.info(f"Ingest job {job.id} finished: {job.report}")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Ingest job {job.id} failed at stage {job.stage}: {str(e)}", exc_info=True)
+
+        # A cancelled job (the process is stopping) never gets here and keeps its upload
+        job.finished_at = datetime.utcnow()
+        await asyncio.to_thread(self._save, [job])
+        del self.jobs[job.id]
+        try:
+            os.remove(job.path)
+        except OSError:
+            logger.warning(f"Could not remove spooled upload {job.path}")
+
+    async def join(self):
+        """Wait until every queued job has been ingested"""
+        if self._queue is not None:
+            # A finished job moves its tenant's next job onto the queue before it is marked
+            # done, so the backlog is drained too
+            await self._queue.join()
+
+    async def shutdown(self):
+        """Stop the workers; unfinished jobs keep their uploads and are handed back"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.jobs:
+            await asyncio.to_thread(self._release_all, list(self.jobs))
+            logger.info(f"Handed back {len(self.jobs)} unfinished ingest jobs")
+        self.jobs.clear()
+        self._active.clear()
+        self._backlog.clear()
+
+
+async def run_snapshot_import(job: IngestJob) -> Dict:
+    """Import a spooled knowledge snapshot and catalog its documents, without any embedding calls"""
+    job.advance("importing")
+    with open(job.path, "rb") as f:
+        snapshot_model = (await asyncio.to_thread(read_header, f)).model
+
+    db = SessionLocal()
+    try:
+        business_profile = db.query(BusinessProfile).filter(BusinessProfile.id == job.business_profile_id).first()
+        if business_profile is None:
+            raise ValueError("Business profile not found")
+        # Checked again here, the knowledge base may have been built since the upload
+        knowledge_base = business_profile.knowledge_base or {}
+        check_snapshot_model(knowledge_base, snapshot_model)
+        report = await asyncio.to_thread(import_snapshot, job.path, job.namespace)
+
+        job.advance("cataloguing")
+        business_profile.knowledge_base = {**knowledge_base, **snapshot_model.as_dict(), "namespace": job.namespace}
+        await restore_documents(db, business_profile.id, job.namespace, report.documents, snapshot_model)
+    finally:
+        db.close()
+
+    # FAQ answers are regenerated from the restored knowledge
+    job.advance("refreshing_faq")
+    await asyncio.to_thread(refresh_faq_for_business, job.business_profile_id)
+    return report.as_dict()
+
+
+async def run_ingest_job(job: IngestJob) -> Dict:
+    """Parse a spooled upload and store it as a catalogued knowledge document"""
+    if job.kind == "snapshot":
+        return await run_snapshot_import(job)
+    job.advance("parsing")
+    with open(job.path, "rb") as f:
+        contents = await asyncio.to_thread(f.read)
+    text = await asyncio.to_thread(extract_text, job.filename, contents)
+    if not text:
+        raise ValueError("Could not extract text from file")
+    logger.info(f"Text extracted from {job.filename}, length: {len(text)} characters")
+
+    db = SessionLocal()
+    try:
+        business_profile = db.query(BusinessProfile).filter(BusinessProfile.id == job.business_profile_id).first()
+        if business_profile is None:
+            raise ValueError("Business profile not found")
+        document = get_document(db, job.business_profile_id, job.document_id) if job.document_id else None
+        if job.document_id and document is None:
+            raise ValueError("Document not found")
+        report = await ingest_document(
+            db,
+            job.business_profile_id,
+            job.namespace,
+            job.filename,
+            text,
+            contents,
+            document=document,
+            progress=job.advance,
+            embedding_model=embedding_model_for(business_profile.knowledge_base)
+        )
+
+        # Keep the business profile's knowledge base reference, and its tenant settings
+        business_profile.knowledge_base = {
+            **(business_profile.knowledge_base or {}),
+            "id": report.document_id,
+            "namespace": job.namespace
+        }
+        db.commit()
+    finally:
+        db.close()
+
+    # Regenerate the FAQ answers whose knowledge changed
+    if report.added or report.removed:
+        job.advance("refreshing_faq")
+        await asyncio.to_thread(refresh_faq_for_business, job.business_profile_id)
+    return report.as_dict()
+
+
+ingestion_queue = IngestionQueue(run_ingest_job)
@@ -0,0 +1,128 @@
+from typing import Optional, Tuple
+import numpy as np
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class IVFIndex:
+    """
+    Inverted file index over the rows of a LocalNamespace
+
+    Rows are partitioned by their nearest centroid (spherical k-means on a sample of the
+    rows) and a query only scans the rows of the `nprobe` partitions whose centroids are
+    most similar to it. Inserted rows join the partition of their nearest centroid; the
+    partition of every row is kept by the namespace and bound to `assignments`.
+
+    Partitions are laid out as one array of rows ordered by partition plus partition
+    offsets. Rows appended after the layout was built are matched against the probed
+    partitions directly, and the layout is rebuilt once they make up a noticeable share.
+    """
+
+    TRAINING_ITERATIONS = 10
+    # k-means runs on a sample of this many rows per partition
+    SAMPLES_PER_PARTITION = 32
+    # Rows assigned to partitions at a time, bounds the temporary similarity matrix
+    BLOCK_ROWS = 4096
+    # Rows outside the layout that trigger rebuilding it, at least this many or an eighth of it
+    LAYOUT_TAIL_ROWS = 4096
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        nprobe: int = 16,
+        trained_size: int = 0,
+        assignments: Optional[np.ndarray] = None,
+        order: Optional[np.ndarray] = None,
+        offsets: Optional[np.ndarray] = None
+    ):
+        self.centroids = centroids
+        self.nprobe = nprobe
+        self.trained_size = trained_size
+        # Partition of every row, may be a read-only memory map
+        self.assignments = assignments if assignments is not None else np.empty(0, dtype=np.int32)
+        # Order and offsets are swapped together, queries may read them from several threads
+        self._layout: Tuple[Optional[np.ndarray], Optional[np.ndarray]] = (order, offsets)
+
+    @property
+    def order(self) -> Optional[np.ndarray]:
+        return self._layout[0]
+
+    @property
+    def offsets(self) -> Optional[np.ndarray]:
+        return self._layout[1]
+
+    @property
+    def partitions(self) -> int:
+        return len(self.centroids)
+
+    @staticmethod
+    def partitions_for(count: int) -> int:
+        return max(1, int(np.sqrt(count)))
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, rows: np.ndarray, nprobe: int = 16, seed: int = 0) -> "IVFIndex":
+        """Cluster the given (normalized) rows of `matrix`; the rows are not assigned yet"""
+        rng = np.random.default_rng(seed)
+        size = len(rows)
+        partitions = min(cls.partitions_for(size), size)
+        sample_size = min(size, partitions * cls.SAMPLES_PER_PARTITION)
+        sample = np.asarray(matrix[np.sort(rng.choice(rows, sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, partitions, replace=False)].copy()
+
+        for _ in range(cls.TRAINING_ITERATIONS):
+            labels = cls._nearest(sample, centroids)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=partitions)
+            present = np.flatnonzero(counts)
+            sums = np.zeros_like(centroids)
+            sums[present] = np.add.reduceat(sample[order], np.concatenate(([0], np.cumsum(counts)[:-1]))[present])
+            # Re-seed partitions that lost all their rows
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+            centroids = _normalize_rows(sums).astype(np.float32)
+
+        return cls(centroids, nprobe=nprobe, trained_size=size)
+
+    @classmethod
+    def _nearest(cls, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), cls.BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + cls.BLOCK_ROWS], dtype=np.float32)
+            labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+    def assign(self, values: np.ndarray) -> np.ndarray:
+        """Partition of each of the (normalized) `values`"""
+        return self._nearest(values, self.centroids)
+
+    def partition_layout(self, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows ordered by partition and the offset of each partition in that order"""
+        layout = self._layout
+        laid_out = len(layout[0]) if layout[0] is not None else 0
+        if layout[0] is None or laid_out > size or size - laid_out > max(self.LAYOUT_TAIL_ROWS, laid_out // 8):
+            assignments = self.assignments[:size]
+            layout = (
+                np.argsort(assignments, kind="stable").astype(np.int64),
+                np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=self.partitions)))).astype(np.int64)
+            )
+            self._layout = layout
+        return layout
+
+    def candidates(self, query: np.ndarray, size: int, nprobe: Optional[int] = None, deleted: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows in the partitions nearest to the (normalized) query, in row order, skipping `deleted` ones"""
+        nprobe = min(nprobe or self.nprobe, self.partitions)
+        order, offsets = self.partition_layout(size)
+        similarity = self.centroids @ query
+        probes = np.argpartition(-similarity, nprobe - 1)[:nprobe]
+        rows = [order[offsets[p]:offsets[p + 1]] for p in probes]
+        if size > len(order):
+            rows.append(len(order) + np.flatnonzero(np.isin(self.assignments[len(order):size], probes)))
+        rows = np.concatenate(rows)
+        if deleted is not None:
+            rows = rows[~deleted[rows]]
+        return np.sort(rows)
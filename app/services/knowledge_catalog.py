@@ -0,0 +1,185 @@
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import asyncio
+from sqlalchemy.orm import Session
+from app.models.knowledge import KnowledgeDocument, KnowledgeChunk
+from .embedding_batcher import make_document_id
+from .embedding_models import DEFAULT_EMBEDDING_MODEL, EmbeddingModel, embedding_model_for
+from .vector_store import IngestReport, ProgressCallback, delete_chunks, store_embeddings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def file_hash(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+
+def list_documents(db: Session, business_profile_id: int) -> List[KnowledgeDocument]:
+    return db.query(KnowledgeDocument).filter(
+        KnowledgeDocument.business_profile_id == business_profile_id
+    ).order_by(KnowledgeDocument.created_at).all()
+
+
+def get_document(db: Session, business_profile_id: int, document_id: int) -> Optional[KnowledgeDocument]:
+    return db.query(KnowledgeDocument).filter(
+        KnowledgeDocument.id == document_id,
+        KnowledgeDocument.business_profile_id == business_profile_id
+    ).first()
+
+
+async def ingest_document(
+    db: Session,
+    business_profile_id: int,
+    namespace: str,
+    filename: str,
+    text: str,
+    contents: bytes,
+    document: Optional[KnowledgeDocument] = None,
+    progress: Optional[ProgressCallback] = None,
+    embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL
+) -> IngestReport:
+    """
+    Store a document's chunks and record them in the catalog
+    
+    A file with the same name as an existing document replaces it: only its new or changed
+    chunks are embedded and its removed chunks are deleted from the vector store by ID.
+    Re-uploading identical bytes is a no-op.
+    
+    Args:
+        db: Database session
+        business_profile_id: Owner of the knowledge base
+        namespace: Vector namespace of the knowledge base
+        filename: Name of the uploaded file
+        text: Text extracted from the file
+        contents: Raw bytes of the file, hashed to detect unchanged uploads
+        document: Document to replace; defaults to the document with the same file name
+        progress: Optional callback reporting the progress of each ingest stage
+        embedding_model: Model the namespace was built with
+        
+    Returns:
+        The IngestReport of the upload
+    """
+    if document is None:
+        document = db.query(KnowledgeDocument).filter(
+            KnowledgeDocument.business_profile_id == business_profile_id,
+            KnowledgeDocument.filename == filename
+        ).first()
+    digest = file_hash(contents)
+    
+    if document is not None and document.status == "ready" and document.file_hash == digest:
+        logger.info(f"Document {document.filename} is unchanged, skipping ingest")
+        return IngestReport(document_id=document.document_id, reused=document.chunk_count)
+    
+    # Chunk IDs of catalogued documents come from the catalog, so the vector store isn't
+    # listed; new documents may still have vectors from uploads made before the catalog
+    existing_ids = None
+    if document is None:
+        document = KnowledgeDocument(
+            business_profile_id=business_profile_id,
+            namespace=namespace,
+            document_id=make_document_id(namespace, filename),
+            filename=filename
+        )
+        db.add(document)
+    else:
+        existing_ids = [chunk.vector_id for chunk in document.chunks]
+    document.file_hash = digest
+    document.size_bytes = len(contents)
+    document.status = "processing"
+    document.error = None
+    db.commit()
+    
+    try:
+        report = await store_embeddings(
+            text,
+            namespace=namespace,
+            source=document.filename,
+            existing_ids=existing_ids,
+            progress=progress,
+            embedding_model=embedding_model
+        )
+    except Exception as e:
+        document.status = "failed"
+        document.error = str(e)
+        db.commit()
+        raise
+    
+    document.chunks = [KnowledgeChunk(**chunk) for chunk in report.chunks]
+    document.chunk_count = len(report.chunks)
+    document.status = "ready"
+    db.commit()
+    logger.info(f"Catalogued document {document.filename} ({document.document_id}) with {document.chunk_count} chunks")
+    return report
+
+
+async def delete_document(db: Session, document: KnowledgeDocument) -> int:
+    """
+    Delete a document's vectors by ID, then its catalog entry
+    
+    Returns:
+        Number of vectors deleted
+    """
+    vector_ids = [chunk.vector_id for chunk in document.chunks]
+    deleted = 0
+    if vector_ids:
+        embedding_model = embedding_model_for(document.business_profile.knowledge_base)
+        deleted = await asyncio.to_thread(delete_chunks, vector_ids, document.namespace, embedding_model)
+    db.delete(document)
+    db.commit()
+    logger.info(f"Deleted document {document.filename} ({document.document_id}) and {deleted} vectors")
+    return deleted
+
+
+async def restore_documents(
+    db: Session,
+    business_profile_id: int,
+    namespace: str,
+    documents: Dict[str, Dict],
+    embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL
+) -> List[KnowledgeDocument]:
+    """
+    Catalog the documents of an imported snapshot (see knowledge_snapshot.import_snapshot)
+    
+    A catalogued document with the same file name is replaced, and its chunks that are not
+    in the snapshot are deleted. The uploaded bytes aren't part of a snapshot, so restored
+    documents have no file hash: the next upload of the file goes through ingest again,
+    reusing the embeddings of all unchanged chunks.
+    
+    Args:
+        db: Database session
+        business_profile_id: Owner of the knowledge base
+        namespace: Namespace the snapshot was imported into
+        documents: {document_id: {"filename", "chunks": [{"vector_id", "chunk_index"}]}}
+        embedding_model: Model of the imported vectors
+        
+    Returns:
+        The restored documents
+    """
+    restored = []
+    for document_id, imported in documents.items():
+        chunks = sorted(imported["chunks"], key=lambda chunk: chunk["chunk_index"])
+        document = db.query(KnowledgeDocument).filter(
+            KnowledgeDocument.business_profile_id == business_profile_id,
+            KnowledgeDocument.filename == imported["filename"]
+        ).first()
+        if document is None:
+            document = KnowledgeDocument(business_profile_id=business_profile_id, filename=imported["filename"])
+            db.add(document)
+        else:
+            stale_ids = sorted({chunk.vector_id for chunk in document.chunks} - {chunk["vector_id"] for chunk in chunks})
+            if stale_ids:
+                await asyncio.to_thread(delete_chunks, stale_ids, document.namespace, embedding_model)
+        document.namespace = namespace
+        document.document_id = document_id
+        document.file_hash = ""
+        document.size_bytes = 0
+        document.status = "ready"
+        document.error = None
+        document.chunks = [KnowledgeChunk(vector_id=chunk["vector_id"], chunk_index=index) for index, chunk in enumerate(chunks)]
+        document.chunk_count = len(chunks)
+        restored.append(document)
+    db.commit()
+    logger.info(f"Restored {len(restored)} documents from a snapshot in namespace: {namespace}")
+    return restored
@@ -0,0 +1,351 @@
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+import logging
+from .bm25_index import bm25_index
+from .chunk_store import chunk_store
+from .embedding_batcher import make_document_id
+from .embedding_models import DEFAULT_EMBEDDING_MODEL, EmbeddingModel, embedding_model_for, get_embedding_model
+from .vector_backends import VectorStore, create_vector_store, get_vector_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Snapshot file layout, all little-endian:
+#   8 bytes   magic
+#   4 bytes   uint32 length of the JSON header
+#   n bytes   JSON header (SnapshotHeader), space padded
+#   padding   up to vectors_offset, a multiple of 64
+#   block     count x dimensions embedding matrix, row-major float32 or float16
+#   records   one JSON line per row: {"id", "metadata", "text", "chunk"}
+# The embedding block can be memory-mapped directly and the file is read front to back,
+# so it also works as a stream.
+SNAPSHOT_MAGIC = b"KBSNAP\x00\x01"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DTYPES = ("float32", "float16")
+SNAPSHOT_ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sI")
+
+# Vectors fetched from the backend (export) or upserted into it (import) at a time
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "500"))
+# Largest snapshot accepted for import
+SNAPSHOT_MAX_BYTES = int(float(os.getenv("SNAPSHOT_MAX_MB", "1024")) * 1024 * 1024)
+
+
+@dataclass
+class SnapshotHeader:
+    """Describes a namespace snapshot and where its sections start"""
+    namespace: str
+    embedding_model: str
+    embedding_dimensions: int
+    dtype: str
+    count: int
+    vectors_offset: int = 0
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    version: int = SNAPSHOT_VERSION
+
+    @property
+    def model(self) -> EmbeddingModel:
+        return get_embedding_model(self.embedding_model, self.embedding_dimensions)
+
+    @property
+    def records_offset(self) -> int:
+        return self.vectors_offset + self.count * self.embedding_dimensions * np.dtype(self.dtype).itemsize
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass
+class ImportReport:
+    """Outcome of importing a snapshot"""
+    namespace: str
+    embedding_model: EmbeddingModel
+    vectors: int = 0
+    texts: int = 0
+    # Chunks per document for the knowledge catalog: {document_id: {"filename", "chunks": [...]}}
+    documents: Dict[str, Dict] = field(default_factory=dict, repr=False)
+
+    def as_dict(self) -> Dict:
+        return {"namespace": self.namespace, "vectors": self.vectors, "texts": self.texts, "documents": len(self.documents), **self.embedding_model.as_dict()}
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+def _encode_header(header: SnapshotHeader, length: Optional[int] = None) -> bytes:
+    """Magic, header length and JSON header, padded to `length` bytes of JSON"""
+    data = json.dumps(header.as_dict()).encode("utf-8")
+    if length is not None:
+        if len(data) > length:
+            raise ValueError("Snapshot header grew beyond its reserved space")
+        data = data.ljust(length)
+    return _PREFIX.pack(SNAPSHOT_MAGIC, len(data)) + data
+
+
+def read_header(f: IO[bytes]) -> SnapshotHeader:
+    """
+    Read and validate the header at the start of a snapshot stream
+
+    Raises:
+        ValueError: If the stream isn't a snapshot this version can read
+    """
+    prefix = f.read(_PREFIX.size)
+    if len(prefix) < _PREFIX.size:
+        raise ValueError("Not a knowledge snapshot: file is too short")
+    magic, length = _PREFIX.unpack(prefix)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Not a knowledge snapshot: bad magic bytes")
+    try:
+        header = SnapshotHeader(**json.loads(f.read(length)))
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Corrupt snapshot header: {str(e)}")
+    if header.version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {header.version}")
+    if header.dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Unsupported snapshot dtype {header.dtype}")
+    return header
+
+
+def check_snapshot_model(knowledge_base: Optional[Dict], model: EmbeddingModel):
+    """
+    Queries are embedded with a knowledge base's model, so a snapshot imported into an
+    existing knowledge base (one with a namespace) must have been embedded with the same one
+
+    Raises:
+        ValueError: If the models differ
+    """
+    knowledge_base = knowledge_base or {}
+    if knowledge_base.get("namespace") and embedding_model_for(knowledge_base) != model:
+        raise ValueError(
+            f"Snapshot embeddings ({model.key}) don't match the knowledge base's ({embedding_model_for(knowledge_base).key})"
+        )
+
+
+class SnapshotReader:
+    """
+    Read-only view of a snapshot file: the embedding block is a memory map, so opening a
+    snapshot costs no reads and only the rows that are used are paged in
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.header = read_header(f)
+        shape = (self.header.count, self.header.embedding_dimensions)
+        if self.header.count:
+            self.vectors = np.memmap(path, dtype=np.dtype(self.header.dtype).newbyteorder("<"), mode="r", offset=self.header.vectors_offset, shape=shape)
+        else:
+            self.vectors = np.empty(shape, dtype=self.header.dtype)
+
+    def __len__(self) -> int:
+        return self.header.count
+
+    def records(self) -> Iterator[Dict]:
+        """Chunk records in row order"""
+        with open(self.path, "rb") as f:
+            f.seek(self.header.records_offset)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def batches(self, size: int = SNAPSHOT_BATCH_SIZE) -> Iterator[Tuple[List[Dict], np.ndarray]]:
+        """Records with their embeddings as float32 rows, `size` at a time"""
+        records = []
+        start = 0
+        for record in self.records():
+            records.append(record)
+            if len(records) == size:
+                yield records, np.asarray(self.vectors[start:start + size], dtype=np.float32)
+                start += size
+                records = []
+        if records:
+            yield records, np.asarray(self.vectors[start:start + len(records)], dtype=np.float32)
+        if start + len(records) != self.header.count:
+            raise ValueError(f"Snapshot has {start + len(records)} records for {self.header.count} vectors")
+
+
+def export_namespace(
+    namespace: str,
+    path: str,
+    embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL,
+    dtype: str = "float32",
+    store: Optional[VectorStore] = None
+) -> SnapshotHeader:
+    """
+    Write every vector of a namespace, with its chunk text, to a snapshot file
+
+    Vectors are fetched from the backend in batches and streamed to disk, so the
+    namespace never has to fit in memory. The file is written under a temporary name
+    and renamed into place when complete.
+
+    Args:
+        namespace: Namespace to export
+        path: Snapshot file to write
+        embedding_model: Model the namespace was built with (see embedding_model_for)
+        dtype: "float32", or "float16" for half the size (cosine error around 1e-4)
+        store: Vector store to read from; defaults to the namespace's backend
+
+    Returns:
+        The header of the written snapshot
+    """
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Unsupported snapshot dtype {dtype!r}, expected one of {', '.join(SNAPSHOT_DTYPES)}")
+    store = store or get_vector_store(namespace, embedding_model.dimensions)
+    ids = store.list_ids("", namespace)
+    header = SnapshotHeader(
+        namespace=namespace or "",
+        embedding_model=embedding_model.name,
+        embedding_dimensions=embedding_model.dimensions,
+        dtype=dtype,
+        count=len(ids)
+    )
+    # Reserve the header's space up front, with room for the offset's digits; it is
+    # rewritten with the final count at the end
+    header_length = len(json.dumps(header.as_dict()).encode("utf-8")) + 32
+    header.vectors_offset = _aligned(_PREFIX.size + header_length)
+    logger.info(f"Exporting {len(ids)} vectors of namespace {namespace} as {dtype}")
+
+    tmp_path = f"{path}.tmp"
+    written = 0
+    with open(tmp_path, "wb") as f, tempfile.TemporaryFile() as records:
+        f.write(b"\0" * header.vectors_offset)
+        for start in range(0, len(ids), SNAPSHOT_BATCH_SIZE):
+            vectors = store.fetch(ids[start:start + SNAPSHOT_BATCH_SIZE], namespace)
+            if not vectors:
+                continue
+            block = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+            if block.shape[1] != embedding_model.dimensions:
+                raise ValueError(f"Namespace {namespace} has {block.shape[1]}-dimensional vectors, expected {embedding_model.dimensions}")
+            f.write(block.astype(np.dtype(dtype).newbyteorder("<")).tobytes())
+            texts = chunk_store.get_many([vector["id"] for vector in vectors], namespace, remember=False)
+            for vector in vectors:
+                text = texts.get(vector["id"], {})
+                records.write(json.dumps({
+                    "id": vector["id"],
+                    "metadata": vector["metadata"] or {},
+                    "text": text.get("text"),
+                    "chunk": text.get("metadata")
+                }).encode("utf-8") + b"\n")
+            written += len(vectors)
+        records.seek(0)
+        shutil.copyfileobj(records, f)
+        # Vectors deleted while exporting are left out, record the final count
+        header.count = written
+        f.seek(0)
+        f.write(_encode_header(header, header_length))
+    os.replace(tmp_path, path)
+    logger.info(f"Exported {written} vectors of namespace {namespace} to {path}")
+    return header
+
+
+def _rebase_record(record: Dict, namespace: str) -> Dict:
+    """
+    Move a document chunk to another namespace: chunk IDs start with a document ID derived
+    from the namespace, so they are rewritten to the IDs a re-upload there would produce
+    """
+    chunk = record.get("chunk") or {}
+    document_id = chunk.get("document_id") or record["metadata"].get("document_id")
+    source = chunk.get("source")
+    if not document_id or not source or not record["id"].startswith(f"{document_id}#"):
+        return record
+    new_document_id = make_document_id(namespace, source)
+    record = dict(record)
+    record["id"] = new_document_id + record["id"][len(document_id):]
+    record["metadata"] = {**record["metadata"], "document_id": new_document_id}
+    if record.get("chunk"):
+        record["chunk"] = {**record["chunk"], "document_id": new_document_id}
+    return record
+
+
+def import_snapshot(path: str, namespace: Optional[str] = None, store: Optional[VectorStore] = None) -> ImportReport:
+    """
+    Load a snapshot into a namespace without calling the embeddings API
+
+    Vectors are upserted into the vector store, their texts into the chunk store and the
+    keyword index. Existing vectors with other IDs are kept.
+
+    Args:
+        path: Snapshot file to read
+        namespace: Target namespace; defaults to the namespace the snapshot was taken of
+        store: Vector store to write to; defaults to the namespace's backend
+
+    Returns:
+        An ImportReport with the counts and the chunks of each document
+    """
+    reader = SnapshotReader(path)
+    header = reader.header
+    namespace = header.namespace if namespace is None else namespace
+    report = ImportReport(namespace=namespace, embedding_model=header.model)
+    store = store or get_vector_store(namespace, header.embedding_dimensions)
+    logger.info(f"Importing {header.count} vectors from {path} into namespace {namespace}")
+
+    for records, block in reader.batches():
+        if namespace != header.namespace:
+            records = [_rebase_record(record, namespace) for record in records]
+        texts = [record.get("text") or record["metadata"].get("text") for record in records]
+        chunk_store.put(
+            [(record["id"], record["text"], record.get("chunk") or {}) for record in records if record.get("text") is not None],
+            namespace=namespace
+        )
+        store.upsert(
+            [{"id": record["id"], "values": values.tolist(), "metadata": record["metadata"]} for record, values in zip(records, block)],
+            namespace=namespace
+        )
+        bm25_index.add(
+            [(record["id"], text, record["metadata"]) for record, text in zip(records, texts) if text],
+            namespace=namespace
+        )
+        report.vectors += len(records)
+        report.texts += sum(1 for record in records if record.get("text") is not None)
+        for record in records:
+            chunk = record.get("chunk") or {}
+            if chunk.get("document_id") and chunk.get("source"):
+                document = report.documents.setdefault(chunk["document_id"], {"filename": chunk["source"], "chunks": []})
+                document["chunks"].append({"vector_id": record["id"], "chunk_index": chunk.get("chunk_index", len(document["chunks"]))})
+
+    logger.info(f"Imported {report.vectors} vectors and {report.texts} chunk texts into namespace {namespace}")
+    return report
+
+
+if __name__ == "__main__":
+    # python -m app.services.knowledge_snapshot export business_1 business_1.kbsnap [--dtype float16]
+    # python -m app.services.knowledge_snapshot import business_1.kbsnap [--namespace business_2]
+    import app.models
+    import app.models.user_subscription
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export and import knowledge namespace snapshots")
+    parser.add_argument("--backend", help="Vector backend to use instead of the namespace's configured one")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("namespace")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default="float32")
+    export_parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL.name)
+    export_parser.add_argument("--embedding-dimensions", type=int)
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--namespace")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        model = get_embedding_model(args.embedding_model, args.embedding_dimensions)
+        store = create_vector_store(args.backend, model.dimensions) if args.backend else None
+        print(json.dumps(export_namespace(args.namespace, args.path, model, args.dtype, store).as_dict()))
+    else:
+        with open(args.path, "rb") as f:
+            dimensions = read_header(f).embedding_dimensions
+        store = create_vector_store(args.backend, dimensions) if args.backend else None
+        print(json.dumps(import_snapshot(args.path, args.namespace, store).as_dict()))
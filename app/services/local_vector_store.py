@@ -0,0 +1,808 @@
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import logging
+from .ivf_index import IVFIndex
+from .quantization import QuantizedMatrix, check_precision
+from .vector_backends import DEFAULT_DIMENSION, Match, VectorStore
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Name of the file pointing at a namespace's current version directory
+CURRENT_VERSION_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _load_array(path: str) -> np.ndarray:
+    """Memory-map a .npy file; empty arrays can't be mapped and are read instead"""
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+
+class RowArray:
+    """
+    Append-only rows of one column of a namespace: an in-memory buffer with spare capacity,
+    or a raw file that rows are appended to and that is memory-mapped up to `count` rows.
+
+    Rows in the file past `count` belong to no published version (their writer stopped
+    before publishing them) and are overwritten by the next append.
+    """
+
+    def __init__(self, dtype, row_shape: Tuple[int, ...] = (), path: Optional[str] = None, count: int = 0):
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.path = path
+        self.count = count
+        self._buffer = np.empty((0,) + self.row_shape, dtype=self.dtype)
+        if path is not None:
+            self._map()
+
+    @property
+    def array(self) -> np.ndarray:
+        return self._buffer[:self.count]
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dtype.itemsize * int(np.prod(self.row_shape, dtype=np.int64))
+
+    def _map(self):
+        if self.count:
+            self._buffer = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(self.count,) + self.row_shape)
+
+    def append(self, values: np.ndarray):
+        values = np.ascontiguousarray(values, dtype=self.dtype).reshape((-1,) + self.row_shape)
+        if self.path is not None:
+            with open(self.path, "r+b" if os.path.exists(self.path) else "w+b") as f:
+                f.truncate(self.count * self.row_bytes)
+                f.seek(self.count * self.row_bytes)
+                f.write(values.tobytes())
+            self.count += len(values)
+            self._map()
+            return
+
+        required = self.count + len(values)
+        if required > len(self._buffer):
+            buffer = np.empty((max(required, 2 * len(self._buffer), 64),) + self.row_shape, dtype=self.dtype)
+            buffer[:self.count] = self._buffer[:self.count]
+            self._buffer = buffer
+        self._buffer[self.count:required] = values
+        self.count = required
+
+    def view(self, copy: bool = False) -> "RowArray":
+        """
+        The current rows as an in-memory RowArray that later appends to this one don't
+        change; appending to the view copies its rows into a buffer of its own first
+        """
+        view = RowArray(self.dtype, self.row_shape)
+        view._buffer = self.array.copy() if copy else self.array
+        view.count = self.count
+        return view
+
+
+class MappedValues(Sequence):
+    """Read-only list of values encoded back to back in a byte array, with the end offset of each"""
+
+    def __init__(self, ends: np.ndarray, data: np.ndarray):
+        self.ends = ends
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def raw(self, row: int) -> bytes:
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        start = self.ends[row - 1] if row else 0
+        return self.data[start:self.ends[row]].tobytes()
+
+
+class MappedStrings(MappedValues):
+    """Read-only list of strings over (memory-mapped) UTF-8 bytes"""
+
+    def __getitem__(self, row: int) -> str:
+        return self.raw(row).decode("utf-8")
+
+    @staticmethod
+    def encode(value: str) -> bytes:
+        return value.encode("utf-8")
+
+
+class MappedMetadata(MappedValues):
+    """Read-only list of metadata dicts over (memory-mapped) JSON bytes"""
+
+    def __getitem__(self, row: int) -> Dict:
+        return json.loads(self.raw(row))
+
+    @staticmethod
+    def encode(value: Dict) -> bytes:
+        return json.dumps(value).encode("utf-8")
+
+
+class LocalNamespace:
+    """
+    Vectors of one namespace as a contiguous float32 matrix of L2-normalized rows.
+
+    Cosine similarity against every row is then a single matrix-vector product.
+    Rows are append-only: an upsert appends the new vectors and tombstones the rows they
+    replace, a delete tombstones rows, and the namespace is rewritten without tombstones
+    once they make up COMPACT_RATIO of its rows.
+
+    With a float16 or int8 precision, a quantized copy of the matrix is scanned instead
+    and only the best `top_k * rescore_factor` candidates are rescored against the
+    float32 rows, which can then stay on disk behind a memory map.
+
+    Namespaces with at least `ann_threshold` vectors get an IVF index (see ivf_index.py),
+    and queries only score the rows of the partitions nearest to the query. The index is
+    trained when the namespace is rewritten, which happens again once it has grown by
+    RETRAIN_GROWTH.
+
+    The columns (vectors, quantized codes, IDs, metadata, partitions) live in memory, or
+    in the files of a generation directory that LocalVectorStore publishes versions of.
+    Appends only write the new rows, and rewrites go to a new generation from `allocate`.
+    """
+
+    # Fraction of tombstoned rows that triggers a rewrite
+    COMPACT_RATIO = 0.2
+    # The index is retrained when the namespace has grown this much since it was trained
+    RETRAIN_GROWTH = 2.0
+    # Rows copied at a time when the namespace is rewritten
+    BLOCK_ROWS = 4096
+
+    def __init__(
+        self,
+        dimension: int,
+        precision: str = "float32",
+        rescore_factor: int = 4,
+        ann_threshold: int = 50000,
+        ann_probes: int = 16,
+        directory: Optional[str] = None,
+        count: int = 0,
+        deleted_rows: Optional[np.ndarray] = None,
+        ivf: Optional[IVFIndex] = None,
+        allocate: Optional[Callable[[], str]] = None
+    ):
+        self.dimension = dimension
+        self.precision = check_precision(precision)
+        self.rescore_factor = rescore_factor
+        self.ann_threshold = ann_threshold
+        self.ann_probes = ann_probes
+        self.directory = directory
+        self.allocate = allocate
+        self.ivf = ivf
+        self.size = count
+        self.columns = self._open_columns(count)
+        # Tombstones are private to each process, a version stores the deleted row numbers
+        self._deleted = RowArray(bool)
+        self._deleted.append(np.zeros(count, dtype=bool))
+        deleted_rows = deleted_rows if deleted_rows is not None else np.empty(0, dtype=np.int64)
+        self._deleted.array[deleted_rows] = True
+        self.tombstones = len(deleted_rows)
+        self._id_to_row: Optional[Dict[str, int]] = None
+        # Version of the store this namespace was loaded from or last published as
+        self.version: Optional[str] = None
+        self._bind_columns()
+
+    @classmethod
+    def create(cls, dimension: int, directory: Optional[str] = None, ivf: Optional[IVFIndex] = None, **options) -> "LocalNamespace":
+        """An empty namespace; with a directory, its (new) generation's manifest is written first"""
+        ns = cls(dimension, directory=directory, ivf=ivf, **options)
+        if directory:
+            manifest = {"dimension": dimension, "precision": ns.precision, "ivf": None}
+            if ivf is not None:
+                np.save(os.path.join(directory, "centroids.npy"), ivf.centroids)
+                manifest["ivf"] = {"partitions": ivf.partitions, "trained_size": ivf.trained_size}
+            with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+                json.dump(manifest, f)
+        return ns
+
+    @classmethod
+    def open(cls, directory: str, count: int, deleted_rows: np.ndarray, **options) -> "LocalNamespace":
+        """Map the first `count` rows of a generation directory"""
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        ivf = None
+        if manifest["ivf"]:
+            layout = os.path.join(directory, "partition_order.npy")
+            ivf = IVFIndex(
+                _load_array(os.path.join(directory, "centroids.npy")),
+                nprobe=options.get("ann_probes", 16),
+                trained_size=manifest["ivf"]["trained_size"],
+                order=_load_array(layout) if os.path.exists(layout) else None,
+                offsets=_load_array(os.path.join(directory, "partition_offsets.npy")) if os.path.exists(layout) else None
+            )
+        return cls(manifest["dimension"], precision=manifest["precision"], directory=directory, count=count, deleted_rows=deleted_rows, ivf=ivf, **options)
+
+    def snapshot(self) -> "LocalNamespace":
+        """
+        A read-only copy of the namespace as it is now that shares its rows: later appends,
+        tombstones and rewrites of this namespace don't change the snapshot
+        """
+        snapshot = object.__new__(LocalNamespace)
+        vars(snapshot).update(vars(self))
+        snapshot.allocate = None
+        snapshot.columns = {name: column.view() for name, column in self.columns.items()}
+        snapshot._deleted = self._deleted.view(copy=True)
+        snapshot._id_to_row = None
+        if self.ivf is not None:
+            snapshot.ivf = IVFIndex(self.ivf.centroids, nprobe=self.ivf.nprobe, trained_size=self.ivf.trained_size, order=self.ivf.order, offsets=self.ivf.offsets)
+        snapshot._bind_columns()
+        return snapshot
+
+    def _column_specs(self) -> Dict[str, Tuple[str, np.dtype, Tuple[int, ...]]]:
+        """File name, dtype and row shape of every column"""
+        specs = {
+            "vectors": ("vectors.f32", np.float32, (self.dimension,)),
+            "id_ends": ("id_ends.i64", np.int64, ()),
+            "id_data": ("ids.bin", np.uint8, ()),
+            "meta_ends": ("meta_ends.i64", np.int64, ()),
+            "meta_data": ("meta.bin", np.uint8, ()),
+        }
+        if self.precision != "float32":
+            specs["codes"] = ("codes.bin", np.int8 if self.precision == "int8" else np.float16, (self.dimension,))
+        if self.precision == "int8":
+            specs["scales"] = ("scales.f32", np.float32, ())
+        if self.ivf is not None:
+            specs["assignments"] = ("assignments.i32", np.int32, ())
+        return specs
+
+    def _open_columns(self, count: int) -> Dict[str, RowArray]:
+        columns = {}
+        for name, (filename, dtype, row_shape) in self._column_specs().items():
+            path = os.path.join(self.directory, filename) if self.directory else None
+            rows = count
+            if name.endswith("_data"):
+                # Byte columns hold as many bytes as the last end offset of their rows
+                ends = columns[name.replace("_data", "_ends")].array
+                rows = int(ends[-1]) if count else 0
+            columns[name] = RowArray(dtype, row_shape, path, rows)
+        return columns
+
+    def _bind_columns(self):
+        """Point the views used by queries at the current column arrays"""
+        columns = self.columns
+        self.matrix = columns["vectors"].array
+        self.ids = MappedStrings(columns["id_ends"].array, columns["id_data"].array)
+        self.metadata = MappedMetadata(columns["meta_ends"].array, columns["meta_data"].array)
+        self.quantized: Optional[QuantizedMatrix] = None
+        if "codes" in columns:
+            self.quantized = QuantizedMatrix(columns["codes"].array, columns["scales"].array if "scales" in columns else None, self.precision)
+        if self.ivf is not None:
+            self.ivf.assignments = columns["assignments"].array
+
+    def __len__(self) -> int:
+        return self.size - self.tombstones
+
+    @property
+    def deleted(self) -> np.ndarray:
+        return self._deleted.array
+
+    def live_ids(self) -> Iterator[str]:
+        deleted = self.deleted
+        return (self.ids[row] for row in range(self.size) if not deleted[row])
+
+    @property
+    def id_to_row(self) -> Dict[str, int]:
+        # Built on first use, so workers that only query never hold it
+        if self._id_to_row is None:
+            deleted = self.deleted
+            self._id_to_row = {self.ids[row]: row for row in range(self.size) if not deleted[row]}
+        return self._id_to_row
+
+    def _append_encoded(self, column: str, values: List[bytes]):
+        ends = self.columns[f"{column}_ends"]
+        start = int(ends.array[-1]) if ends.count else 0
+        ends.append(start + np.cumsum([len(value) for value in values], dtype=np.int64))
+        self.columns[f"{column}_data"].append(np.frombuffer(b"".join(values), dtype=np.uint8))
+
+    def _append(
+        self,
+        ids: List[bytes],
+        values: np.ndarray,
+        metadata: List[bytes],
+        codes: Optional[np.ndarray] = None,
+        scales: Optional[np.ndarray] = None,
+        assignments: Optional[np.ndarray] = None
+    ):
+        """Append encoded rows; quantized codes and partitions are computed unless given"""
+        self.columns["vectors"].append(values)
+        self._append_encoded("id", ids)
+        self._append_encoded("meta", metadata)
+        if "codes" in self.columns:
+            if codes is None:
+                codes, scales = QuantizedMatrix.encode(values, self.precision)
+            self.columns["codes"].append(codes)
+            if scales is not None:
+                self.columns["scales"].append(scales)
+        if self.ivf is not None:
+            self.columns["assignments"].append(assignments if assignments is not None else self.ivf.assign(values))
+        self._deleted.append(np.zeros(len(values), dtype=bool))
+        self.size += len(values)
+        self._bind_columns()
+
+    def _tombstone(self, rows: List[int]):
+        self.deleted[rows] = True
+        self.tombstones += len(rows)
+
+    def upsert(self, ids: List[str], values: np.ndarray, metadata: List[Dict]):
+        values = _normalize_rows(np.asarray(values, dtype=np.float32))
+        if values.shape[1] != self.dimension:
+            raise ValueError(f"Vector dimension {values.shape[1]} does not match namespace dimension {self.dimension}")
+
+        # The last vector given for an ID wins
+        latest = sorted({vector_id: i for i, vector_id in enumerate(ids)}.values())
+        ids = [ids[i] for i in latest]
+        replaced = [self.id_to_row[vector_id] for vector_id in ids if vector_id in self.id_to_row]
+        start = self.size
+        self._append(
+            [MappedStrings.encode(vector_id) for vector_id in ids],
+            values[latest],
+            [MappedMetadata.encode(metadata[i]) for i in latest]
+        )
+        for offset, vector_id in enumerate(ids):
+            self.id_to_row[vector_id] = start + offset
+        self._tombstone(replaced)
+        self._maintain()
+
+    def delete(self, ids: List[str]) -> int:
+        rows = [self.id_to_row.pop(vector_id) for vector_id in ids if vector_id in self.id_to_row]
+        if rows:
+            self._tombstone(rows)
+            self._maintain()
+        return len(rows)
+
+    def _maintain(self):
+        """Rewrite the namespace when tombstones pile up or the index needs (re)training"""
+        if self.ivf is None and len(self) >= self.ann_threshold:
+            self.rewrite(train=True)
+        elif self.ivf is not None and len(self) >= self.RETRAIN_GROWTH * self.ivf.trained_size:
+            self.rewrite(train=True)
+        elif self.tombstones > self.COMPACT_RATIO * self.size:
+            self.rewrite()
+
+    def rewrite(self, train: bool = False, precision: Optional[str] = None):
+        """
+        Copy the live rows into a new generation (from `allocate`, in memory without it) and
+        continue on that one: drops tombstones, and trains the index or changes the precision
+        """
+        live = np.flatnonzero(~self.deleted)
+        ivf = None
+        if train:
+            logger.info(f"Training IVF index over {len(live)} vectors")
+            ivf = IVFIndex.train(self.matrix, live, nprobe=self.ann_probes)
+        elif self.ivf is not None:
+            ivf = IVFIndex(self.ivf.centroids, nprobe=self.ann_probes, trained_size=self.ivf.trained_size)
+        target = LocalNamespace.create(
+            self.dimension,
+            self.allocate() if self.allocate else None,
+            ivf=ivf,
+            precision=precision or self.precision,
+            rescore_factor=self.rescore_factor,
+            ann_threshold=self.ann_threshold,
+            ann_probes=self.ann_probes,
+            allocate=self.allocate
+        )
+
+        for start in range(0, len(live), self.BLOCK_ROWS):
+            rows = live[start:start + self.BLOCK_ROWS]
+            codes = scales = None
+            if self.quantized is not None and target.precision == self.precision:
+                codes = self.quantized.codes[rows]
+                scales = self.quantized.scales[rows] if self.quantized.scales is not None else None
+            target._append(
+                [self.ids.raw(row) for row in rows],
+                np.asarray(self.matrix[rows]),
+                [self.metadata.raw(row) for row in rows],
+                codes,
+                scales,
+                self.ivf.assignments[rows] if self.ivf is not None and not train else None
+            )
+
+        if target.ivf is not None:
+            # Saved with the generation so workers don't each sort the rows again
+            order, offsets = target.ivf.partition_layout(target.size)
+            if target.directory:
+                np.save(os.path.join(target.directory, "partition_order.npy"), order)
+                np.save(os.path.join(target.directory, "partition_offsets.npy"), offsets)
+        vars(self).update(vars(target))
+
+    def _candidate_scores(self, query: np.ndarray, rows: Optional[np.ndarray], k: int):
+        """Exact scores of the best candidates among `rows` (all live rows when None)"""
+        deleted = self.deleted if self.tombstones and rows is None else None
+        if self.quantized is None:
+            if rows is not None:
+                return rows, self.matrix[rows] @ query
+            scores = self.matrix @ query
+            if deleted is not None:
+                scores[deleted] = -np.inf
+            return np.arange(self.size), scores
+        # Shortlist candidates on the quantized copy, then rescore them at full precision
+        if rows is None:
+            approximate = self.quantized.scores(query, self.size)
+            rows = np.arange(self.size)
+        else:
+            approximate = self.quantized.row_scores(query, rows)
+        if deleted is not None:
+            approximate[deleted] = -np.inf
+        shortlist = min(k * self.rescore_factor, len(rows))
+        rows = np.sort(rows[np.argpartition(-approximate, shortlist - 1)[:shortlist]])
+        scores = self.matrix[rows] @ query
+        if deleted is not None:
+            scores[deleted[rows]] = -np.inf
+        return rows, scores
+
+    def query(self, vector: List[float], top_k: int, include_values: bool = False, nprobe: Optional[int] = None) -> List[Match]:
+        if len(self) == 0 or top_k <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        rows = None
+        if self.ivf is not None:
+            rows = self.ivf.candidates(query, self.size, nprobe, self.deleted if self.tombstones else None)
+            if len(rows) == 0:
+                return []
+        rows, scores = self._candidate_scores(query, rows, min(top_k, len(self)))
+        k = min(top_k, len(self), len(rows))
+        # argpartition finds the top k in linear time, only those k are sorted
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Match(self.ids[rows[i]], float(scores[i]), self.metadata[rows[i]], np.array(self.matrix[rows[i]]) if include_values else None)
+            for i in top
+            if scores[i] > -np.inf
+        ]
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store, an alternative to Pinecone for small and medium tenants
+    and for running without network access.
+
+    Each namespace is persisted under `data_dir/<namespace>/`. Its rows live in the
+    append-only column files of a generation directory `g<N>/` (see LocalNamespace), and
+    a version `v<N>/` records which generation, how many of its rows and which deleted
+    rows make up the namespace; a CURRENT file names the latest version. A write appends
+    its rows and publishes a new version, swapping CURRENT atomically, and only a rewrite
+    (compaction or index training) starts a new generation.
+
+    Generations are memory-mapped, so every worker process shares one copy in the page
+    cache (put data_dir on /dev/shm to keep it in RAM); other workers map a new version
+    on their next access after `refresh_interval` seconds. Writers in different processes
+    are serialized by a lock file per namespace and writers in one process by a lock per
+    namespace. Queries never wait for them: they read an immutable snapshot of the last
+    published version, which a writer swaps in after publishing its write.
+    """
+
+    def __init__(
+        self,
+        data_dir: Optional[str] = None,
+        dimension: int = DEFAULT_DIMENSION,
+        precision: str = "float32",
+        rescore_factor: int = 4,
+        refresh_interval: float = 1.0,
+        ann_threshold: int = 50000,
+        ann_probes: int = 16
+    ):
+        self.data_dir = data_dir
+        self.dimension = dimension
+        self.precision = check_precision(precision)
+        self.rescore_factor = rescore_factor
+        self.refresh_interval = refresh_interval
+        self.ann_threshold = ann_threshold
+        self.ann_probes = ann_probes
+        # Published snapshots that queries read
+        self._namespaces: Dict[str, LocalNamespace] = {}
+        # Namespaces writes continue from, kept while no other process publishes a version
+        self._writers: Dict[str, LocalNamespace] = {}
+        # When CURRENT was last checked per namespace
+        self._checked: Dict[str, float] = {}
+        self._write_locks: Dict[str, threading.Lock] = {}
+        # Guards swapping snapshots and creating locks, never held while waiting or doing I/O
+        self._namespaces_lock = threading.Lock()
+
+    def _namespace_dir(self, namespace: str) -> str:
+        return os.path.join(self.data_dir, namespace or "__default__")
+
+    def _current_version(self, namespace: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self._namespace_dir(namespace), CURRENT_VERSION_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _is_stale(self, namespace: str, ns: LocalNamespace) -> bool:
+        """Whether another process published a newer version than the snapshot's"""
+        if not self.data_dir:
+            return False
+        now = time.monotonic()
+        if now - self._checked.get(namespace, 0.0) < self.refresh_interval:
+            return False
+        self._checked[namespace] = now
+        return self._current_version(namespace) != ns.version
+
+    def _get_namespace(self, namespace: str) -> Optional[LocalNamespace]:
+        """The published snapshot of a namespace, mapping a newer version first when there is one"""
+        ns = self._namespaces.get(namespace)
+        if ns is None or self._is_stale(namespace, ns):
+            loaded = self._load(namespace)
+            if loaded is not None:
+                ns = self._swap(namespace, loaded, expected=ns)
+        return ns
+
+    def _swap(self, namespace: str, ns: LocalNamespace, expected: Optional[LocalNamespace]) -> LocalNamespace:
+        """Make `ns` the namespace's snapshot unless a writer swapped in another one since `expected` was read"""
+        with self._namespaces_lock:
+            current = self._namespaces.get(namespace)
+            if current is not expected:
+                return current
+            self._namespaces[namespace] = ns
+            return ns
+
+    def _namespace_lock(self, namespace: str) -> threading.Lock:
+        with self._namespaces_lock:
+            return self._write_locks.setdefault(namespace, threading.Lock())
+
+    def _writer(self, namespace: str) -> Optional[LocalNamespace]:
+        """
+        The namespace a write continues from, called holding the namespace's locks: the one
+        the previous write in this process left while it is still the current version,
+        otherwise the current version mapped again (or a copy of the snapshot in memory)
+        """
+        ns = self._writers.get(namespace)
+        if ns is not None and (not self.data_dir or ns.version == self._current_version(namespace)):
+            return ns
+        if self.data_dir:
+            ns = self._load(namespace)
+        else:
+            published = self._namespaces.get(namespace)
+            ns = published.snapshot() if published is not None else None
+        if ns is not None:
+            self._writers[namespace] = ns
+        return ns
+
+    def _options(self, namespace: str) -> Dict:
+        return {
+            "rescore_factor": self.rescore_factor,
+            "ann_threshold": self.ann_threshold,
+            "ann_probes": self.ann_probes,
+            "allocate": (lambda: self._allocate_generation(namespace)) if self.data_dir else None
+        }
+
+    def _new_namespace(self, namespace: str, dimension: int) -> LocalNamespace:
+        directory = self._allocate_generation(namespace) if self.data_dir else None
+        return LocalNamespace.create(dimension, directory, precision=self.precision, **self._options(namespace))
+
+    def _allocate_generation(self, namespace: str) -> str:
+        """Create the directory of the namespace's next generation"""
+        directory = self._namespace_dir(namespace)
+        os.makedirs(directory, exist_ok=True)
+        numbers = [int(name[1:]) for name in os.listdir(directory) if name.startswith("g") and name[1:].isdigit()]
+        path = os.path.join(directory, f"g{max(numbers, default=0) + 1}")
+        os.makedirs(path)
+        return path
+
+    def _load(self, namespace: str) -> Optional[LocalNamespace]:
+        if not self.data_dir:
+            return None
+        # A version can be removed between reading CURRENT and opening it, when two newer
+        # ones were published meanwhile; read CURRENT again then
+        for _ in range(3):
+            version = self._current_version(namespace)
+            if version is None:
+                return self._load_unversioned(namespace)
+            try:
+                ns = self._load_version(namespace, os.path.join(self._namespace_dir(namespace), version))
+            except FileNotFoundError:
+                continue
+            ns.version = version
+            self._checked[namespace] = time.monotonic()
+            logger.info(f"Mapped local namespace {namespace} version {version} with {len(ns)} vectors")
+            return ns
+        raise RuntimeError(f"Could not load a current version of local namespace {namespace}")
+
+    def _load_version(self, namespace: str, directory: str) -> LocalNamespace:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if "generation" not in manifest:
+            return self._load_single_file_version(namespace, directory, manifest)
+        return LocalNamespace.open(
+            os.path.join(self._namespace_dir(namespace), manifest["generation"]),
+            manifest["count"],
+            np.load(os.path.join(directory, "deleted.npy")),
+            **self._options(namespace)
+        )
+
+    def _load_single_file_version(self, namespace: str, directory: str, manifest: Dict) -> LocalNamespace:
+        """Versions that held a complete copy of the namespace; read into memory and rewritten on the next write"""
+        matrix = np.load(os.path.join(directory, "vectors.npy"))
+        ids = [value.decode("utf-8") for value in np.load(os.path.join(directory, "ids.npy"))]
+        offsets = np.load(os.path.join(directory, "meta_offsets.npy"))
+        data = np.load(os.path.join(directory, "meta.npy")).tobytes()
+        metadata = [json.loads(data[offsets[row]:offsets[row + 1]]) for row in range(len(ids))]
+        deleted_path = os.path.join(directory, "deleted.npy")
+        live = ~np.load(deleted_path) if manifest.get("ivf") else np.ones(len(ids), dtype=bool)
+        return self._in_memory_namespace(namespace, matrix[live], [i for i, kept in zip(ids, live) if kept], [m for m, kept in zip(metadata, live) if kept])
+
+    def _load_unversioned(self, namespace: str) -> Optional[LocalNamespace]:
+        """Namespaces written before versions were introduced: vectors.npy plus meta.json"""
+        directory = self._namespace_dir(namespace)
+        matrix_path = os.path.join(directory, "vectors.npy")
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(matrix_path) or not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        logger.info(f"Loaded local namespace {namespace} with {len(meta['ids'])} vectors")
+        return self._in_memory_namespace(namespace, np.load(matrix_path), meta["ids"], meta["metadata"])
+
+    def _in_memory_namespace(self, namespace: str, matrix: np.ndarray, ids: List[str], metadata: List[Dict]) -> LocalNamespace:
+        # Without a generation to allocate, so loading never writes; see _writing
+        ns = LocalNamespace.create(matrix.shape[1], precision=self.precision, **dict(self._options(namespace), allocate=None))
+        if ids:
+            ns.upsert(ids, matrix, metadata)
+        return ns
+
+    @contextmanager
+    def _write_lock(self, namespace: str) -> Iterator[None]:
+        """Serialize writers of a namespace across processes"""
+        if not self.data_dir:
+            yield
+            return
+        directory = self._namespace_dir(namespace)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self, namespace: str, ns: LocalNamespace) -> Iterator[LocalNamespace]:
+        """
+        Apply a write to `ns` and publish it; a namespace that isn't backed by a generation
+        of the store's precision (loaded from an older layout) is rewritten into one first
+        """
+        try:
+            if self.data_dir and (ns.directory is None or ns.precision != self.precision):
+                ns.allocate = self._options(namespace)["allocate"]
+                ns.rewrite(precision=self.precision)
+            yield ns
+        except Exception:
+            # Appended rows may be on disk but unpublished, the next write starts from the
+            # published version again
+            self._writers.pop(namespace, None)
+            raise
+        ns.version = self._publish(namespace, ns)
+        snapshot = ns.snapshot()
+        with self._namespaces_lock:
+            self._namespaces[namespace] = snapshot
+
+    def _publish(self, namespace: str, ns: LocalNamespace) -> Optional[str]:
+        """Publish a version of the namespace (its generation, row count and deleted rows) and return it"""
+        if not self.data_dir:
+            return None
+        directory = self._namespace_dir(namespace)
+        current = self._current_version(namespace)
+        version = f"v{int(current[1:]) + 1 if current else 1}"
+
+        # Write the version under a temporary name so readers never see a half-written one
+        tmp_dir = os.path.join(directory, f"{version}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "deleted.npy"), np.flatnonzero(ns.deleted).astype(np.int64))
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+            json.dump({"generation": os.path.basename(ns.directory), "count": ns.size}, f)
+        os.rename(tmp_dir, os.path.join(directory, version))
+
+        # Swap the new version in
+        pointer_tmp = os.path.join(directory, f"{CURRENT_VERSION_FILE}.tmp")
+        with open(pointer_tmp, "w") as f:
+            f.write(version)
+        os.replace(pointer_tmp, os.path.join(directory, CURRENT_VERSION_FILE))
+        self._checked[namespace] = time.monotonic()
+        self._prune(directory, {version, current})
+        return version
+
+    def _prune(self, directory: str, keep: set):
+        """
+        Remove versions other than `keep` (the new and the previous one, for readers still
+        opening it) and generations no kept version uses. Mapped files of removed generations
+        stay readable until the workers using them unmap them
+        """
+        generations = set()
+        for version in keep:
+            try:
+                with open(os.path.join(directory, version, MANIFEST_FILE)) as f:
+                    generations.add(json.load(f).get("generation"))
+            except (FileNotFoundError, TypeError):
+                continue
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not os.path.isdir(path):
+                continue
+            if (name.startswith("v") and name not in keep) or (name.startswith("g") and name not in generations):
+                shutil.rmtree(path, ignore_errors=True)
+        for name in ("vectors.npy", "meta.json"):
+            if os.path.exists(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+
+    def upsert(self, vectors: List[Dict], namespace: str = None):
+        """Insert or replace vectors given as {"id", "values", "metadata"} dicts"""
+        if not vectors:
+            return
+        with self._write_lock(namespace), self._namespace_lock(namespace):
+            dimension = len(vectors[0]["values"])
+            ns = self._writer(namespace)
+            if ns is None or (len(ns) == 0 and ns.dimension != dimension):
+                ns = self._writers[namespace] = self._new_namespace(namespace, dimension)
+            with self._writing(namespace, ns):
+                ns.upsert(
+                    [vector["id"] for vector in vectors],
+                    np.array([vector["values"] for vector in vectors], dtype=np.float32),
+                    [vector.get("metadata", {}) for vector in vectors]
+                )
+
+    def query(self, vector: List[float], top_k: int = 5, namespace: str = None, include_values: bool = False) -> List[Match]:
+        """Top-k vectors by cosine similarity; returned values are the normalized vectors"""
+        ns = self._get_namespace(namespace)
+        if ns is None:
+            return []
+        return ns.query(vector, top_k, include_values)
+
+    def delete(self, ids: List[str], namespace: str = None) -> int:
+        if not ids:
+            return 0
+        with self._write_lock(namespace), self._namespace_lock(namespace):
+            ns = self._writer(namespace)
+            if ns is None or not any(vector_id in ns.id_to_row for vector_id in ids):
+                return 0
+            with self._writing(namespace, ns):
+                return ns.delete(ids)
+
+    def list_ids(self, prefix: str, namespace: str = None) -> List[str]:
+        ns = self._get_namespace(namespace)
+        if ns is None:
+            return []
+        return [vector_id for vector_id in ns.live_ids() if vector_id.startswith(prefix)]
+
+    def fetch(self, ids: List[str], namespace: str = None) -> List[Dict]:
+        """Stored vectors by ID; values are the normalized vectors"""
+        ns = self._get_namespace(namespace)
+        if ns is None:
+            return []
+        rows = [ns.id_to_row[vector_id] for vector_id in ids if vector_id in ns.id_to_row]
+        return [{"id": ns.ids[row], "values": np.array(ns.matrix[row]), "metadata": ns.metadata[row]} for row in rows]
+
+    def stats(self) -> Dict:
+        """Vector counts per namespace"""
+        if self.data_dir and os.path.isdir(self.data_dir):
+            for name in os.listdir(self.data_dir):
+                namespace = None if name == "__default__" else name
+                self._get_namespace(namespace)
+
+        namespaces = {namespace or "": {"vector_count": len(ns)} for namespace, ns in list(self._namespaces.items())}
+        return {
+            "dimension": self.dimension,
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values())
+        }
@@ -0,0 +1,99 @@
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+# Storage precisions for embeddings, from exact to smallest:
+# float32 (4 bytes per dimension), float16 (2 bytes) and int8 (1 byte plus a scale per vector)
+PRECISIONS = ("float32", "float16", "int8")
+
+
+def check_precision(precision: str) -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown embedding precision {precision!r}, expected one of {', '.join(PRECISIONS)}")
+    return precision
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row int8 quantization: row ~= codes * scale
+
+    Returns:
+        (codes, scales) with codes of dtype int8 and one float32 scale per row
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def encode_vector(vector: Sequence[float], precision: str = "float32") -> bytes:
+    """Pack an embedding into bytes at the given precision"""
+    values = np.asarray(vector, dtype=np.float32)
+    if precision == "float32":
+        return values.tobytes()
+    if precision == "float16":
+        return values.astype(np.float16).tobytes()
+    codes, scales = quantize_int8(values)
+    return scales.tobytes() + codes.tobytes()
+
+
+def decode_vector(data: bytes, precision: str = "float32") -> List[float]:
+    """Unpack an embedding packed by encode_vector"""
+    if precision == "float32":
+        return np.frombuffer(data, dtype=np.float32).tolist()
+    if precision == "float16":
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32).tolist()
+    scale = np.frombuffer(data, dtype=np.float32, count=1)
+    codes = np.frombuffer(data, dtype=np.int8, offset=4)
+    return dequantize_int8(codes[None, :], scale)[0].tolist()
+
+
+class QuantizedMatrix:
+    """
+    Matrix of row vectors kept at reduced precision, used to find candidates quickly
+    and with little memory before they are rescored at full precision.
+    """
+
+    # Rows converted to float32 at a time while scoring, bounds the temporary memory
+    BLOCK_ROWS = 4096
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray], precision: str):
+        # Codes and scales may be read-only memory maps
+        self.codes = codes
+        self.scales = scales
+        self.precision = check_precision(precision)
+
+    @staticmethod
+    def encode(rows: np.ndarray, precision: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Codes of `rows` at `precision`, plus a scale per row for int8"""
+        if check_precision(precision) == "int8":
+            return quantize_int8(rows)
+        return np.asarray(rows, dtype=np.float16), None
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, query: np.ndarray, size: int) -> np.ndarray:
+        """Approximate dot products of the first `size` rows with `query`"""
+        scores = np.empty(size, dtype=np.float32)
+        for start in range(0, size, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, size)
+            scores[start:end] = self.codes[start:end].astype(np.float32) @ query
+            if self.scales is not None:
+                scores[start:end] *= self.scales[start:end]
+        return scores
+
+    def row_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Approximate dot products of the given rows with `query`"""
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.BLOCK_ROWS):
+            block = rows[start:start + self.BLOCK_ROWS]
+            scores[start:start + len(block)] = self.codes[block].astype(np.float32) @ query
+            if self.scales is not None:
+                scores[start:start + len(block)] *= self.scales[block]
+        return scores
@@ -0,0 +1,129 @@
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+import asyncio
+import os
+import logging
+from . import embedding_batcher as batching
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_models import DEFAULT_EMBEDDING_MODEL, EmbeddingModel
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# How long the first query of a batch waits for others, and the most queries per request
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_EMBEDDING_BATCH_WAIT_MS", "5"))
+QUERY_BATCH_MAX_ITEMS = int(os.getenv("QUERY_EMBEDDING_BATCH_ITEMS", "64"))
+
+
+class _PendingBatch:
+    """Queries waiting to be embedded together with one model, one future per distinct query"""
+
+    def __init__(self, model: EmbeddingModel):
+        self.model = model
+        self.futures: Dict[str, asyncio.Future] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces the query embeddings of concurrent chat turns into shared embeddings requests.
+
+    The first query of a batch waits at most `max_wait` seconds for other queries embedded
+    with the same model, a batch is sent as soon as it holds `max_items` distinct queries,
+    and every caller's future resolves with its own embedding. A query that several callers
+    are waiting for is embedded once.
+    """
+
+    def __init__(
+        self,
+        batcher: EmbeddingBatcher = None,
+        max_wait: float = QUERY_BATCH_WAIT_MS / 1000,
+        max_items: int = QUERY_BATCH_MAX_ITEMS
+    ):
+        self._batcher = batcher
+        self.max_wait = max_wait
+        self.max_items = max_items
+        self._pending: Dict[Tuple[asyncio.AbstractEventLoop, str], _PendingBatch] = {}
+        # Sent batches, referenced until they finish so they are not garbage collected
+        self._inflight = set()
+        self.queries = 0
+        self.texts = 0
+        self.requests = 0
+        self.full_batches = 0
+
+    @property
+    def batcher(self) -> EmbeddingBatcher:
+        # Looked up on use, so the shared ingest batcher (and its retries) can be swapped
+        return self._batcher or batching.embedding_batcher
+
+    async def embed(self, query: str, model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL) -> List[float]:
+        """
+        Embed a single query, sharing the embeddings request with concurrent queries
+
+        Args:
+            query: Query text to embed
+            model: Model (and dimensions) to embed with
+
+        Returns:
+            The embedding of `query`
+        """
+        loop = asyncio.get_running_loop()
+        key = (loop, model.key)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = _PendingBatch(model)
+            self._pending[key] = batch
+            batch.timer = loop.call_later(self.max_wait, self._flush, key, batch)
+
+        future = batch.futures.get(query)
+        if future is None:
+            future = loop.create_future()
+            batch.futures[query] = future
+        self.queries += 1
+
+        if len(batch.futures) >= self.max_items:
+            self.full_batches += 1
+            self._flush(key, batch)
+        # A cancelled caller must not cancel the future other callers of the same query share
+        return await asyncio.shield(future)
+
+    def _flush(self, key: Tuple[asyncio.AbstractEventLoop, str], batch: _PendingBatch):
+        if self._pending.get(key) is not batch:
+            return
+        del self._pending[key]
+        batch.timer.cancel()
+        task = asyncio.ensure_future(self._send(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch: _PendingBatch):
+        texts = list(batch.futures)
+        self.texts += len(texts)
+        self.requests += 1
+        try:
+            embeddings = await self.batcher.embed(texts, batch.model)
+        except Exception as e:
+            logger.error(f"Embedding a batch of {len(texts)} queries failed: {str(e)}")
+            for future in batch.futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, embedding in zip(texts, embeddings):
+            future = batch.futures[text]
+            if not future.done():
+                future.set_result(embedding)
+
+    def stats(self) -> Dict:
+        return {
+            "queries": self.queries,
+            "embedded_texts": self.texts,
+            "requests": self.requests,
+            "full_batches": self.full_batches,
+            "mean_batch_size": self.texts / self.requests if self.requests else 0.0
+        }
+
+
+query_embedding_batcher = QueryEmbeddingBatcher()
@@ -0,0 +1,88 @@
+from typing import List, Optional
+from dotenv import load_dotenv
+import os
+import numpy as np
+import logging
+from .vector_backends import Match
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Vector matches below this cosine similarity are dropped (tenants can override it with
+# knowledge_base["similarity_threshold"]); 0 disables pruning. Off by default because the
+# scale depends on the model: unrelated ada-002 texts still score around 0.7, while
+# relevant text-embedding-3 matches often score below 0.5
+DEFAULT_SIMILARITY_THRESHOLD = float(os.getenv("RETRIEVAL_SIMILARITY_THRESHOLD", "0"))
+# Trade-off between relevance (1.0) and diversity (0.0) when picking the final matches
+MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+
+
+def apply_similarity_threshold(matches: List[Match], threshold: Optional[float]) -> List[Match]:
+    """Drop matches whose similarity score is below `threshold`"""
+    if not threshold:
+        return matches
+    kept = [match for match in matches if match.score >= threshold]
+    if len(kept) < len(matches):
+        logger.info(f"Dropped {len(matches) - len(kept)} of {len(matches)} matches below similarity {threshold}")
+    return kept
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def maximal_marginal_relevance(
+    matches: List[Match],
+    top_k: int,
+    lambda_mult: float = MMR_LAMBDA
+) -> List[Match]:
+    """
+    Pick up to `top_k` matches that are relevant but not redundant with each other
+
+    Greedily selects the match maximizing
+    lambda * relevance - (1 - lambda) * (max similarity to the already selected matches).
+    Relevance is the match score scaled so the best match has 1.0, so fused rank scores
+    work as well as cosine scores. Matches without values can't be compared with the
+    others and are never treated as redundant.
+
+    Args:
+        matches: Candidates, best first
+        top_k: Number of matches to return
+        lambda_mult: 1.0 ranks by relevance only, 0.0 by diversity only
+
+    Returns:
+        The selected matches in selection order
+    """
+    if len(matches) <= 1 or top_k <= 0:
+        return matches[:top_k]
+
+    has_values = np.array([match.values is not None and len(match.values) > 0 for match in matches])
+    if not has_values.any():
+        return matches[:top_k]
+    vectors = np.zeros((len(matches), len(matches[int(np.argmax(has_values))].values)), dtype=np.float32)
+    vectors[has_values] = _normalized(np.array([match.values for match, ok in zip(matches, has_values) if ok], dtype=np.float32))
+
+    scores = np.array([match.score for match in matches], dtype=np.float32)
+    relevance = scores / scores.max() if scores.max() > 0 else np.ones_like(scores)
+    # Pairwise cosine similarity of all candidates; rows of matches without values stay 0
+    similarity = vectors @ vectors.T
+
+    selected = [0]
+    max_similarity = similarity[0].copy()
+    available = np.ones(len(matches), dtype=bool)
+    available[0] = False
+
+    while len(selected) < min(top_k, len(matches)):
+        mmr = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return [matches[i] for i in selected]
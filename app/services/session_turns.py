@@ -0,0 +1,82 @@
+from typing import Awaitable, Callable, Dict, TypeVar
+import asyncio
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SessionQueueFullError(Exception):
+    """Raised when a session already has the maximum number of turns queued"""
+
+
+class TurnSupersededError(Exception):
+    """Raised for a queued turn that was replaced by a newer turn before it started"""
+
+
+class _SessionSlot:
+    __slots__ = ("lock", "pending", "latest_ticket")
+
+    def __init__(self):
+        # asyncio.Lock wakes waiters in FIFO order, so turns run in arrival order
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        self.latest_ticket = 0
+
+
+class SessionTurnQueue:
+    """
+    Runs chat turns one at a time per session while different sessions run in parallel.
+
+    Each session gets its own FIFO queue (a lock plus a pending counter). A turn only
+    starts after the previous turn of the same session has finished, so it always sees
+    the full history. Slots are dropped as soon as a session has no pending turns.
+    """
+
+    def __init__(self, max_queue_depth: int = 3):
+        self.max_queue_depth = max_queue_depth
+        self._slots: Dict[str, _SessionSlot] = {}
+
+    def pending(self, session_key: str) -> int:
+        """Number of running and waiting turns for a session"""
+        slot = self._slots.get(session_key)
+        return slot.pending if slot else 0
+
+    async def run(self, session_key: str, turn: Callable[[], Awaitable[T]], supersede: bool = False) -> T:
+        """
+        Run `turn` once all earlier turns of the session have completed
+
+        Args:
+            session_key: Key of the chat session the turn belongs to
+            turn: Coroutine function performing the turn
+            supersede: If True, the turn is skipped when a newer turn for the same
+                session arrives while it is still waiting
+
+        Raises:
+            SessionQueueFullError: The session already has max_queue_depth turns pending
+            TurnSupersededError: The turn was replaced by a newer one before it started
+        """
+        slot = self._slots.get(session_key)
+        if slot is None:
+            slot = self._slots[session_key] = _SessionSlot()
+
+        if slot.pending >= self.max_queue_depth:
+            logger.warning(f"Turn queue full for session {session_key} ({slot.pending} pending)")
+            raise SessionQueueFullError(f"Too many messages in progress for session {session_key}")
+
+        slot.pending += 1
+        slot.latest_ticket += 1
+        ticket = slot.latest_ticket
+
+        try:
+            async with slot.lock:
+                if supersede and ticket != slot.latest_ticket:
+                    logger.info(f"Skipping superseded turn {ticket} for session {session_key}")
+                    raise TurnSupersededError(f"Message was superseded by a newer message in session {session_key}")
+                return await turn()
+        finally:
+            slot.pending -= 1
+            if slot.pending == 0 and self._slots.get(session_key) is slot:
+                del self._slots[session_key]
@@ -0,0 +1,253 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass
+from dotenv import load_dotenv
+import os
+import re
+import threading
+import time
+import logging
+
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Separator placed between pages by the file processor
+PAGE_BREAK = "\f"
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("CHUNK_SIZE_TOKENS", "400"))
+DEFAULT_CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+# Rough stand-in for BPE tokens (about 4 characters each), used when tiktoken is unavailable
+_APPROXIMATE_TOKEN = re.compile(r"\s*(?:\w{1,4}|[^\w\s])")
+# How long an approximate tokenizer is used before loading tiktoken is tried again
+TOKENIZER_RETRY_SECONDS = 300
+
+
+@dataclass
+class TextChunk:
+    """A piece of a document small enough to embed as one vector"""
+    text: str
+    source: str
+    index: int
+    start: int
+    end: int
+    page: Optional[int]
+    heading: Optional[str]
+    token_count: int
+    # Last page of a chunk that runs over a page break
+    end_page: Optional[int] = None
+
+    def metadata(self) -> dict:
+        """Vector metadata for this chunk (Pinecone rejects null values, so empty fields are left out)"""
+        metadata = {
+            "source": self.source,
+            "chunk_index": self.index,
+            "start": self.start,
+            "end": self.end
+        }
+        if self.page is not None:
+            metadata["page"] = self.page
+        if self.end_page is not None and self.end_page != self.page:
+            metadata["end_page"] = self.end_page
+        if self.heading:
+            metadata["heading"] = self.heading
+        return metadata
+
+
+class Tokenizer:
+    """Splits text into token spans (character offsets) for the embedding model"""
+
+    def __init__(self, model: str = "text-embedding-ada-002"):
+        self.encoding = None
+        try:
+            import tiktoken
+            self.encoding = tiktoken.encoding_for_model(model)
+        except Exception as e:
+            # tiktoken downloads its vocabulary on first use, which fails without network access
+            logger.warning(f"tiktoken unavailable for {model}, using approximate token counts: {str(e)}")
+
+    def spans(self, text: str) -> List[Tuple[int, int]]:
+        """Character (start, end) offsets of every token in `text`"""
+        if self.encoding is None:
+            return [match.span() for match in _APPROXIMATE_TOKEN.finditer(text)]
+
+        _, offsets = self.encoding.decode_with_offsets(self.encoding.encode(text, disallowed_special=()))
+        ends = offsets[1:] + [len(text)]
+        return list(zip(offsets, ends))
+
+    def count(self, text: str) -> int:
+        """Number of tokens in `text`"""
+        if self.encoding is None:
+            return sum(1 for _ in _APPROXIMATE_TOKEN.finditer(text))
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+# Loaded tokenizers by model, with when they were loaded
+_tokenizers: Dict[str, Tuple["Tokenizer", float]] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer(model: str = "text-embedding-ada-002") -> Tokenizer:
+    """
+    Shared tokenizer of `model`. An approximate one (tiktoken failed to load) is only
+    reused for TOKENIZER_RETRY_SECONDS, then loading tiktoken is tried again
+    """
+    with _tokenizers_lock:
+        cached = _tokenizers.get(model)
+    if cached is not None and (cached[0].encoding is not None or time.monotonic() - cached[1] < TOKENIZER_RETRY_SECONDS):
+        return cached[0]
+    tokenizer = Tokenizer(model)
+    with _tokenizers_lock:
+        _tokenizers[model] = (tokenizer, time.monotonic())
+    return tokenizer
+
+
+def _heading_of(block: str) -> Optional[str]:
+    """Return the heading a block starts with, if any"""
+    first_line = block.split("\n", 1)[0].strip()
+    if not first_line or len(first_line) > 80:
+        return None
+    if first_line.startswith("#"):
+        return first_line.lstrip("#").strip() or None
+    if first_line.endswith(":") and len(first_line.split()) <= 8:
+        return first_line.rstrip(":").strip()
+    if first_line.isupper() and len(first_line.split()) <= 10:
+        return first_line
+    return None
+
+
+def _iter_blocks(text: str) -> Iterator[Tuple[int, int, int]]:
+    """Yield (start, end, page) spans of the non-empty paragraphs of a document"""
+    page_start = 0
+    for page_number, page in enumerate(text.split(PAGE_BREAK), start=1):
+        block_start = 0
+        for match in _PARAGRAPH_BREAK.finditer(page):
+            yield from _trimmed_block(page, block_start, match.start(), page_start, page_number)
+            block_start = match.end()
+        yield from _trimmed_block(page, block_start, len(page), page_start, page_number)
+        page_start += len(page) + len(PAGE_BREAK)
+
+
+def _trimmed_block(page: str, start: int, end: int, page_start: int, page_number: int) -> Iterator[Tuple[int, int, int]]:
+    block = page[start:end]
+    stripped = block.strip()
+    if stripped:
+        leading = len(block) - len(block.lstrip())
+        yield page_start + start + leading, page_start + start + leading + len(stripped), page_number
+
+
+def chunk_document(
+    text: str,
+    source: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    overlap: int = DEFAULT_CHUNK_OVERLAP,
+    tokenizer: Tokenizer = None
+) -> Iterator[TextChunk]:
+    """
+    Split a document into token-bounded chunks along its structure
+
+    Paragraphs are packed into chunks of at most `chunk_size` tokens. A heading starts
+    a new chunk once the current one has some content. A paragraph never spans pages,
+    but a chunk of several paragraphs can: it records its first and last page. When a
+    chunk is closed because it is full, its trailing paragraphs (up to `overlap` tokens)
+    are repeated at the start of the next chunk, unless a heading starts a new section
+    before anything else is added. Paragraphs longer than `chunk_size` are split into
+    token windows that overlap by `overlap` tokens.
+
+    Args:
+        text: Extracted document text, pages separated by PAGE_BREAK
+        source: Name of the document, stored with every chunk
+        chunk_size: Maximum tokens per chunk
+        overlap: Tokens shared between consecutive chunks
+        tokenizer: Tokenizer of the embedding model
+
+    Yields:
+        TextChunk objects in document order
+    """
+    if overlap >= chunk_size:
+        raise ValueError("Chunk overlap must be smaller than the chunk size")
+
+    tokenizer = tokenizer or get_tokenizer()
+    min_section_tokens = chunk_size // 4
+
+    index = 0
+    heading = None
+    # Blocks of the chunk being built: (start, end, page, tokens)
+    current: List[Tuple[int, int, int, int]] = []
+    current_tokens = 0
+    current_heading = None
+    # Leading blocks of `current` repeated from the previous chunk as overlap
+    carried_blocks = 0
+
+    def make_chunk(start: int, end: int, page: int, tokens: int, end_page: Optional[int] = None) -> TextChunk:
+        nonlocal index
+        chunk = TextChunk(
+            text=text[start:end].replace(PAGE_BREAK, "\n"),
+            source=source,
+            index=index,
+            start=start,
+            end=end,
+            page=page,
+            heading=current_heading,
+            token_count=tokens,
+            end_page=end_page if end_page is not None else page
+        )
+        index += 1
+        return chunk
+
+    def flush() -> TextChunk:
+        return make_chunk(current[0][0], current[-1][1], current[0][2], current_tokens, current[-1][2])
+
+    for start, end, page in _iter_blocks(text):
+        block_tokens = tokenizer.count(text[start:end])
+        block_heading = _heading_of(text[start:end])
+
+        # Overlap only repeats context within a section, and never makes a chunk of its own
+        if block_heading and current and carried_blocks == len(current):
+            current, current_tokens, carried_blocks = [], 0, 0
+
+        # Start a new section at headings, unless the current chunk is still tiny
+        if block_heading and current and current_tokens >= min_section_tokens:
+            yield flush()
+            current, current_tokens, carried_blocks = [], 0, 0
+
+        if block_heading:
+            heading = block_heading
+        if not current:
+            current_heading = heading
+
+        # A paragraph that does not fit in one chunk is split into token windows
+        if block_tokens > chunk_size:
+            if len(current) > carried_blocks:
+                yield flush()
+            current, current_tokens, carried_blocks = [], 0, 0
+            current_heading = heading
+            spans = tokenizer.spans(text[start:end])
+            step = chunk_size - overlap
+            for window_start in range(0, len(spans), step):
+                window = spans[window_start:window_start + chunk_size]
+                yield make_chunk(start + window[0][0], start + window[-1][1], page, len(window))
+                if window_start + chunk_size >= len(spans):
+                    break
+            continue
+
+        if current and current_tokens + block_tokens > chunk_size:
+            yield flush()
+            # Carry trailing paragraphs over as overlap
+            carried = []
+            carried_tokens = 0
+            for previous in reversed(current):
+                if carried_tokens + previous[3] > overlap or carried_tokens + previous[3] + block_tokens > chunk_size:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous[3]
+            current, current_tokens, carried_blocks = carried, carried_tokens, len(carried)
+            current_heading = heading
+
+        current.append((start, end, page, block_tokens))
+        current_tokens += block_tokens
+
+    if len(current) > carried_blocks:
+        yield flush()
@@ -0,0 +1,364 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+import os
+import threading
+import time
+import logging
+from .clients import get_pinecone_client
+from .embedding_models import DEFAULT_EMBEDDING_MODEL
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_INDEX_NAME = "business-knowledge-base"
+DEFAULT_DIMENSION = 1536  # OpenAI's text-embedding-ada-002 dimension
+
+# Pinecone recommends upserting at most 100 vectors per request and accepts up to 1000 IDs per delete
+UPSERT_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+# Fetch passes the IDs in the query string, keep requests well below URL length limits
+FETCH_BATCH_SIZE = 100
+
+
+class Match:
+    """A query result, shaped like Pinecone's matches (id, score, metadata and optionally values)"""
+    __slots__ = ("id", "score", "metadata", "values")
+
+    def __init__(self, id: str, score: float, metadata: Optional[Dict] = None, values: Optional[Sequence[float]] = None):
+        self.id = id
+        self.score = score
+        self.metadata = metadata or {}
+        self.values = values
+
+    def __repr__(self):
+        return f"Match(id={self.id!r}, score={self.score:.4f})"
+
+
+class VectorStore(ABC):
+    """
+    Interface shared by all vector backends.
+
+    Vectors are {"id", "values", "metadata"} dicts, scores are cosine similarities
+    (higher is more similar) and every operation is scoped to a namespace, one per tenant.
+    """
+
+    @abstractmethod
+    def upsert(self, vectors: List[Dict], namespace: str = None):
+        """Insert or replace vectors"""
+
+    @abstractmethod
+    def query(self, vector: List[float], top_k: int = 5, namespace: str = None, include_values: bool = False) -> List[Match]:
+        """Top-k vectors by cosine similarity, best first; with include_values the matches carry their vectors"""
+
+    @abstractmethod
+    def delete(self, ids: List[str], namespace: str = None) -> int:
+        """Delete vectors by ID and return how many were requested or removed"""
+
+    @abstractmethod
+    def list_ids(self, prefix: str, namespace: str = None) -> List[str]:
+        """IDs of all vectors in the namespace starting with `prefix`"""
+
+    @abstractmethod
+    def fetch(self, ids: List[str], namespace: str = None) -> List[Dict]:
+        """Stored vectors by ID as {"id", "values", "metadata"} dicts; missing IDs are left out"""
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """Vector counts as {"dimension", "namespaces": {ns: {"vector_count"}}, "total_vector_count"}"""
+
+    def ensure_ready(self):
+        """Create remote resources (indexes) the store needs; blocking, run in the background at startup"""
+
+
+class PineconeVectorStore(VectorStore):
+    """Vectors in a Pinecone serverless index, one Pinecone namespace per tenant namespace"""
+
+    def __init__(self, client=None, index_name: str = DEFAULT_INDEX_NAME, dimension: int = DEFAULT_DIMENSION):
+        self._client = client
+        self.index_name = index_name
+        self.dimension = dimension
+        self._index = None
+        self._ready = False
+        self._ready_lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self._client or get_pinecone_client()
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self.client.Index(self.index_name)
+        return self._index
+
+    def ensure_ready(self):
+        """
+        Create the index if it does not exist yet and wait until it accepts writes.
+        Only the first call talks to Pinecone, later calls return immediately.
+        """
+        if self._ready:
+            return
+        with self._ready_lock:
+            if self._ready:
+                return
+            if self.index_name not in self.client.list_indexes().names():
+                from pinecone import ServerlessSpec
+                logger.info(f"Creating Pinecone index {self.index_name}")
+                self.client.create_index(
+                    name=self.index_name,
+                    dimension=self.dimension,
+                    metric='cosine',
+                    spec=ServerlessSpec(
+                        cloud="aws",
+                        region="us-east-1"
+                    )
+                )
+            # A new serverless index takes a few seconds before it accepts writes
+            while not self.client.describe_index(self.index_name).status['ready']:
+                time.sleep(1)
+            self._ready = True
+
+    def upsert(self, vectors: List[Dict], namespace: str = None):
+        if not vectors:
+            return
+        self.ensure_ready()
+        upsert_params = {"vectors": vectors}
+        if namespace:
+            upsert_params["namespace"] = namespace
+        self.index.upsert(batch_size=UPSERT_BATCH_SIZE, **upsert_params)
+
+    def query(self, vector: List[float], top_k: int = 5, namespace: str = None, include_values: bool = False) -> List[Match]:
+        query_params = {
+            "vector": vector,
+            "top_k": top_k,
+            "include_metadata": True,
+            "include_values": include_values
+        }
+        if namespace:
+            query_params["namespace"] = namespace
+        results = self.index.query(**query_params)
+        return [
+            Match(match.id, match.score, match.metadata, match.values if include_values else None)
+            for match in results.matches
+        ]
+
+    def delete(self, ids: List[str], namespace: str = None) -> int:
+        if not ids:
+            return 0
+        # Pinecone does not report how many of the IDs existed
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.index.delete(ids=ids[start:start + DELETE_BATCH_SIZE], namespace=namespace or "")
+        return len(ids)
+
+    def list_ids(self, prefix: str, namespace: str = None) -> List[str]:
+        ids = []
+        # Serverless indexes page through IDs by prefix
+        for page in self.index.list(prefix=prefix, namespace=namespace or ""):
+            ids.extend(page)
+        return ids
+
+    def fetch(self, ids: List[str], namespace: str = None) -> List[Dict]:
+        vectors = []
+        for start in range(0, len(ids), FETCH_BATCH_SIZE):
+            response = self.index.fetch(ids=ids[start:start + FETCH_BATCH_SIZE], namespace=namespace or "")
+            vectors.extend(
+                {"id": vector.id, "values": vector.values, "metadata": vector.metadata or {}}
+                for vector in response.vectors.values()
+            )
+        return vectors
+
+    def stats(self) -> Dict:
+        stats = self.index.describe_index_stats()
+        return {
+            "dimension": stats.dimension,
+            "namespaces": {name: {"vector_count": ns.vector_count} for name, ns in stats.namespaces.items()},
+            "total_vector_count": stats.total_vector_count
+        }
+
+
+class ChromaVectorStore(VectorStore):
+    """
+    Vectors in Chroma, one collection per namespace. Runs in-process (optionally
+    persisted to a directory) or against a Chroma server.
+    """
+
+    COLLECTION_PREFIX = "kb-"
+
+    def __init__(self, client=None, path: Optional[str] = None, dimension: int = DEFAULT_DIMENSION):
+        if client is None:
+            import chromadb
+            client = chromadb.PersistentClient(path=path) if path else chromadb.EphemeralClient()
+        self.client = client
+        self.dimension = dimension
+        self._collections = {}
+
+    def _collection(self, namespace: str, create: bool = True):
+        name = f"{self.COLLECTION_PREFIX}{namespace or 'default'}"
+        collection = self._collections.get(name)
+        if collection is None:
+            if not create and name not in self._collection_names():
+                return None
+            # Embeddings are always supplied, so no embedding function is needed
+            collection = self.client.get_or_create_collection(
+                name,
+                metadata={"hnsw:space": "cosine"},
+                embedding_function=None
+            )
+            self._collections[name] = collection
+        return collection
+
+    def _collection_names(self) -> List[str]:
+        return [getattr(collection, "name", collection) for collection in self.client.list_collections()]
+
+    def upsert(self, vectors: List[Dict], namespace: str = None):
+        if not vectors:
+            return
+        self._collection(namespace).upsert(
+            ids=[vector["id"] for vector in vectors],
+            embeddings=[list(vector["values"]) for vector in vectors],
+            # Chroma rejects empty metadata dicts but accepts None
+            metadatas=[vector.get("metadata") or None for vector in vectors]
+        )
+
+    def query(self, vector: List[float], top_k: int = 5, namespace: str = None, include_values: bool = False) -> List[Match]:
+        collection = self._collection(namespace, create=False)
+        if collection is None or top_k <= 0:
+            return []
+        results = collection.query(
+            query_embeddings=[list(vector)],
+            n_results=top_k,
+            include=["metadatas", "distances", "embeddings"] if include_values else ["metadatas", "distances"]
+        )
+        ids = results["ids"][0]
+        values = results["embeddings"][0] if include_values else [None] * len(ids)
+        # Chroma returns cosine distances
+        return [
+            Match(vector_id, 1.0 - distance, metadata, vector_values)
+            for vector_id, distance, metadata, vector_values in zip(ids, results["distances"][0], results["metadatas"][0], values)
+        ]
+
+    def delete(self, ids: List[str], namespace: str = None) -> int:
+        collection = self._collection(namespace, create=False)
+        if collection is None or not ids:
+            return 0
+        existing = collection.get(ids=ids, include=[])["ids"]
+        if existing:
+            collection.delete(ids=existing)
+        return len(existing)
+
+    def list_ids(self, prefix: str, namespace: str = None) -> List[str]:
+        collection = self._collection(namespace, create=False)
+        if collection is None:
+            return []
+        return [vector_id for vector_id in collection.get(include=[])["ids"] if vector_id.startswith(prefix)]
+
+    def fetch(self, ids: List[str], namespace: str = None) -> List[Dict]:
+        collection = self._collection(namespace, create=False)
+        if collection is None or not ids:
+            return []
+        results = collection.get(ids=ids, include=["embeddings", "metadatas"])
+        return [
+            {"id": vector_id, "values": values, "metadata": metadata or {}}
+            for vector_id, values, metadata in zip(results["ids"], results["embeddings"], results["metadatas"])
+        ]
+
+    def stats(self) -> Dict:
+        namespaces = {}
+        for name in self._collection_names():
+            if name.startswith(self.COLLECTION_PREFIX):
+                namespace = name[len(self.COLLECTION_PREFIX):]
+                namespaces["" if namespace == "default" else namespace] = {"vector_count": self.client.get_collection(name).count()}
+        return {
+            "dimension": self.dimension,
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values())
+        }
+
+
+def pinecone_index_name(dimension: int = DEFAULT_DIMENSION) -> str:
+    """Pinecone indexes have a fixed dimension, so shortened embeddings get an index of their own"""
+    return DEFAULT_INDEX_NAME if dimension == DEFAULT_DIMENSION else f"{DEFAULT_INDEX_NAME}-{dimension}"
+
+
+def create_vector_store(backend: str, dimension: int = DEFAULT_DIMENSION) -> VectorStore:
+    """Create the vector store for a backend name ("pinecone", "chroma" or "local")"""
+    if backend == "pinecone":
+        return PineconeVectorStore(index_name=pinecone_index_name(dimension), dimension=dimension)
+    if backend == "chroma":
+        return ChromaVectorStore(path=os.getenv("CHROMA_PATH") or None, dimension=dimension)
+    if backend == "local":
+        from .local_vector_store import LocalVectorStore
+        return LocalVectorStore(
+            os.getenv("LOCAL_VECTOR_STORE_DIR", "data/vectors"),
+            dimension=dimension,
+            precision=os.getenv("LOCAL_VECTOR_PRECISION", "int8"),
+            rescore_factor=int(os.getenv("LOCAL_VECTOR_RESCORE_FACTOR", "4")),
+            refresh_interval=float(os.getenv("LOCAL_VECTOR_REFRESH_SECONDS", "1")),
+            ann_threshold=int(os.getenv("LOCAL_VECTOR_ANN_THRESHOLD", "50000")),
+            ann_probes=int(os.getenv("LOCAL_VECTOR_ANN_PROBES", "16"))
+        )
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+def parse_backend_overrides(value: str) -> Dict[str, str]:
+    """Parse "business_1=local,business_2=chroma" into a namespace to backend mapping"""
+    overrides = {}
+    for item in value.split(","):
+        if "=" in item:
+            namespace, backend = item.split("=", 1)
+            overrides[namespace.strip()] = backend.strip()
+    return overrides
+
+
+# "pinecone" (default), "chroma" or "local" for the in-process NumPy store
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+# Tenants that use a different backend than the deployment default
+VECTOR_BACKEND_OVERRIDES = parse_backend_overrides(os.getenv("VECTOR_BACKEND_OVERRIDES", ""))
+
+_stores: Dict[Tuple[str, int], VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def _store_for_backend(backend: str, dimension: int = DEFAULT_DIMENSION) -> VectorStore:
+    # Chroma collections and local namespaces take the dimension of their first vectors,
+    # only Pinecone needs a separate index per dimension
+    key = (backend, dimension if backend == "pinecone" else DEFAULT_DIMENSION)
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                logger.info(f"Initializing {backend} vector store for {key[1]}-dimensional vectors")
+                store = _stores[key] = create_vector_store(backend, key[1])
+    return store
+
+
+def get_vector_store(namespace: str = None, dimension: int = DEFAULT_DIMENSION) -> VectorStore:
+    """
+    Vector store for a namespace: the deployment's VECTOR_BACKEND unless the
+    namespace has an entry in VECTOR_BACKEND_OVERRIDES. Stores are created on first use.
+    
+    Args:
+        namespace: Namespace the vectors are stored in
+        dimension: Dimension of the namespace's embeddings (see embedding_models.py)
+    """
+    return _store_for_backend(VECTOR_BACKEND_OVERRIDES.get(namespace or "", VECTOR_BACKEND), dimension)
+
+
+def all_vector_stores() -> Dict[str, VectorStore]:
+    """Every backend configured for this deployment, keyed by backend name, at the default dimension"""
+    return {backend: _store_for_backend(backend) for backend in {VECTOR_BACKEND, *VECTOR_BACKEND_OVERRIDES.values()}}
+
+
+def ensure_vector_stores():
+    """
+    Prepare every configured backend, e.g. create the Pinecone index on first deployment,
+    for existing knowledge bases and for the embedding dimension of new ones
+    """
+    for dimension in sorted({DEFAULT_DIMENSION, DEFAULT_EMBEDDING_MODEL.dimensions}):
+        for backend in {VECTOR_BACKEND, *VECTOR_BACKEND_OVERRIDES.values()}:
+            _store_for_backend(backend, dimension).ensure_ready()
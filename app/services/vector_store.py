@@ -1,11 +1,19 @@
-from typing import List, Dict
-from openai import OpenAI
+from typing import Callable, Iterable, Iterator, List, Dict, Optional
+from collections import Counter
+from itertools import islice
+from dataclasses import dataclass, field
 import os
-from pinecone import Pinecone, ServerlessSpec
-import uuid
 import logging
 from dotenv import load_dotenv
 from .embedding_service import EmbeddingService
+from .text_chunker import TextChunk, chunk_document
+from .embedding_batcher import chunk_vector_id, embedding_batcher, make_document_id
+from .vector_backends import Match, get_vector_store
+from .embedding_models import DEFAULT_EMBEDDING_MODEL, EmbeddingModel
+from .bm25_index import bm25_index, reciprocal_rank_fusion
+from .chunk_store import chunk_store
+from .retrieval_filters import DEFAULT_SIMILARITY_THRESHOLD, apply_similarity_threshold, maximal_marginal_relevance
+import asyncio
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -13,45 +21,84 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-
-# Create or connect to the index
-index_name = "business-knowledge-base"
-if index_name not in pc.list_indexes().names():
-    pc.create_index(
-        name=index_name,
-        dimension=1536,  # OpenAI's text-embedding-ada-002 dimension
-        metric='cosine',
-        spec=ServerlessSpec(
-            cloud="aws",
-            region="us-east-1"
-        )
-    )
+# Fuse BM25 keyword matches with vector matches, so exact terms (product names, SKUs,
+# phone numbers, prices) are found without raising top_k
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+# Candidates fetched from each retriever per requested result, before fusion,
+# threshold pruning and MMR narrow them down
+RETRIEVAL_CANDIDATE_FACTOR = int(os.getenv("RETRIEVAL_CANDIDATE_FACTOR", "4"))
+
+# Vectors and documents written per namespace by this worker. Reported by /system/metrics,
+# so ingest never has to ask the index for stats
+ingested_vectors: Counter = Counter()
+ingested_documents: Counter = Counter()
+
+# Number of chunks embedded and upserted together; the batcher splits each window
+# into concurrent embedding requests
+INGEST_WINDOW_SIZE = 2000
+# Chunks split off the document per thread hop, keeps tokenization off the event loop
+CHUNKING_BATCH_SIZE = 256
 
-# Connect to the index
-index = pc.Index(index_name)
+# Called with an ingest stage ("chunking", "embedding" or "upserting") and the number of
+# chunks that just completed it (0 when the stage starts)
+ProgressCallback = Callable[[str, int], None]
 
-def get_index_stats() -> Dict:
+@dataclass
+class IngestReport:
+    """Outcome of storing one document: how many of its chunks had to be embedded"""
+    document_id: str
+    added: int = 0
+    reused: int = 0
+    removed: int = 0
+    # The document's current chunks in order: {"vector_id", "chunk_index", "token_count"}
+    chunks: List[Dict] = field(default_factory=list, repr=False)
+
+    def as_dict(self) -> Dict:
+        return {"document_id": self.document_id, "added": self.added, "reused": self.reused, "removed": self.removed}
+
+def get_index_stats(namespace: str = None, embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL) -> Dict:
     """
     Get statistics about the index including vector counts per namespace
     """
-    return EmbeddingService.get_index_stats()
+    return get_vector_store(namespace, embedding_model.dimensions).stats()
+
+def get_ingest_stats() -> Dict:
+    """
+    Documents and vectors stored per namespace since this worker started, without a network call
+    """
+    return {
+        namespace: {"documents": ingested_documents[namespace], "vectors": ingested_vectors[namespace]}
+        for namespace in ingested_vectors
+    }
 
-def search_similar_texts(query: str, top_k: int = 5, namespace: str = None) -> List[Dict]:
+def search_similar_texts(
+    query: str,
+    top_k: int = 5,
+    namespace: str = None,
+    similarity_threshold: float = None,
+    embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL,
+    query_embedding: Optional[List[float]] = None
+) -> List[Match]:
     """
     Search for similar texts in the knowledge base
     
+    Vector matches below the similarity threshold are dropped, and the final matches
+    are picked by maximal marginal relevance so near-duplicate chunks don't all reach
+    the prompt. Fewer than top_k matches are returned when few are relevant.
+    
     Args:
         query: The search query
-        top_k: Number of results to return
+        top_k: Maximum number of results to return
         namespace: Optional namespace to search in (e.g., business_123)
+        similarity_threshold: Minimum cosine similarity of vector matches
+            (defaults to RETRIEVAL_SIMILARITY_THRESHOLD)
+        embedding_model: Model the namespace was built with (see embedding_model_for)
+        query_embedding: Embedding of the query with `embedding_model`, when the caller
+            already has it (e.g. from EmbeddingService.aget_query_embedding)
         
     Returns:
-        List of matching documents with their similarity scores
+        List of matching documents with their similarity scores, or with their
+        reciprocal-rank fusion scores when HYBRID_SEARCH is enabled
     """
     if namespace:
         logger.info(f"Searching for similar texts in namespace: {namespace}")
@@ -59,7 +106,22 @@ def search_similar_texts(query: str, top_k: int = 5, namespace: str = None) -> L
         logger.info("Searching for similar texts without namespace specification")
         
     try:
-        results = EmbeddingService.search_similar_texts(query, top_k, namespace=namespace)
+        if similarity_threshold is None:
+            similarity_threshold = DEFAULT_SIMILARITY_THRESHOLD
+        if query_embedding is None:
+            query_embedding = EmbeddingService.get_query_embedding(query, embedding_model)
+        candidates = top_k * RETRIEVAL_CANDIDATE_FACTOR
+        store = get_vector_store(namespace, embedding_model.dimensions)
+        vector_results = store.query(query_embedding, candidates, namespace=namespace, include_values=True)
+        vector_results = apply_similarity_threshold(vector_results, similarity_threshold)
+        if HYBRID_SEARCH:
+            # Keyword matches are exact term hits, they are not subject to the cosine threshold
+            keyword_results = bm25_index.search(query, candidates, namespace=namespace)
+            logger.info(f"Fusing {len(vector_results)} vector and {len(keyword_results)} keyword candidates")
+            vector_results = reciprocal_rank_fusion([vector_results, keyword_results], candidates)
+        results = maximal_marginal_relevance(vector_results, top_k)
+        # Vectors only carry chunk IDs, fetch the texts of the final matches in one query
+        results = chunk_store.hydrate(results, namespace)
         
         # Log the results
         if results:
@@ -76,23 +138,60 @@ def search_similar_texts(query: str, top_k: int = 5, namespace: str = None) -> L
         logger.error(f"Error searching for similar texts: {str(e)}", exc_info=True)
         raise
 
-def add_to_knowledge_base(texts: List[str], metadata: List[Dict] = None, namespace: str = None):
+def add_to_knowledge_base(
+    texts: List[str],
+    metadata: List[Dict] = None,
+    namespace: str = None,
+    embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL
+):
     """
     Add texts to the knowledge base
     """
-    vectors = EmbeddingService.prepare_vectors(texts, metadata)
-    EmbeddingService.upsert_to_pinecone(vectors, namespace=namespace)
+    metadata = metadata or [{} for _ in texts]
+    vectors = EmbeddingService.prepare_vectors(texts, [{} for _ in texts], model=embedding_model)
+    chunk_store.put([
+        (vector["id"], text, {key: value for key, value in meta.items() if key != "text"})
+        for vector, text, meta in zip(vectors, texts, metadata)
+    ], namespace=namespace)
+    get_vector_store(namespace, embedding_model.dimensions).upsert(vectors, namespace=namespace)
+    bm25_index.add([(vector["id"], text, {}) for vector, text in zip(vectors, texts)], namespace=namespace)
 
-def store_embeddings(text: str, namespace: str = None) -> str:
+def delete_chunks(chunk_ids: List[str], namespace: str = None, embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL) -> int:
+    """
+    Remove chunks from the vector store, the keyword index and the chunk store
     """
-    Store a single text's embeddings in the knowledge base
+    bm25_index.delete(chunk_ids, namespace=namespace)
+    deleted = get_vector_store(namespace, embedding_model.dimensions).delete(chunk_ids, namespace=namespace)
+    chunk_store.delete(chunk_ids, namespace=namespace)
+    return deleted
+
+async def store_embeddings(
+    text: str,
+    namespace: str = None,
+    source: str = "document",
+    existing_ids: Optional[Iterable[str]] = None,
+    progress: Optional[ProgressCallback] = None,
+    embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL
+) -> IngestReport:
+    """
+    Split a document into chunks and store each chunk's embeddings in the knowledge base
+    
+    Chunks are keyed by a hash of their content under a document ID derived from the
+    source name. When a new version of a document is uploaded, only new or changed
+    chunks are embedded, and chunks that are no longer in the document are deleted.
     
     Args:
-        text: The text to store in the knowledge base
+        text: The document text to store in the knowledge base
         namespace: Optional namespace to store the embeddings in (e.g., business_123)
+        source: Name of the document (e.g. the uploaded file name), stored with every chunk
+        existing_ids: Chunk IDs already stored for the document, when the caller keeps
+            track of them; otherwise they are listed from the vector store
+        progress: Optional callback reporting each stage's progress
+        embedding_model: Model the namespace was built with (see embedding_model_for)
         
     Returns:
-        The ID of the stored document
+        An IngestReport with the document ID and the added, reused and removed chunk counts.
+        Chunk vectors are stored as <document_id>#<content_hash>
     """
     try:
         text_length = len(text)
@@ -102,44 +201,117 @@ def store_embeddings(text: str, namespace: str = None) -> str:
         text_snippet = text[:100] + "..." if len(text) > 100 else text
         logger.debug(f"Text snippet: {text_snippet}")
         
-        # Generate embeddings using OpenAI
-        logger.info("Calling OpenAI API to generate embeddings")
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        
-        # Get the embeddings
-        embeddings = response.data[0].embedding
-        embedding_dimensions = len(embeddings)
-        logger.info(f"Embeddings generated successfully: {embedding_dimensions} dimensions")
-        
-        # Generate a unique ID for this document
-        doc_id = str(uuid.uuid4())
+        # Deterministic ID, so a re-upload of the same file replaces the previous version
+        doc_id = make_document_id(namespace, source)
         logger.info(f"Generated document ID: {doc_id}")
         
-        # Prepare vector
-        vector = {
-            "id": doc_id,
-            "values": embeddings,
-            "metadata": {"text": text}
-        }
+        if existing_ids is None:
+            store = get_vector_store(namespace, embedding_model.dimensions)
+            existing_ids = await asyncio.to_thread(store.list_ids, f"{doc_id}#", namespace)
+        existing_ids = set(existing_ids)
+        logger.info(f"Document {doc_id} already has {len(existing_ids)} chunks in namespace: {namespace}")
         
-        # Store in Pinecone with namespace if provided
-        if namespace:
-            logger.info(f"Storing embeddings in namespace: {namespace}")
-            EmbeddingService.upsert_to_pinecone([vector], namespace=namespace)
-        else:
-            logger.info("Storing embeddings without namespace")
-            EmbeddingService.upsert_to_pinecone([vector])
+        # Embed and store only new or changed chunks, window by window as the chunker yields them
+        report = IngestReport(document_id=doc_id)
+        seen_ids = set()
+        window = []
+        chunks = chunk_document(text, source)
+        while True:
+            if progress:
+                progress("chunking", 0)
+            batch = await asyncio.to_thread(_take, chunks, CHUNKING_BATCH_SIZE)
+            if not batch:
+                break
+            if progress:
+                progress("chunking", len(batch))
+            for chunk in batch:
+                chunk_id = chunk_vector_id(doc_id, chunk.text)
+                if chunk_id in seen_ids:
+                    continue
+                seen_ids.add(chunk_id)
+                report.chunks.append({"vector_id": chunk_id, "chunk_index": len(report.chunks), "token_count": chunk.token_count})
+                if chunk_id in existing_ids:
+                    report.reused += 1
+                    continue
+                window.append(chunk)
+                if len(window) == INGEST_WINDOW_SIZE:
+                    await store_chunk_batch(doc_id, window, namespace, progress, embedding_model)
+                    report.added += len(window)
+                    window = []
+        if window:
+            await store_chunk_batch(doc_id, window, namespace, progress, embedding_model)
+            report.added += len(window)
         
-        # Get index stats after upsert
-        stats = EmbeddingService.get_index_stats()
-        total_vectors = stats.get('total_vector_count', 'unknown')
-        logger.info(f"Vector storage complete. Total vectors in index: {total_vectors}")
+        # Remove the chunks of the previous version that are gone
+        stale_ids = sorted(existing_ids - seen_ids)
+        if stale_ids:
+            logger.info(f"Deleting {len(stale_ids)} stale chunks of document {doc_id}")
+            await asyncio.to_thread(delete_chunks, stale_ids, namespace, embedding_model)
+            report.removed = len(stale_ids)
         
-        return doc_id
+        ingested_documents[namespace or ""] += 1
+        logger.info(
+            f"Stored document {doc_id} in namespace: {namespace}: {report.added} chunks added, "
+            f"{report.reused} reused, {report.removed} removed "
+            f"({ingested_vectors[namespace or '']} vectors written to it by this worker)"
+        )
+        
+        return report
         
     except Exception as e:
         logger.error(f"Error generating and storing embeddings: {str(e)}", exc_info=True)
-        raise Exception(f"Error generating and storing embeddings: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Error generating and storing embeddings: {str(e)}")
+
+def _take(iterator: Iterator, count: int) -> List:
+    return list(islice(iterator, count))
+
+async def store_chunk_batch(
+    doc_id: str,
+    chunks: List[TextChunk],
+    namespace: str = None,
+    progress: Optional[ProgressCallback] = None,
+    embedding_model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL
+):
+    """
+    Embed a batch of chunks concurrently and upsert them as separate vectors
+    """
+    logger.info(f"Generating embeddings for {len(chunks)} chunks")
+    if progress:
+        progress("embedding", 0)
+    embeddings = await embedding_batcher.embed(
+        [chunk.text for chunk in chunks],
+        embedding_model,
+        token_counts=[chunk.token_count for chunk in chunks]
+    )
+    if progress:
+        progress("embedding", len(chunks))
+    
+    # Vector metadata holds only the document ID, the text and the rest of the chunk's
+    # metadata go to the chunk store
+    vectors = []
+    entries = []
+    for chunk, embedding in zip(chunks, embeddings):
+        chunk_id = chunk_vector_id(doc_id, chunk.text)
+        vectors.append({
+            "id": chunk_id,
+            "values": embedding,
+            "metadata": {"document_id": doc_id}
+        })
+        entries.append((chunk_id, chunk.text, {**chunk.metadata(), "document_id": doc_id}))
+    
+    # Store in the namespace's vector store; the upsert is blocking, so run it in a thread.
+    # Texts are written first so a vector is never retrieved before its text is stored
+    logger.info(f"Storing {len(vectors)} chunk embeddings in namespace: {namespace}")
+    if progress:
+        progress("upserting", 0)
+    await asyncio.to_thread(chunk_store.put, entries, namespace=namespace)
+    store = get_vector_store(namespace, embedding_model.dimensions)
+    await asyncio.to_thread(store.upsert, vectors, namespace=namespace)
+    await asyncio.to_thread(
+        bm25_index.add,
+        [(chunk_id, text, {"document_id": doc_id}) for chunk_id, text, _ in entries],
+        namespace=namespace
+    )
+    ingested_vectors[namespace or ""] += len(vectors)
+    if progress:
+        progress("upserting", len(vectors))
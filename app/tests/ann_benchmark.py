@@ -0,0 +1,72 @@
+import time
+import numpy as np
+from app.services.local_vector_store import LocalVectorStore
+
+VECTOR_COUNT = 200_000
+DIMENSION = 256
+QUERY_COUNT = 200
+TOP_K = 10
+TOPICS = 1000
+
+def make_corpus(rng):
+    """Clustered vectors, closer to real embeddings than isotropic noise"""
+    centers = rng.normal(size=(TOPICS, DIMENSION))
+    topics = rng.integers(0, TOPICS, size=VECTOR_COUNT)
+    vectors = centers[topics] + 1.2 * rng.normal(size=(VECTOR_COUNT, DIMENSION))
+    queries = centers[rng.integers(0, TOPICS, size=QUERY_COUNT)] + 1.2 * rng.normal(size=(QUERY_COUNT, DIMENSION))
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+def build_store(vectors, precision, ann_threshold):
+    store = LocalVectorStore(None, dimension=DIMENSION, precision=precision, ann_threshold=ann_threshold)
+    for start in range(0, len(vectors), 20_000):
+        store.upsert([
+            {"id": str(i), "values": vectors[i], "metadata": {}}
+            for i in range(start, min(start + 20_000, len(vectors)))
+        ], namespace="bench")
+    return store._namespaces["bench"]
+
+def run_queries(ns, queries, nprobe=None):
+    results = []
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([m.id for m in ns.query(query, top_k=TOP_K, nprobe=nprobe)])
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return results, np.median(timings), np.percentile(timings, 95)
+
+def recall(results, expected):
+    return np.mean([len(set(r) & set(e)) / TOP_K for r, e in zip(results, expected)])
+
+def run_benchmark():
+    print("\n=== Approximate Nearest Neighbour (IVF) Benchmark ===\n")
+    print(f"Vectors: {VECTOR_COUNT} x {DIMENSION}, queries: {QUERY_COUNT}, recall@{TOP_K} against exact float32 search\n")
+
+    rng = np.random.default_rng(0)
+    vectors, queries = make_corpus(rng)
+
+    exact = build_store(vectors, "float32", ann_threshold=VECTOR_COUNT + 1)
+    expected, exact_p50, exact_p95 = run_queries(exact, queries)
+    del exact
+
+    print(f"{'precision':<10} {'index':<14} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    print(f"{'float32':<10} {'exact':<14} {1.0:>8.4f} {exact_p50:>8.2f} {exact_p95:>8.2f}")
+
+    for precision in ("float32", "int8"):
+        start = time.perf_counter()
+        ns = build_store(vectors, precision, ann_threshold=VECTOR_COUNT)
+        build_seconds = time.perf_counter() - start
+        if precision == "int8":
+            results, p50, p95 = run_queries(build_store(vectors, "int8", ann_threshold=VECTOR_COUNT + 1), queries)
+            print(f"{precision:<10} {'exact':<14} {recall(results, expected):>8.4f} {p50:>8.2f} {p95:>8.2f}")
+        for nprobe in (4, 8, 16, 32, 64):
+            results, p50, p95 = run_queries(ns, queries, nprobe)
+            label = f"ivf nprobe={nprobe}"
+            print(f"{precision:<10} {label:<14} {recall(results, expected):>8.4f} {p50:>8.2f} {p95:>8.2f}")
+        print(f"  {ns.ivf.partitions} partitions, ingest with training took {build_seconds:.1f} s\n")
+        del ns
+
+    print("nprobe partitions of about sqrt(n) rows each are scanned per query (LOCAL_VECTOR_ANN_PROBES)")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,58 @@
+import asyncio
+import time
+import numpy as np
+from app.services.embedding_models import DEFAULT_EMBEDDING_MODEL
+from app.services.query_embedding_batcher import QueryEmbeddingBatcher
+
+QUERY_COUNT = 2000
+ARRIVALS_PER_SECOND = 400
+# Simulated provider: a fixed round trip plus a small cost per input
+REQUEST_LATENCY = 0.040
+PER_ITEM_LATENCY = 0.0002
+
+class SimulatedProvider:
+    def __init__(self):
+        self.requests = 0
+
+    async def embed(self, texts, model=None):
+        self.requests += 1
+        await asyncio.sleep(REQUEST_LATENCY + PER_ITEM_LATENCY * len(texts))
+        return [[0.0] for _ in texts]
+
+async def run_load(embed):
+    """Queries arrive as a Poisson process; returns the latency of every query in ms"""
+    rng = np.random.default_rng(0)
+    latencies = []
+
+    async def one(i):
+        start = time.perf_counter()
+        await embed(f"question {i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    tasks = []
+    for i, gap in enumerate(rng.exponential(1 / ARRIVALS_PER_SECOND, size=QUERY_COUNT)):
+        await asyncio.sleep(gap)
+        tasks.append(asyncio.ensure_future(one(i)))
+    await asyncio.gather(*tasks)
+    return np.array(latencies)
+
+async def run_benchmark():
+    print("\n=== Query Embedding Micro-Batching Benchmark ===\n")
+    print(f"{QUERY_COUNT} queries at ~{ARRIVALS_PER_SECOND}/s, simulated provider {REQUEST_LATENCY * 1000:.0f} ms per request\n")
+    print(f"{'mode':<18} {'requests':>9} {'mean batch':>11} {'p50 ms':>8} {'p99 ms':>8}")
+
+    provider = SimulatedProvider()
+    latencies = await run_load(lambda text: provider.embed([text]))
+    print(f"{'one per query':<18} {provider.requests:>9} {1.0:>11.1f} {np.median(latencies):>8.1f} {np.percentile(latencies, 99):>8.1f}")
+
+    for wait_ms in (2, 5, 10):
+        provider = SimulatedProvider()
+        batcher = QueryEmbeddingBatcher(provider, max_wait=wait_ms / 1000)
+        latencies = await run_load(lambda text: batcher.embed(text, DEFAULT_EMBEDDING_MODEL))
+        label = f"batched {wait_ms} ms"
+        print(f"{label:<18} {provider.requests:>9} {batcher.stats()['mean_batch_size']:>11.1f} {np.median(latencies):>8.1f} {np.percentile(latencies, 99):>8.1f}")
+
+    print("\nThe added latency is bounded by QUERY_EMBEDDING_BATCH_WAIT_MS")
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
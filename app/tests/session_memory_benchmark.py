@@ -0,0 +1,66 @@
+import gc
+import tracemalloc
+from datetime import datetime
+from app.services.chat_session_store import ChatSession
+
+SESSION_COUNT = 100_000
+TURNS_PER_SESSION = 3
+
+# Message contents are shared by both layouts and created up front,
+# so the measurement only covers the per-session structure itself
+CONTENTS = [
+    ("What are your opening hours?", "We are open from 8am to 8pm every day."),
+    ("Do you have oat milk?", "Yes, oat milk is available for all drinks."),
+    ("How much is a latte?", "A regular latte is $4.50."),
+]
+
+def build_legacy_sessions():
+    """Sessions as they used to be stored: a dict per session and per message"""
+    sessions = {}
+    for i in range(SESSION_COUNT):
+        messages = []
+        for question, answer in CONTENTS[:TURNS_PER_SESSION]:
+            messages.append({"role": "user", "content": question, "timestamp": datetime.utcnow().isoformat()})
+            messages.append({"role": "assistant", "content": answer, "timestamp": datetime.utcnow().isoformat()})
+        sessions[f"business_{i}"] = {
+            "business_profile_id": 1,
+            "assistant_id": 1,
+            "created_at": datetime.utcnow(),
+            "messages": messages
+        }
+    return sessions
+
+def build_compact_sessions():
+    """Sessions stored as ChatSession objects"""
+    sessions = {}
+    for i in range(SESSION_COUNT):
+        session = ChatSession(business_profile_id=1, assistant_id=1)
+        for question, answer in CONTENTS[:TURNS_PER_SESSION]:
+            session.add_message("user", question)
+            session.add_message("assistant", answer)
+        sessions[f"business_{i}"] = session
+    return sessions
+
+def measure(builder):
+    gc.collect()
+    tracemalloc.start()
+    sessions = builder()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessions
+    gc.collect()
+    return current
+
+def run_benchmark():
+    print("\n=== Web Chat Session Memory Benchmark ===\n")
+    print(f"Sessions: {SESSION_COUNT}, messages per session: {TURNS_PER_SESSION * 2}\n")
+    
+    legacy = measure(build_legacy_sessions)
+    compact = measure(build_compact_sessions)
+    
+    print(f"Legacy dict sessions:   {legacy / 1024 / 1024:.1f} MB total, {legacy / SESSION_COUNT:.0f} bytes per session")
+    print(f"Compact ChatSession:    {compact / 1024 / 1024:.1f} MB total, {compact / SESSION_COUNT:.0f} bytes per session")
+    print(f"Reduction: {(1 - compact / legacy) * 100:.1f}%")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,106 @@
+import json
+import multiprocessing
+import pytest
+from app.services.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+from app.services.vector_backends import Match
+
+CHUNKS = [
+    ("doc#0", "The Aurora desk lamp (SKU AL-2045) costs $49.99 and ships in two days."),
+    ("doc#1", "Our lamps come in warm and cool white. Every lamp has a two year warranty."),
+    ("doc#2", "Call us at +1 555-010-7788 or write to sales@brightshop.com for orders."),
+    ("doc#3", "The Nova floor lamp (SKU NL-3100) costs $129.00."),
+]
+
+class TestBM25Index:
+    @pytest.fixture
+    def index(self, tmp_path):
+        index = BM25Index(str(tmp_path))
+        index.add([(chunk_id, text, {"text": text}) for chunk_id, text in CHUNKS], namespace="business_1")
+        return index
+
+    def test_compound_terms_are_kept_whole_and_split(self):
+        assert tokenize("SKU AL-2045 costs $49.99") == ["sku", "al-2045", "al", "2045", "costs", "49.99", "49", "99"]
+
+    def test_exact_identifiers_rank_first(self, index):
+        assert index.search("price of AL-2045", namespace="business_1")[0].id == "doc#0"
+        assert index.search("phone 555-010-7788", namespace="business_1")[0].id == "doc#2"
+        assert index.search("129.00", namespace="business_1")[0].id == "doc#3"
+        assert index.search("AL-2045", namespace="business_2") == []
+
+    def test_incremental_update_and_delete(self, index):
+        index.add([("doc#3", "The Nova floor lamp is discontinued.", {"text": "discontinued"})], namespace="business_1")
+        assert index.search("NL-3100", namespace="business_1") == []
+        assert index.search("discontinued", namespace="business_1")[0].metadata == {"text": "discontinued"}
+
+        assert index.delete(["doc#0", "missing"], namespace="business_1") == 1
+        assert index.search("AL-2045", namespace="business_1") == []
+        ns = index._namespaces["business_1"]
+        assert "al-2045" not in ns.postings
+        assert ns.total_length == sum(ns.doc_lengths.values())
+
+    def test_other_workers_see_updates(self, index, tmp_path):
+        other_worker = BM25Index(str(tmp_path))
+        assert other_worker.search("AL-2045", namespace="business_1")[0].id == "doc#0"
+
+        index.delete(["doc#0"], namespace="business_1")
+        assert other_worker.search("AL-2045", namespace="business_1") == []
+
+    def test_writes_append_to_the_log(self, index, tmp_path):
+        path = tmp_path / "business_1.jsonl"
+        logged = path.read_bytes()
+
+        index.add([("doc#4", "Desk lamps ship free.", {})], namespace="business_1")
+        index.delete(["doc#1"], namespace="business_1")
+
+        contents = path.read_bytes()
+        assert contents.startswith(logged)
+        assert [json.loads(line) for line in contents[len(logged):].splitlines()] == [
+            {"add": {"doc#4": {"terms": {"desk": 1, "lamps": 1, "ship": 1, "free": 1}, "metadata": {}}}},
+            {"remove": ["doc#1"]},
+        ]
+
+    def test_log_is_compacted_once_changes_outgrow_it(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(BM25Index, "COMPACT_MIN_BYTES", 0)
+        index = BM25Index(str(tmp_path))
+        for i in range(20):
+            index.add([("doc#0", f"Revision {i} of the price list", {})], namespace="ns")
+
+        assert len((tmp_path / "ns.jsonl").read_bytes().splitlines()) < 5
+        assert BM25Index(str(tmp_path)).search("19", namespace="ns")[0].id == "doc#0"
+
+    def test_legacy_file_is_logged_on_next_write(self, tmp_path):
+        (tmp_path / "ns.json").write_text(json.dumps({"doc#0": {"terms": {"lamp": 1}, "metadata": {"text": "lamp"}}}))
+        index = BM25Index(str(tmp_path))
+        assert index.search("lamp", namespace="ns")[0].id == "doc#0"
+
+        index.add([("doc#1", "desk", {})], namespace="ns")
+
+        assert not (tmp_path / "ns.json").exists()
+        assert {m.id for m in BM25Index(str(tmp_path)).search("lamp desk", namespace="ns")} == {"doc#0", "doc#1"}
+
+    def test_concurrent_writer_processes_lose_no_postings(self, tmp_path):
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=add_in_worker, args=(str(tmp_path), worker, 20)) for worker in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=60)
+
+        assert [worker.exitcode for worker in workers] == [0, 0, 0]
+        index = BM25Index(str(tmp_path))
+        assert len(index.search("shared", top_k=100, namespace="ns")) == 60
+
+def add_in_worker(data_dir, worker, count):
+    index = BM25Index(data_dir)
+    for i in range(count):
+        index.add([(f"w{worker}#{i}", f"shared term {worker} {i}", {})], namespace="ns")
+
+class TestReciprocalRankFusion:
+    def test_results_found_by_both_retrievers_win(self):
+        vector = [Match("a", 0.9), Match("b", 0.8), Match("c", 0.7)]
+        keyword = [Match("c", 12.0), Match("d", 8.0)]
+
+        fused = reciprocal_rank_fusion([vector, keyword], top_k=3)
+
+        assert [m.id for m in fused] == ["c", "a", "b"]
+        assert fused[0].score == pytest.approx(1 / 63 + 1 / 61)
@@ -0,0 +1,48 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+import app.models
+import app.models.user_subscription
+from app.models.assistant import AIAssistant
+from app.models.business_profile import BusinessProfile
+from app.models.message import Message
+from app.routers.messages import prepare_chat_context, save_initial_message
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[AIAssistant.__table__, BusinessProfile.__table__, Message.__table__])
+    session = sessionmaker(bind=engine)()
+    session.add(AIAssistant(id=1, name="Cafe bot", model="gpt-4o-mini", language="en", user_id=1))
+    start = datetime.utcnow() - timedelta(minutes=10)
+    for i, (query, answer) in enumerate([("Do you have oat milk?", "Yes."), ("Until when are you open?", "Until 8pm.")]):
+        session.add(Message(user_query=query, ai_response=answer, assistant_id=1, user_id=1, timestamp=start + timedelta(minutes=i)))
+    session.commit()
+    yield session
+    session.close()
+
+def user_turns(messages):
+    return [message["content"] for message in messages if message["role"] == "user"]
+
+class TestPrepareChatContext:
+    def test_current_turn_appears_once(self, db):
+        current = save_initial_message("Is there parking nearby?", assistant_id=1, user_id=1, db=db)
+
+        messages = prepare_chat_context(1, current.user_query, db, user_id=1, current_message_id=current.id)
+
+        assert user_turns(messages) == ["Do you have oat milk?", "Until when are you open?", "Is there parking nearby?"]
+        assert "Processing your request..." not in [message["content"] for message in messages]
+
+    def test_edited_turn_appears_once_with_its_new_content(self, db):
+        edited = db.query(Message).filter(Message.user_query == "Until when are you open?").one()
+        edited.user_query = "Until when are you open on Sundays?"
+
+        messages = prepare_chat_context(1, edited.user_query, db, user_id=1, current_message_id=edited.id)
+
+        assert user_turns(messages) == ["Do you have oat milk?", "Until when are you open on Sundays?"]
@@ -0,0 +1,66 @@
+import pytest
+from datetime import datetime
+from app.services.chat_session_store import ChatSession
+
+class TestChatSession:
+    @pytest.fixture
+    def session(self):
+        session = ChatSession(business_profile_id=1, assistant_id=1)
+        for i in range(5):
+            session.add_message("user", f"Question {i}")
+            session.add_message("assistant", f"Answer {i}")
+        return session
+
+    def test_full_history(self, session):
+        """Test that history without parameters returns every message"""
+        messages, cursor = session.history()
+        
+        assert len(messages) == 10
+        assert cursor == 10
+        assert messages[0]["content"] == "Question 0"
+
+    def test_initial_page_limit(self, session):
+        """Test that a limit without a cursor returns the most recent messages"""
+        messages, cursor = session.history(limit=4)
+        
+        assert [m["content"] for m in messages] == ["Question 3", "Answer 3", "Question 4", "Answer 4"]
+        assert cursor == 10
+
+    def test_since_cursor(self, session):
+        """Test that polling with a cursor only returns new messages"""
+        _, cursor = session.history()
+        session.add_message("user", "Question 5")
+        
+        messages, next_cursor = session.history(since=cursor)
+        
+        assert [m["content"] for m in messages] == ["Question 5"]
+        assert next_cursor == 11
+        
+        # Nothing new since the last poll
+        messages, _ = session.history(since=next_cursor)
+        assert messages == []
+
+    def test_since_with_limit(self, session):
+        """Test paging forward from a cursor"""
+        messages, cursor = session.history(since=2, limit=3)
+        
+        assert [m["content"] for m in messages] == ["Question 1", "Answer 1", "Question 2"]
+        assert cursor == 5
+
+    def test_serialized_message_format(self, session):
+        """Test that compact messages are serialized with role names and ISO timestamps"""
+        messages, _ = session.history(limit=1)
+        
+        assert messages[0]["role"] == "assistant"
+        assert messages[0]["content"] == "Answer 4"
+        assert isinstance(datetime.fromisoformat(messages[0]["timestamp"]), datetime)
+
+    def test_recent_messages_for_context(self, session):
+        """Test that recent messages are returned as role/content pairs for the model"""
+        context = session.recent_messages(3)
+        
+        assert context == [
+            {"role": "assistant", "content": "Answer 3"},
+            {"role": "user", "content": "Question 4"},
+            {"role": "assistant", "content": "Answer 4"}
+        ]
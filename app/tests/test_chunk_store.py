@@ -0,0 +1,95 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models.knowledge import ChunkText
+from app.services import vector_store
+from app.services.bm25_index import BM25Index
+from app.services.chunk_store import ChunkStore
+from app.services.local_vector_store import LocalVectorStore
+from app.services.vector_backends import Match
+
+class CountingSessions:
+    """Session factory that counts the sessions opened, one per database round trip"""
+    def __init__(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine, tables=[ChunkText.__table__])
+        self.factory = sessionmaker(bind=engine)
+        self.opened = 0
+
+    def __call__(self):
+        self.opened += 1
+        return self.factory()
+
+@pytest.fixture
+def sessions():
+    return CountingSessions()
+
+class TestChunkStore:
+    def test_put_and_bulk_get(self, sessions):
+        chunks = ChunkStore(sessions)
+        chunks.put([("doc#a", "Opening hours: 8am to 8pm.", {"source": "info.txt"}), ("doc#b", "We deliver.", {})], namespace="business_1")
+        sessions.opened = 0
+
+        found = chunks.get_many(["doc#a", "doc#b", "doc#missing"], namespace="business_1")
+
+        assert found == {
+            "doc#a": {"text": "Opening hours: 8am to 8pm.", "metadata": {"source": "info.txt"}},
+            "doc#b": {"text": "We deliver.", "metadata": {}}
+        }
+        assert sessions.opened == 1
+        assert chunks.get_many(["doc#a"], namespace="business_2") == {}
+
+    def test_hot_chunks_are_served_from_the_lru(self, sessions):
+        chunks = ChunkStore(sessions, max_bytes=30)
+        chunks.put([(f"doc#{i}", f"chunk text {i:02d}", {}) for i in range(5)], namespace="business_1")
+        chunks.get_many(["doc#0", "doc#1", "doc#2"], namespace="business_1")
+        sessions.opened = 0
+
+        assert chunks.get_many(["doc#1", "doc#2"], namespace="business_1")["doc#2"]["text"] == "chunk text 02"
+        assert sessions.opened == 0
+        # 13 byte texts, so only the two most recently used fit in 30 bytes
+        assert list(key for _, key in chunks._entries) == ["doc#1", "doc#2"]
+        assert chunks.stats()["hits"] == 2
+
+    def test_delete_removes_text_and_cache_entry(self, sessions):
+        chunks = ChunkStore(sessions)
+        chunks.put([("doc#a", "old", {})], namespace="business_1")
+        chunks.get_many(["doc#a"], namespace="business_1")
+
+        assert chunks.delete(["doc#a"], namespace="business_1") == 1
+        assert chunks.get_many(["doc#a"], namespace="business_1") == {}
+
+    def test_hydrate_fills_text_and_keeps_legacy_metadata(self, sessions):
+        chunks = ChunkStore(sessions)
+        chunks.put([("doc#a", "Stored text", {"source": "menu.pdf", "page": 2})], namespace="business_1")
+        matches = [
+            Match("doc#a", 0.9, {"document_id": "doc"}),
+            Match("vec_legacy", 0.8, {"text": "Text kept in vector metadata"})
+        ]
+
+        hydrated = chunks.hydrate(matches + [Match("doc#gone", 0.7, {"document_id": "doc"})], namespace="business_1")
+
+        # A match without a stored text is dropped
+        assert hydrated == matches
+        assert matches[0].metadata == {"source": "menu.pdf", "page": 2, "document_id": "doc", "text": "Stored text"}
+        assert matches[1].metadata == {"text": "Text kept in vector metadata"}
+
+class TestChunkTextOutsideVectors:
+    def test_vectors_carry_ids_and_search_returns_text(self, monkeypatch, tmp_path, sessions):
+        store = LocalVectorStore(str(tmp_path), dimension=2)
+        monkeypatch.setattr(vector_store, "get_vector_store", lambda namespace=None, dimension=None: store)
+        monkeypatch.setattr(vector_store, "bm25_index", BM25Index(str(tmp_path / "bm25")))
+        monkeypatch.setattr(vector_store, "chunk_store", ChunkStore(sessions))
+        monkeypatch.setattr(vector_store.EmbeddingService, "generate_embeddings", staticmethod(lambda texts, model=None: [[1.0, 0.0] for _ in texts]))
+        monkeypatch.setattr(vector_store.EmbeddingService, "get_query_embedding", staticmethod(lambda query, model=None: [1.0, 0.0]))
+
+        vector_store.add_to_knowledge_base(["Replacement filter SKU FX-220 costs $12.50."], [{"text": "ignored", "source": "faq"}], namespace="business_1")
+        results = vector_store.search_similar_texts("FX-220", top_k=1, namespace="business_1", similarity_threshold=0)
+
+        assert store.query([1.0, 0.0], top_k=1, namespace="business_1")[0].metadata == {}
+        assert results[0].metadata == {"source": "faq", "text": "Replacement filter SKU FX-220 costs $12.50."}
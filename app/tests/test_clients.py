@@ -0,0 +1,75 @@
+import asyncio
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+from app.services import clients
+from app.services.clients import Readiness
+
+class TestClientRegistry:
+    def test_clients_are_created_once_on_first_use(self, monkeypatch):
+        monkeypatch.setattr(clients, "_clients", {})
+        created = []
+
+        def factory():
+            created.append(object())
+            return created[-1]
+
+        assert created == []
+        first = clients._get_client("test", factory)
+        assert clients._get_client("test", factory) is first
+        assert len(created) == 1
+
+    def test_importing_services_creates_no_clients(self):
+        """Test that importing the ingest and retrieval modules needs no network or API keys"""
+        # A fresh interpreter, since this process has imported the modules already
+        script = textwrap.dedent("""
+            import socket
+
+            def no_network(*args, **kwargs):
+                raise AssertionError("network access at import time")
+
+            socket.socket.connect = no_network
+            socket.create_connection = no_network
+
+            from app.services import clients, embedding_batcher, embedding_service, vector_backends, vector_store
+
+            assert clients._clients == {}, clients._clients
+            assert embedding_batcher.EmbeddingBatcher()._client is None
+            assert vector_backends.PineconeVectorStore()._index is None
+        """)
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        # Empty keys also stop load_dotenv from filling them in from a local .env file
+        env = {**os.environ, "OPENAI_API_KEY": "", "PINECONE_API_KEY": "", "DATABASE_URL": "sqlite://", "PYTHONPATH": root}
+
+        result = subprocess.run([sys.executable, "-c", script], cwd=root, env=env, capture_output=True, text=True, timeout=120)
+
+        assert result.returncode == 0, result.stderr
+
+class TestReadiness:
+    @pytest.mark.asyncio
+    async def test_setup_is_retried_until_it_succeeds(self):
+        readiness = Readiness(retry_interval=0.01)
+        attempts = []
+
+        def setup():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("index not reachable")
+
+        task = readiness.start("vector_store", setup)
+        assert readiness.report() == {"ready": False, "checks": {"vector_store": {"ready": False, "error": "starting"}}}
+
+        await asyncio.wait_for(task, timeout=5)
+
+        assert len(attempts) == 3
+        assert readiness.ready
+
+    def test_not_ready_while_any_check_fails(self):
+        readiness = Readiness()
+        readiness.set("vector_store", True)
+        readiness.set("openai", False, "OPENAI_API_KEY is not set")
+
+        assert not readiness.ready
+        assert readiness.report()["checks"]["openai"]["error"] == "OPENAI_API_KEY is not set"
@@ -0,0 +1,88 @@
+import httpx
+import pytest
+from openai import RateLimitError
+from app.services.embedding_batcher import EmbeddingBatcher, make_document_id, chunk_vector_id
+
+class FakeEmbeddingItem:
+    def __init__(self, index, embedding):
+        self.index = index
+        self.embedding = embedding
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+class FakeEmbeddings:
+    """Returns [len(text)] as the embedding and can fail the first few calls with a 429"""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    async def create(self, model, input):
+        self.calls.append(list(input))
+        if self.failures:
+            self.failures -= 1
+            request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+            response = httpx.Response(429, request=request, headers={"retry-after": "0"})
+            raise RateLimitError("rate limited", response=response, body=None)
+        # Return items out of order, as the API does not guarantee ordering
+        return FakeResponse([FakeEmbeddingItem(i, [float(len(text))]) for i, text in reversed(list(enumerate(input)))])
+
+class FakeClient:
+    def __init__(self, failures=0):
+        self.embeddings = FakeEmbeddings(failures)
+
+class WordTokenizer:
+    def count(self, text):
+        return len(text.split())
+
+class TestEmbeddingBatcher:
+    def make_batcher(self, client, **kwargs):
+        return EmbeddingBatcher(client=client, tokenizer=WordTokenizer(), **kwargs)
+
+    def test_batches_respect_token_and_item_limits(self):
+        batcher = self.make_batcher(FakeClient(), max_batch_tokens=5, max_batch_items=3)
+        texts = ["a b", "c d", "e", "f", "g h i j k l", "m"]
+        
+        assert batcher.make_batches(texts) == [[0, 1, 2], [3], [4], [5]]
+
+    @pytest.mark.asyncio
+    async def test_known_token_counts_are_not_recounted(self):
+        client = FakeClient()
+        batcher = EmbeddingBatcher(client=client, tokenizer=object(), max_batch_tokens=5)
+
+        embeddings = await batcher.embed(["a", "bb", "ccc"], token_counts=[3, 2, 4])
+
+        assert embeddings == [[1.0], [2.0], [3.0]]
+        assert client.embeddings.calls == [["a", "bb"], ["ccc"]]
+
+    @pytest.mark.asyncio
+    async def test_embed_preserves_order(self):
+        client = FakeClient()
+        batcher = self.make_batcher(client, max_batch_tokens=100, max_batch_items=2, max_concurrency=2)
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        
+        embeddings = await batcher.embed(texts)
+        
+        assert embeddings == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+        assert len(client.embeddings.calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_rate_limited_batch_is_retried(self):
+        client = FakeClient(failures=2)
+        batcher = self.make_batcher(client)
+        
+        embeddings = await batcher.embed(["hello"])
+        
+        assert embeddings == [[5.0]]
+        assert len(client.embeddings.calls) == 3
+
+    def test_ids_are_deterministic_and_distinct(self):
+        first = make_document_id("business_1", "menu.pdf")
+        
+        assert first == make_document_id("business_1", "menu.pdf")
+        assert first != make_document_id("business_1", "drinks.pdf")
+        assert first != make_document_id("business_2", "menu.pdf")
+        assert chunk_vector_id(first, "Latte $4.50") == chunk_vector_id(first, "Latte $4.50")
+        assert chunk_vector_id(first, "Latte $4.50") != chunk_vector_id(first, "Latte $4.75")
+        assert chunk_vector_id(first, "Latte $4.50").startswith(f"{first}#")
@@ -0,0 +1,63 @@
+import sqlite3
+import pytest
+from app.services.embedding_cache import EmbeddingCache, SQLiteEmbeddingStore, normalize_text
+
+class TestEmbeddingCache:
+    @pytest.fixture
+    def cache(self):
+        return EmbeddingCache(max_bytes=1024)
+
+    def test_normalized_queries_share_entries(self, cache):
+        """Test that case and whitespace differences hit the same entry"""
+        cache.set("model", "What are your  prices?", [0.5, 0.25])
+        
+        assert cache.get("model", "what are your prices? ") == [0.5, 0.25]
+        assert cache.get("other-model", "what are your prices?") is None
+        assert normalize_text("  Hello\n World ") == "hello world"
+
+    def test_lru_eviction_by_bytes(self, cache):
+        """Test that the least recently used entries are evicted once the byte budget is exceeded"""
+        vector = [0.0] * 64  # 256 bytes as float32
+        for i in range(4):
+            cache.set("model", f"query {i}", vector)
+        cache.get("model", "query 0")
+        cache.set("model", "query 4", vector)
+        
+        assert cache.bytes_used == 1024
+        assert cache.get("model", "query 0") is not None
+        assert cache.get("model", "query 1") is None
+
+    def test_persistent_tier(self, tmp_path):
+        """Test that a second cache (another worker) reuses entries from the shared store"""
+        path = str(tmp_path / "embeddings.db")
+        EmbeddingCache(persistent_store=SQLiteEmbeddingStore(path)).set("model", "hours?", [1.0, 2.0])
+        
+        other_worker = EmbeddingCache(persistent_store=SQLiteEmbeddingStore(path))
+        
+        assert other_worker.get("model", "hours?") == [1.0, 2.0]
+        assert other_worker.get("model", "hours?") == [1.0, 2.0]
+        stats = other_worker.stats()
+        assert stats["persistent_hits"] == 1
+        assert stats["memory_hits"] == 1
+        assert stats["hit_rate"] == 1.0
+
+    def test_persistent_tier_is_bounded(self, tmp_path):
+        """Test that the shared store drops expired entries and keeps only the newest rows"""
+        path = str(tmp_path / "embeddings.db")
+        store = SQLiteEmbeddingStore(path, max_rows=3, max_age_days=30, prune_every=5)
+        with sqlite3.connect(path) as conn:
+            for i in range(4):
+                conn.execute(
+                    "INSERT INTO embedding_cache (key, vector, created_at) VALUES (?, ?, datetime('now', ?))",
+                    (f"old-{i}", b"x", f"-{40 - i} days")
+                )
+        
+        # Expired entries are ignored before they are pruned
+        assert store.get("old-0") is None
+        for i in range(5):
+            store.set(f"new-{i}", b"y")
+        
+        with sqlite3.connect(path) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        assert count == 3
+        assert store.get("new-4") == b"y"
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from app.services import embedding_models, vector_backends
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_models import (
+    LEGACY_EMBEDDING_MODEL,
+    EmbeddingModel,
+    embedding_model_for,
+    get_embedding_model,
+    record_embedding_model,
+    shorten_embedding
+)
+
+class RecordingEmbeddings:
+    def __init__(self):
+        self.params = []
+
+    async def create(self, input, **params):
+        self.params.append(params)
+        dimensions = params.get("dimensions", 1536)
+        return type("Response", (), {"data": [
+            type("Item", (), {"index": i, "embedding": [0.0] * dimensions})() for i in range(len(input))
+        ]})()
+
+class WordTokenizer:
+    def count(self, text):
+        return len(text.split())
+
+class TestEmbeddingModels:
+    def test_shortened_models_request_dimensions(self):
+        small = get_embedding_model("text-embedding-3-small", 512)
+
+        assert small.request_params() == {"model": "text-embedding-3-small", "dimensions": 512}
+        assert small.key == "text-embedding-3-small@512"
+        assert get_embedding_model("text-embedding-3-large").request_params() == {"model": "text-embedding-3-large"}
+        assert get_embedding_model("text-embedding-3-large").dimensions == 3072
+
+    @pytest.mark.parametrize("name, dimensions", [
+        ("text-embedding-ada-002", 512),
+        ("text-embedding-3-small", 2048),
+        ("text-embedding-4", None),
+    ])
+    def test_invalid_models_are_rejected(self, name, dimensions):
+        with pytest.raises(ValueError):
+            get_embedding_model(name, dimensions)
+
+    def test_namespace_keeps_the_model_it_was_built_with(self, monkeypatch):
+        monkeypatch.setattr(embedding_models, "DEFAULT_EMBEDDING_MODEL", EmbeddingModel("text-embedding-3-small", 256))
+
+        created = record_embedding_model({"similarity_threshold": 0.8}, "business_1")
+        assert created == {
+            "similarity_threshold": 0.8,
+            "namespace": "business_1",
+            "embedding_model": "text-embedding-3-small",
+            "embedding_dimensions": 256
+        }
+
+        monkeypatch.setattr(embedding_models, "DEFAULT_EMBEDDING_MODEL", EmbeddingModel("text-embedding-3-large", 3072))
+        assert record_embedding_model(created, "business_1") == created
+        assert embedding_model_for(created) == EmbeddingModel("text-embedding-3-small", 256)
+        assert embedding_model_for(None).name == "text-embedding-3-large"
+
+    def test_knowledge_bases_from_before_the_registry_use_ada(self):
+        knowledge_base = {"id": "abc", "namespace": "business_1"}
+
+        assert embedding_model_for(knowledge_base) == LEGACY_EMBEDDING_MODEL
+        assert record_embedding_model(knowledge_base, "business_1")["embedding_model"] == "text-embedding-ada-002"
+
+    def test_shorten_embedding_renormalizes(self):
+        vector = np.random.default_rng(0).normal(size=1536)
+        vector /= np.linalg.norm(vector)
+
+        short = shorten_embedding(vector, 256)
+
+        assert len(short) == 256
+        assert np.linalg.norm(short) == pytest.approx(1.0, abs=1e-6)
+        assert np.argmax(short) == np.argmax(vector[:256])
+
+    @pytest.mark.asyncio
+    async def test_batcher_embeds_with_the_namespace_model(self):
+        client = type("Client", (), {"embeddings": RecordingEmbeddings()})()
+        batcher = EmbeddingBatcher(client=client, tokenizer=WordTokenizer())
+
+        vectors = await batcher.embed(["opening hours", "menu"], get_embedding_model("text-embedding-3-small", 512))
+
+        assert client.embeddings.params == [{"model": "text-embedding-3-small", "dimensions": 512}]
+        assert [len(v) for v in vectors] == [512, 512]
+
+    def test_pinecone_gets_an_index_per_dimension(self, monkeypatch):
+        monkeypatch.setattr(vector_backends, "_stores", {})
+        monkeypatch.setattr(vector_backends, "create_vector_store", lambda backend, dimension: (backend, dimension))
+
+        assert vector_backends._store_for_backend("pinecone", 512) == ("pinecone", 512)
+        assert vector_backends._store_for_backend("pinecone") == ("pinecone", 1536)
+        # Local and Chroma namespaces are sized by their own vectors, one store serves all dimensions
+        assert vector_backends._store_for_backend("local", 512) == ("local", 1536)
+        assert vector_backends.pinecone_index_name(1536) == "business-knowledge-base"
+        assert vector_backends.pinecone_index_name(512) == "business-knowledge-base-512"
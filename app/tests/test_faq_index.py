@@ -0,0 +1,123 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+import app.models
+import app.models.user_subscription
+from app.models.assistant import AIAssistant
+from app.models.business_profile import BusinessProfile
+from app.models.faq import FAQEntry
+from app.models.message import Message
+from app.services import faq_index as faq
+from app.services.vector_backends import Match
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[
+        AIAssistant.__table__, BusinessProfile.__table__, Message.__table__, FAQEntry.__table__
+    ])
+    session = sessionmaker(bind=engine)()
+    session.add(AIAssistant(id=1, name="Cafe bot", model="gpt-4o-mini", language="en", user_id=1))
+    session.add(BusinessProfile(
+        id=1, business_name="Cafe", business_type="selling", tone_preferences={},
+        knowledge_base={"namespace": "business_1"}, assistant_id=1
+    ))
+    session.commit()
+    yield session
+    session.close()
+
+@pytest.fixture
+def knowledge(monkeypatch):
+    """Fake retrieval keyed by question and a generator that counts its calls"""
+    sources = {}
+    generated = []
+
+    def retrieve(question, business_profile):
+        return [Match(chunk_id, 0.9, {"text": chunk_id}) for chunk_id in sources.get(question, [])]
+
+    def generate(question, language, assistant, business_profile, matches):
+        generated.append(question)
+        return f"{question} -> {','.join(m.id for m in matches)}"
+
+    monkeypatch.setattr(faq, "retrieve_faq_sources", retrieve)
+    monkeypatch.setattr(faq, "generate_faq_answer", generate)
+    monkeypatch.setattr(faq, "faq_index", faq.FAQIndex(ttl=60))
+    return sources, generated
+
+def ask(db, query, times, days_ago=0):
+    for _ in range(times):
+        db.add(Message(assistant_id=1, user_id=1, user_query=query, ai_response="...",
+                       timestamp=datetime.utcnow() - timedelta(days=days_ago)))
+    db.commit()
+
+class TestFAQIndex:
+    def test_mining_groups_variations_and_skips_follow_ups(self, db):
+        ask(db, "What are your opening hours?", 3)
+        ask(db, "what are your  opening hours", 2)
+        ask(db, "How much is it?", 9)
+        ask(db, "Do you deliver?", 2)
+        ask(db, "Do you have wifi", 5, days_ago=400)
+
+        mined = faq.mine_frequent_questions(db, 1, min_frequency=3)
+
+        assert mined == [("what are your opening hours", "What are your opening hours?", 5)]
+
+    def test_follow_ups_are_detected_per_language(self, db):
+        ask(db, "Сколько это стоит?", 4)
+        ask(db, "Сколько стоит доставка?", 3)
+        ask(db, "Где вы находитесь?", 3)
+
+        mined = faq.mine_frequent_questions(db, 1, "ru", min_frequency=3)
+
+        assert sorted(question for _, question, _ in mined) == ["Где вы находитесь?", "Сколько стоит доставка?"]
+        # Without context words for the language, follow-ups can't be told apart
+        assert faq.mine_frequent_questions(db, 1, "kk", min_frequency=3) == []
+
+    def test_frequent_questions_are_answered_from_the_index(self, db, knowledge):
+        sources, generated = knowledge
+        sources["What are your opening hours?"] = ["hours#1"]
+        ask(db, "What are your opening hours?", 4)
+
+        stats = faq.rebuild_faq(db, 1)
+
+        assert stats == {"questions": 1, "generated": 1, "reused": 0, "removed": 0}
+        assert faq.faq_index.lookup(db, 1, "en", "WHAT are your opening hours!!") == "What are your opening hours? -> hours#1"
+        assert faq.faq_index.lookup(db, 1, "ru", "What are your opening hours?") is None
+        assert faq.faq_index.lookup(db, 1, "en", "Do you deliver?") is None
+        assert faq.faq_index.stats()["hits"] == 1
+
+    def test_rebuild_reuses_unchanged_answers_and_drops_rare_questions(self, db, knowledge):
+        sources, generated = knowledge
+        ask(db, "What are your opening hours?", 4)
+        ask(db, "Do you deliver?", 3)
+        faq.rebuild_faq(db, 1)
+        db.query(Message).filter(Message.user_query == "Do you deliver?").delete()
+        db.commit()
+
+        stats = faq.rebuild_faq(db, 1)
+
+        assert stats == {"questions": 1, "generated": 0, "reused": 1, "removed": 1}
+        assert len(generated) == 2
+
+    def test_knowledge_change_regenerates_only_affected_answers(self, db, knowledge):
+        sources, generated = knowledge
+        sources["What are your opening hours?"] = ["hours#1"]
+        sources["Do you deliver?"] = ["delivery#1"]
+        ask(db, "What are your opening hours?", 4)
+        ask(db, "Do you deliver?", 3)
+        faq.rebuild_faq(db, 1)
+        assert faq.faq_index.lookup(db, 1, "en", "do you deliver") == "Do you deliver? -> delivery#1"
+        generated.clear()
+
+        # A re-uploaded document replaced the delivery chunk
+        sources["Do you deliver?"] = ["delivery#2"]
+        assert faq.refresh_faq_answers(db, 1) == 1
+
+        assert generated == ["Do you deliver?"]
+        assert faq.faq_index.lookup(db, 1, "en", "do you deliver") == "Do you deliver? -> delivery#2"
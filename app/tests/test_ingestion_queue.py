@@ -0,0 +1,211 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import asyncio
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+import app.models
+import app.models.user_subscription
+from app.models.knowledge import IngestJobRecord, KnowledgeDocument
+from app.services.ingestion_queue import IngestionQueue, UploadTooLargeError
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # A file database, so the queue's threads each get their own connection
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[IngestJobRecord.__table__, KnowledgeDocument.__table__])
+    return sessionmaker(bind=engine)
+
+@pytest.fixture
+def spool_dir(tmp_path):
+    return str(tmp_path / "spool")
+
+def make_queue(handler, spool_dir, session_factory, **options):
+    return IngestionQueue(handler, spool_dir=spool_dir, session_factory=session_factory, sync_interval=0.01, **options)
+
+async def wait_for(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met in time")
+
+class RecordingHandler:
+    """Blocks each job until released and records how many run at once per tenant"""
+    def __init__(self):
+        self.running = {}
+        self.max_running = {}
+        self.started = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, job):
+        tenant = job.business_profile_id
+        self.running[tenant] = self.running.get(tenant, 0) + 1
+        self.max_running[tenant] = max(self.max_running.get(tenant, 0), self.running[tenant])
+        self.started.append(job.filename)
+        with open(job.path, "rb") as f:
+            contents = f.read()
+        job.advance("chunking", 3)
+        await self.release.wait()
+        job.advance("embedding", 3)
+        job.advance("upserting", 3)
+        self.running[tenant] -= 1
+        if contents == b"broken":
+            raise ValueError("Could not extract text from file")
+        return {"added": 3}
+
+class TestIngestionQueue:
+    @pytest.mark.asyncio
+    async def test_jobs_run_in_background_with_stage_progress(self, spool_dir, session_factory):
+        handler = RecordingHandler()
+        queue = make_queue(handler, spool_dir, session_factory, workers=2)
+
+        job = await queue.submit(1, "business_1", "menu.txt", b"coffee 3.50")
+        assert job.status == "queued"
+        assert os.path.exists(job.path)
+
+        await wait_for(lambda: job.stage == "chunking")
+        assert job.status == "running"
+        handler.release.set()
+        await queue.join()
+
+        assert queue.get(job.id).as_dict()["status"] == "done"
+        assert job.stage == "done"
+        assert job.progress == {"chunking": 3, "embedding": 3, "upserting": 3}
+        assert job.report == {"added": 3}
+        assert not os.path.exists(job.path)
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded_per_tenant(self, spool_dir, session_factory):
+        handler = RecordingHandler()
+        queue = make_queue(handler, spool_dir, session_factory, workers=3, tenant_concurrency=1)
+
+        jobs = [await queue.submit(1, "business_1", f"bulk-{i}.txt", b"text") for i in range(3)]
+        other = await queue.submit(2, "business_2", "menu.txt", b"text")
+        jobs.append(other)
+        await wait_for(lambda: len(handler.started) == 2)
+
+        # The busy tenant's backlog doesn't hold the idle workers
+        assert sorted(handler.started) == ["bulk-0.txt", "menu.txt"]
+        assert other.status == "running"
+
+        handler.release.set()
+        await queue.join()
+
+        assert handler.max_running == {1: 1, 2: 1}
+        assert sorted(handler.started) == ["bulk-0.txt", "bulk-1.txt", "bulk-2.txt", "menu.txt"]
+        assert all(queue.get(job.id).status == "done" for job in jobs)
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_failed_job_keeps_error_and_frees_tenant(self, spool_dir, session_factory):
+        handler = RecordingHandler()
+        handler.release.set()
+        queue = make_queue(handler, spool_dir, session_factory, workers=1)
+
+        failed = await queue.submit(1, "business_1", "scan.pdf", b"broken")
+        succeeded = await queue.submit(1, "business_1", "menu.txt", b"text")
+        await queue.join()
+
+        assert (failed.status, failed.error) == ("failed", "Could not extract text from file")
+        assert succeeded.status == "done"
+        assert os.listdir(spool_dir) == []
+        assert queue.get(failed.id).error == "Could not extract text from file"
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_status_is_visible_to_other_workers(self, spool_dir, session_factory):
+        handler = RecordingHandler()
+        queue = make_queue(handler, spool_dir, session_factory)
+        other_worker = make_queue(RecordingHandler(), spool_dir, session_factory)
+
+        job = await queue.submit(1, "business_1", "menu.txt", b"text")
+        await wait_for(lambda: other_worker.get(job.id).progress.get("chunking") == 3)
+        assert other_worker.get(job.id).status == "running"
+
+        handler.release.set()
+        await queue.join()
+        assert other_worker.get(job.id).as_dict()["report"] == {"added": 3}
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_unfinished_job_is_resumed_after_shutdown(self, spool_dir, session_factory):
+        queue = make_queue(RecordingHandler(), spool_dir, session_factory)
+        job = await queue.submit(1, "business_1", "menu.txt", b"text")
+        await wait_for(lambda: job.stage == "chunking")
+
+        await queue.shutdown()
+        # The cancelled job keeps its upload and is handed back
+        assert os.path.exists(job.path)
+        assert queue.get(job.id).status == "running"
+
+        handler = RecordingHandler()
+        handler.release.set()
+        restarted = make_queue(handler, spool_dir, session_factory)
+        await restarted.start()
+        # The upload is removed right after the job is marked done
+        await wait_for(lambda: restarted.get(job.id).status == "done" and not os.path.exists(job.path))
+
+        assert handler.started == ["menu.txt"]
+        await restarted.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_job_of_a_crashed_worker_is_taken_over_after_its_lease(self, spool_dir, session_factory):
+        crashed = make_queue(RecordingHandler(), spool_dir, session_factory)
+        job = await crashed.submit(1, "business_1", "menu.txt", b"text")
+        # The crashed worker never renews its claim again
+        for task in crashed._tasks:
+            task.cancel()
+
+        handler = RecordingHandler()
+        handler.release.set()
+        survivor = make_queue(handler, spool_dir, session_factory, lease=0.2)
+        await survivor.start()
+        await asyncio.sleep(0.05)
+        assert handler.started == []
+
+        await wait_for(lambda: survivor.get(job.id).status == "done")
+        await survivor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_job_without_its_upload_fails_with_its_document(self, spool_dir, session_factory):
+        db = session_factory()
+        db.add(KnowledgeDocument(business_profile_id=1, namespace="business_1", document_id="doc-1", filename="menu.txt", file_hash="0", status="processing"))
+        db.commit()
+        db.close()
+
+        queue = make_queue(RecordingHandler(), spool_dir, session_factory)
+        job = await queue.submit(1, "business_1", "menu.txt", b"text")
+        await queue.shutdown()
+        os.remove(job.path)
+
+        restarted = make_queue(RecordingHandler(), spool_dir, session_factory)
+        await restarted.start()
+        await wait_for(lambda: restarted.get(job.id).status == "failed")
+
+        db = session_factory()
+        assert db.query(KnowledgeDocument).one().status == "failed"
+        db.close()
+        await restarted.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_streamed_upload_over_the_limit_is_not_queued(self, spool_dir, session_factory, tmp_path):
+        handler = RecordingHandler()
+        handler.release.set()
+        queue = make_queue(handler, spool_dir, session_factory)
+        upload = tmp_path / "business_1.kbsnap"
+        upload.write_bytes(b"x" * 100)
+
+        with open(upload, "rb") as f, pytest.raises(UploadTooLargeError):
+            await queue.submit(1, "business_1", "business_1.kbsnap", f, kind="snapshot", max_bytes=99)
+        assert os.listdir(spool_dir) == []
+
+        with open(upload, "rb") as f:
+            job = await queue.submit(1, "business_1", "business_1.kbsnap", f, kind="snapshot", max_bytes=100)
+        await queue.join()
+        assert queue.get(job.id).as_dict()["kind"] == "snapshot"
+        assert handler.started == ["business_1.kbsnap"]
+        await queue.shutdown()
@@ -0,0 +1,128 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+import app.models
+import app.models.user_subscription
+from app.models.business_profile import BusinessProfile
+from app.models.knowledge import KnowledgeDocument, KnowledgeChunk, ChunkText
+from app.services import knowledge_catalog, vector_store
+from app.services.bm25_index import BM25Index
+from app.services.chunk_store import ChunkStore
+from app.services.local_vector_store import LocalVectorStore
+
+NAMESPACE = "business_1"
+
+class FakeBatcher:
+    def __init__(self):
+        self.embedded = []
+
+    async def embed(self, texts, model=None, token_counts=None):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+class ListingForbiddenStore(LocalVectorStore):
+    """Catalogued documents must not list the vector store"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.list_calls = 0
+        self.deleted = []
+
+    def list_ids(self, prefix, namespace=None):
+        self.list_calls += 1
+        return super().list_ids(prefix, namespace)
+
+    def delete(self, ids, namespace=None):
+        self.deleted.append(list(ids))
+        return super().delete(ids, namespace)
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[BusinessProfile.__table__, KnowledgeDocument.__table__, KnowledgeChunk.__table__, ChunkText.__table__])
+    session = sessionmaker(bind=engine)()
+    session.add(BusinessProfile(
+        id=1,
+        business_name="Cafe",
+        business_type="selling",
+        tone_preferences={},
+        knowledge_base={"namespace": NAMESPACE}
+    ))
+    session.commit()
+    yield session
+    session.close()
+
+@pytest.fixture
+def store(monkeypatch, tmp_path, db):
+    store = ListingForbiddenStore(str(tmp_path), dimension=2)
+    monkeypatch.setattr(vector_store, "chunk_store", ChunkStore(sessionmaker(bind=db.get_bind())))
+    monkeypatch.setattr(vector_store, "embedding_batcher", FakeBatcher())
+    monkeypatch.setattr(vector_store, "get_vector_store", lambda namespace=None, dimension=None: store)
+    monkeypatch.setattr(vector_store, "bm25_index", BM25Index(str(tmp_path / "bm25")))
+    return store
+
+def sections(count, start=0):
+    return "\n\n".join(f"PRODUCT {i}\n\nItem {i} costs ${i}.99 " + "and is popular " * 40 for i in range(start, start + count))
+
+async def upload(db, filename, text):
+    return await knowledge_catalog.ingest_document(db, 1, NAMESPACE, filename, text, text.encode())
+
+class TestKnowledgeCatalog:
+    @pytest.mark.asyncio
+    async def test_documents_are_catalogued_separately(self, db, store):
+        await upload(db, "menu.txt", sections(3))
+        await upload(db, "hours.txt", sections(2, start=10))
+
+        documents = knowledge_catalog.list_documents(db, 1)
+
+        assert [d.filename for d in documents] == ["menu.txt", "hours.txt"]
+        assert [d.chunk_count for d in documents] == [3, 2]
+        assert all(d.status == "ready" and len(d.file_hash) == 64 for d in documents)
+        assert len(store._namespaces[NAMESPACE]) == 5
+        menu_ids = [c.vector_id for c in documents[0].chunks]
+        assert all(vector_id.startswith(f"{documents[0].document_id}#") for vector_id in menu_ids)
+
+    @pytest.mark.asyncio
+    async def test_replace_uses_catalog_instead_of_listing(self, db, store):
+        await upload(db, "menu.txt", sections(3))
+        document = knowledge_catalog.list_documents(db, 1)[0]
+        list_calls = store.list_calls
+
+        report = await knowledge_catalog.ingest_document(
+            db, 1, NAMESPACE, "menu-v2.txt", sections(2), sections(2).encode(), document=document
+        )
+
+        assert store.list_calls == list_calls
+        assert (report.added, report.reused, report.removed) == (0, 2, 1)
+        assert document.chunk_count == 2
+        assert document.filename == "menu.txt"
+        assert len(store._namespaces[NAMESPACE]) == 2
+
+    @pytest.mark.asyncio
+    async def test_identical_upload_is_skipped(self, db, store):
+        await upload(db, "menu.txt", sections(3))
+        vector_store.embedding_batcher.embedded.clear()
+
+        report = await upload(db, "menu.txt", sections(3))
+
+        assert vector_store.embedding_batcher.embedded == []
+        assert report.reused == 3
+
+    @pytest.mark.asyncio
+    async def test_delete_removes_only_that_documents_vectors(self, db, store):
+        await upload(db, "menu.txt", sections(3))
+        await upload(db, "hours.txt", sections(2, start=10))
+        menu = knowledge_catalog.get_document(db, 1, knowledge_catalog.list_documents(db, 1)[0].id)
+        menu_ids = sorted(c.vector_id for c in menu.chunks)
+
+        deleted = await knowledge_catalog.delete_document(db, menu)
+
+        assert deleted == 3
+        assert sorted(store.deleted[-1]) == menu_ids
+        assert [d.filename for d in knowledge_catalog.list_documents(db, 1)] == ["hours.txt"]
+        assert db.query(KnowledgeChunk).count() == 2
+        assert len(store._namespaces[NAMESPACE]) == 2
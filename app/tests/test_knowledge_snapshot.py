@@ -0,0 +1,119 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+import app.models
+import app.models.user_subscription
+from app.models.business_profile import BusinessProfile
+from app.models.knowledge import KnowledgeDocument, KnowledgeChunk, ChunkText
+from app.services import knowledge_catalog, knowledge_snapshot, vector_store
+from app.services.bm25_index import BM25Index
+from app.services.chunk_store import ChunkStore
+from app.services.embedding_batcher import make_document_id
+from app.services.embedding_models import LEGACY_EMBEDDING_MODEL, EmbeddingModel
+from app.services.local_vector_store import LocalVectorStore
+
+MODEL = EmbeddingModel("text-embedding-3-small", 8)
+
+class FakeBatcher:
+    async def embed(self, texts, model=None, token_counts=None):
+        rng = np.random.default_rng(len(texts))
+        return rng.normal(size=(len(texts), MODEL.dimensions)).tolist()
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[BusinessProfile.__table__, KnowledgeDocument.__table__, KnowledgeChunk.__table__, ChunkText.__table__])
+    session = sessionmaker(bind=engine)()
+    session.add(BusinessProfile(id=2, business_name="Cafe", business_type="selling", tone_preferences={}, knowledge_base={}))
+    session.commit()
+    yield session
+    session.close()
+
+@pytest.fixture
+def source(monkeypatch, tmp_path, db):
+    """A namespace ingested into a local store, with chunk texts in the database"""
+    store = LocalVectorStore(str(tmp_path / "source"), dimension=MODEL.dimensions)
+    chunks = ChunkStore(sessionmaker(bind=db.get_bind()))
+    keywords = BM25Index(str(tmp_path / "bm25"))
+    for module in (vector_store, knowledge_snapshot):
+        monkeypatch.setattr(module, "chunk_store", chunks)
+        monkeypatch.setattr(module, "bm25_index", keywords)
+    monkeypatch.setattr(vector_store, "embedding_batcher", FakeBatcher())
+    monkeypatch.setattr(vector_store, "get_vector_store", lambda namespace=None, dimension=None: store)
+    return store
+
+async def ingest(namespace):
+    text = "\n\n".join(f"PRODUCT {i}\n\nItem {i} costs ${i}.99 " + "and is popular " * 40 for i in range(5))
+    return await vector_store.store_embeddings(text, namespace=namespace, source="catalog.pdf", embedding_model=MODEL)
+
+class TestKnowledgeSnapshot:
+    @pytest.mark.asyncio
+    async def test_export_layout_is_memory_mappable(self, source, tmp_path):
+        await ingest("business_1")
+        path = str(tmp_path / "business_1.kbsnap")
+
+        header = knowledge_snapshot.export_namespace("business_1", path, MODEL, store=source)
+
+        reader = knowledge_snapshot.SnapshotReader(path)
+        assert header.count == len(reader) == 5
+        assert header.vectors_offset % knowledge_snapshot.SNAPSHOT_ALIGNMENT == 0
+        assert isinstance(reader.vectors, np.memmap)
+        records = list(reader.records())
+        exported = {vector["id"]: vector["values"] for vector in source.fetch([r["id"] for r in records], "business_1")}
+        np.testing.assert_allclose(reader.vectors, [exported[r["id"]] for r in records], rtol=1e-6)
+        assert all(r["text"].startswith("PRODUCT") and r["chunk"]["source"] == "catalog.pdf" for r in records)
+        assert "text" not in records[0]["metadata"]
+
+    @pytest.mark.asyncio
+    async def test_float16_halves_the_embedding_block(self, source, tmp_path):
+        await ingest("business_1")
+        full = knowledge_snapshot.export_namespace("business_1", str(tmp_path / "full.kbsnap"), MODEL, store=source)
+        half = knowledge_snapshot.export_namespace("business_1", str(tmp_path / "half.kbsnap"), MODEL, "float16", store=source)
+
+        assert (half.records_offset - half.vectors_offset) * 2 == full.records_offset - full.vectors_offset
+        full_vectors = knowledge_snapshot.SnapshotReader(str(tmp_path / "full.kbsnap")).vectors
+        half_vectors = knowledge_snapshot.SnapshotReader(str(tmp_path / "half.kbsnap")).vectors
+        np.testing.assert_allclose(half_vectors.astype(np.float32), full_vectors, atol=1e-3)
+
+    @pytest.mark.asyncio
+    async def test_import_into_another_namespace_needs_no_embeddings(self, source, tmp_path, db, monkeypatch):
+        report = await ingest("business_1")
+        path = str(tmp_path / "business_1.kbsnap")
+        knowledge_snapshot.export_namespace("business_1", path, MODEL, store=source)
+        target = LocalVectorStore(str(tmp_path / "target"), dimension=MODEL.dimensions)
+        monkeypatch.setattr(vector_store, "embedding_batcher", None)
+
+        imported = knowledge_snapshot.import_snapshot(path, "business_2", store=target)
+        await knowledge_catalog.restore_documents(db, 2, "business_2", imported.documents, imported.embedding_model)
+
+        assert imported.as_dict()["vectors"] == imported.texts == 5
+        assert imported.embedding_model == MODEL
+        document_id = make_document_id("business_2", "catalog.pdf")
+        imported_ids = sorted(target.list_ids("", "business_2"))
+        assert imported_ids == sorted(chunk["vector_id"].replace(report.document_id, document_id) for chunk in report.chunks)
+        match = knowledge_snapshot.chunk_store.hydrate(knowledge_snapshot.bm25_index.search("Item 3", namespace="business_2")[:1], "business_2")[0]
+        assert "Item 3 costs $3.99" in match.metadata["text"]
+        document = db.query(KnowledgeDocument).filter_by(business_profile_id=2).one()
+        assert (document.filename, document.document_id, document.status) == ("catalog.pdf", document_id, "ready")
+        assert sorted(chunk.vector_id for chunk in document.chunks) == imported_ids
+
+    def test_rejects_files_that_are_not_snapshots(self, tmp_path):
+        path = tmp_path / "notes.txt"
+        path.write_bytes(b"just some notes, not a snapshot")
+
+        with pytest.raises(ValueError, match="magic"):
+            knowledge_snapshot.SnapshotReader(str(path))
+
+    def test_model_is_checked_for_any_existing_knowledge_base(self):
+        # A namespace is enough, even before any document was catalogued
+        with pytest.raises(ValueError, match="don't match"):
+            knowledge_snapshot.check_snapshot_model({"namespace": "business_2"}, MODEL)
+        knowledge_snapshot.check_snapshot_model({"namespace": "business_2", **MODEL.as_dict()}, MODEL)
+        knowledge_snapshot.check_snapshot_model({}, MODEL)
+        knowledge_snapshot.check_snapshot_model({"namespace": "business_2"}, LEGACY_EMBEDDING_MODEL)
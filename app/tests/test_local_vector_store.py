@@ -0,0 +1,277 @@
+import json
+import multiprocessing
+import threading
+import numpy as np
+import pytest
+from app.services.local_vector_store import LocalNamespace, LocalVectorStore
+
+def make_vectors(count, dimension=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": f"doc#{i}", "values": rng.normal(size=dimension).tolist(), "metadata": {"text": f"chunk {i}"}}
+        for i in range(count)
+    ]
+
+class TestLocalVectorStore:
+    @pytest.fixture
+    def store(self, tmp_path):
+        return LocalVectorStore(str(tmp_path), dimension=8)
+
+    def test_query_matches_exact_cosine_ranking(self, store):
+        """Test that top-k results equal a brute force cosine ranking"""
+        vectors = make_vectors(200)
+        store.upsert(vectors, namespace="business_1")
+        query = np.random.default_rng(1).normal(size=8)
+        
+        matches = store.query(query.tolist(), top_k=5, namespace="business_1")
+        
+        matrix = np.array([v["values"] for v in vectors])
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query))
+        expected = [f"doc#{i}" for i in np.argsort(-scores)[:5]]
+        assert [m.id for m in matches] == expected
+        assert matches[0].score == pytest.approx(scores.max(), abs=1e-5)
+        assert matches[0].metadata["text"].startswith("chunk")
+
+    def test_namespaces_are_isolated(self, store):
+        store.upsert(make_vectors(3), namespace="business_1")
+        
+        assert store.query([1.0] * 8, top_k=5, namespace="business_2") == []
+
+    def test_upsert_replaces_and_delete_removes(self, store):
+        vectors = make_vectors(10)
+        store.upsert(vectors, namespace="ns")
+        store.upsert([{"id": "doc#3", "values": vectors[3]["values"], "metadata": {"text": "updated"}}], namespace="ns")
+        
+        assert store.delete(["doc#0", "doc#9", "missing"], namespace="ns") == 2
+        
+        matches = store.query(vectors[3]["values"], top_k=20, namespace="ns")
+        assert len(matches) == 8
+        assert matches[0].id == "doc#3"
+        assert matches[0].metadata["text"] == "updated"
+        assert store.stats()["namespaces"]["ns"]["vector_count"] == 8
+
+    def test_persists_and_loads_memory_mapped(self, store, tmp_path):
+        vectors = make_vectors(20)
+        store.upsert(vectors, namespace="ns")
+        
+        reloaded = LocalVectorStore(str(tmp_path), dimension=8)
+        matches = reloaded.query(vectors[5]["values"], top_k=1, namespace="ns")
+        
+        assert matches[0].id == "doc#5"
+        assert isinstance(reloaded._namespaces["ns"].matrix, np.memmap)
+        
+        # Modifying a memory mapped namespace copies it into memory first
+        reloaded.delete(["doc#5"], namespace="ns")
+        assert reloaded.query(vectors[5]["values"], top_k=1, namespace="ns")[0].id != "doc#5"
+
+    def test_queries_read_the_published_snapshot_during_a_write(self, store, monkeypatch):
+        vectors = make_vectors(10)
+        store.upsert(vectors[:5], namespace="ns")
+        appended, release = threading.Event(), threading.Event()
+        upsert = LocalNamespace.upsert
+
+        def blocking_upsert(ns, *args):
+            upsert(ns, *args)
+            appended.set()
+            release.wait(10)
+
+        monkeypatch.setattr(LocalNamespace, "upsert", blocking_upsert)
+        writer = threading.Thread(target=store.upsert, args=(vectors[5:],), kwargs={"namespace": "ns"})
+        writer.start()
+        assert appended.wait(10)
+
+        # The writer holds the namespace's locks with its rows appended but not published
+        assert sorted(store.list_ids("", namespace="ns")) == [f"doc#{i}" for i in range(5)]
+        assert store.query(vectors[7]["values"], top_k=1, namespace="ns")[0].id != "doc#7"
+        assert store.fetch(["doc#7"], namespace="ns") == []
+
+        release.set()
+        writer.join(10)
+        assert store.query(vectors[7]["values"], top_k=1, namespace="ns")[0].id == "doc#7"
+
+def upsert_in_worker(data_dir, worker, count):
+    store = LocalVectorStore(data_dir, dimension=8, refresh_interval=0)
+    for i in range(count):
+        store.upsert([{"id": f"w{worker}#{i}", "values": [float(worker + 1)] + [float(i)] * 7, "metadata": {}}], namespace="ns")
+
+class TestSharedVersions:
+    def test_workers_see_each_others_writes(self, tmp_path):
+        first = LocalVectorStore(str(tmp_path), dimension=8, refresh_interval=0)
+        second = LocalVectorStore(str(tmp_path), dimension=8, refresh_interval=0)
+        vectors = make_vectors(10)
+        first.upsert(vectors[:5], namespace="ns")
+        assert len(second.list_ids("doc#", namespace="ns")) == 5
+
+        # The second worker's write starts from the first worker's latest version
+        second.upsert(vectors[5:], namespace="ns")
+        first.delete(["doc#0"], namespace="ns")
+
+        assert sorted(second.list_ids("doc#", namespace="ns")) == [f"doc#{i}" for i in range(1, 10)]
+        assert second.query(vectors[7]["values"], top_k=1, namespace="ns")[0].metadata == {"text": "chunk 7"}
+
+    def test_refresh_interval_bounds_version_checks(self, tmp_path):
+        writer = LocalVectorStore(str(tmp_path), dimension=8, refresh_interval=0)
+        reader = LocalVectorStore(str(tmp_path), dimension=8, refresh_interval=3600)
+        writer.upsert(make_vectors(3), namespace="ns")
+        assert len(reader.list_ids("", namespace="ns")) == 3
+
+        writer.upsert(make_vectors(6), namespace="ns")
+
+        assert len(reader.list_ids("", namespace="ns")) == 3
+        reader.refresh_interval = 0
+        assert len(reader.list_ids("", namespace="ns")) == 6
+
+    def test_versions_are_memory_mapped_and_pruned(self, tmp_path):
+        store = LocalVectorStore(str(tmp_path), dimension=8, precision="int8")
+        for start in range(0, 30, 10):
+            store.upsert(make_vectors(30)[start:start + 10], namespace="ns")
+
+        reader = LocalVectorStore(str(tmp_path), dimension=8, precision="int8")
+        assert reader.query(make_vectors(30)[12]["values"], top_k=1, namespace="ns")[0].id == "doc#12"
+        ns = reader._namespaces["ns"]
+        assert isinstance(ns.matrix, np.memmap)
+        assert isinstance(ns.quantized.codes, np.memmap)
+        assert isinstance(ns.ids.data, np.memmap)
+        assert isinstance(ns.metadata.data, np.memmap)
+        # Queries don't build the ID lookup table
+        assert ns._id_to_row is None
+        assert (tmp_path / "ns" / "CURRENT").read_text() == "v3"
+        assert sorted(path.name for path in (tmp_path / "ns").iterdir() if path.is_dir()) == ["g1", "v2", "v3"]
+
+    def test_writes_append_to_the_current_generation(self, tmp_path):
+        store = LocalVectorStore(str(tmp_path), dimension=8, precision="int8")
+        vectors = make_vectors(30)
+        store.upsert(vectors[:20], namespace="ns")
+        generation = tmp_path / "ns" / "g1"
+        first_rows = (generation / "vectors.f32").read_bytes()
+
+        store.upsert(vectors[20:], namespace="ns")
+        store.upsert([{"id": "doc#3", "values": vectors[3]["values"], "metadata": {"text": "updated"}}], namespace="ns")
+        store.delete(["doc#4"], namespace="ns")
+
+        # Existing rows are left alone: the replaced row and the deleted one are tombstones
+        assert (generation / "vectors.f32").read_bytes()[:len(first_rows)] == first_rows
+        assert (generation / "vectors.f32").stat().st_size == 31 * 8 * 4
+        assert json.loads((tmp_path / "ns" / "v4" / "manifest.json").read_text()) == {"generation": "g1", "count": 31}
+        assert np.load(tmp_path / "ns" / "v4" / "deleted.npy").tolist() == [3, 4]
+        ns = store._namespaces["ns"]
+        assert isinstance(ns.matrix, np.memmap) and isinstance(ns.quantized.codes, np.memmap)
+
+        reader = LocalVectorStore(str(tmp_path), dimension=8, precision="int8")
+        assert reader.query(vectors[3]["values"], top_k=1, namespace="ns")[0].metadata == {"text": "updated"}
+        assert len(reader.list_ids("doc#", namespace="ns")) == 29
+
+    def test_tombstones_are_compacted_into_a_new_generation(self, tmp_path):
+        store = LocalVectorStore(str(tmp_path), dimension=8)
+        vectors = make_vectors(10)
+        store.upsert(vectors, namespace="ns")
+
+        store.delete(["doc#0", "doc#1", "doc#2"], namespace="ns")
+
+        ns = store._namespaces["ns"]
+        assert (ns.size, ns.tombstones, ns.directory) == (7, 0, str(tmp_path / "ns" / "g2"))
+        assert store.query(vectors[5]["values"], top_k=1, namespace="ns")[0].id == "doc#5"
+        assert sorted(LocalVectorStore(str(tmp_path), dimension=8).list_ids("", namespace="ns")) == [f"doc#{i}" for i in range(3, 10)]
+
+    def test_unversioned_namespace_is_migrated_on_write(self, tmp_path):
+        vectors = make_vectors(4)
+        directory = tmp_path / "ns"
+        directory.mkdir()
+        np.save(directory / "vectors.npy", np.array([v["values"] for v in vectors], dtype=np.float32))
+        (directory / "meta.json").write_text(json.dumps({"ids": [v["id"] for v in vectors], "metadata": [v["metadata"] for v in vectors]}))
+        store = LocalVectorStore(str(tmp_path), dimension=8)
+        assert store.query(vectors[2]["values"], top_k=1, namespace="ns")[0].id == "doc#2"
+
+        store.delete(["doc#0"], namespace="ns")
+
+        assert not (directory / "meta.json").exists()
+        assert (directory / "CURRENT").read_text() == "v1"
+        assert sorted(LocalVectorStore(str(tmp_path), dimension=8).list_ids("", namespace="ns")) == ["doc#1", "doc#2", "doc#3"]
+
+    def test_concurrent_writer_processes_lose_no_updates(self, tmp_path):
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=upsert_in_worker, args=(str(tmp_path), worker, 15)) for worker in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=60)
+
+        assert [worker.exitcode for worker in workers] == [0, 0, 0]
+        assert len(LocalVectorStore(str(tmp_path), dimension=8).list_ids("", namespace="ns")) == 45
+
+def clustered_vectors(count, dimension=16, topics=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dimension))
+    values = centers[rng.integers(0, topics, size=count)] + 0.5 * rng.normal(size=(count, dimension))
+    return [{"id": f"doc#{i}", "values": v.tolist(), "metadata": {}} for i, v in enumerate(values)], rng
+
+class TestApproximateIndex:
+    def build(self, data_dir, vectors, **kwargs):
+        store = LocalVectorStore(data_dir, dimension=16, ann_threshold=1000, ann_probes=8, **kwargs)
+        for start in range(0, len(vectors), 500):
+            store.upsert(vectors[start:start + 500], namespace="ns")
+        return store
+
+    @pytest.mark.parametrize("precision", ["float32", "int8"])
+    def test_recall_against_exact_search(self, precision):
+        vectors, rng = clustered_vectors(3000)
+        store = self.build(None, vectors, precision=precision)
+        exact = LocalVectorStore(None, dimension=16)
+        exact.upsert(vectors, namespace="ns")
+        assert store._namespaces["ns"].ivf is not None
+
+        recall = []
+        for query in rng.normal(size=(30, 16)):
+            expected = {m.id for m in exact.query(query.tolist(), top_k=10, namespace="ns")}
+            found = {m.id for m in store.query(query.tolist(), top_k=10, namespace="ns")}
+            recall.append(len(found & expected) / 10)
+
+        assert np.mean(recall) >= 0.9
+
+    def test_inserts_after_training_join_partitions(self):
+        vectors, rng = clustered_vectors(1500)
+        store = self.build(None, vectors)
+        ivf = store._namespaces["ns"].ivf
+        new = rng.normal(size=16).tolist()
+
+        store.upsert([{"id": "new", "values": new, "metadata": {"text": "new"}}], namespace="ns")
+
+        # Joined the trained partitions instead of training again
+        assert store._namespaces["ns"].ivf.centroids is ivf.centroids
+        match = store.query(new, top_k=1, namespace="ns")[0]
+        assert (match.id, match.metadata) == ("new", {"text": "new"})
+        assert match.score == pytest.approx(1.0, abs=1e-5)
+
+    def test_deletes_are_tombstones_until_compaction(self):
+        vectors, _ = clustered_vectors(1500)
+        store = self.build(None, vectors)
+        ns = store._namespaces["ns"]
+
+        assert store.delete(["doc#7", "doc#8"], namespace="ns") == 2
+
+        # Published as a new snapshot, the one queries held before is unchanged
+        assert (ns.size, len(ns), ns.tombstones) == (1500, 1500, 0)
+        ns = store._namespaces["ns"]
+        assert (ns.size, len(ns), ns.tombstones) == (1500, 1498, 2)
+        assert store.query(vectors[7]["values"], top_k=1, namespace="ns")[0].id != "doc#7"
+        assert "doc#7" not in store.list_ids("doc#", namespace="ns")
+        assert store.fetch(["doc#7", "doc#9"], namespace="ns")[0]["id"] == "doc#9"
+
+        store.delete([f"doc#{i}" for i in range(400)], namespace="ns")
+
+        ns = store._namespaces["ns"]
+        assert (ns.size, len(ns), ns.tombstones) == (1100, 1100, 0)
+        assert store.query(vectors[1200]["values"], top_k=1, namespace="ns")[0].id == "doc#1200"
+
+    def test_index_is_persisted_and_memory_mapped(self, tmp_path):
+        vectors, _ = clustered_vectors(1500)
+        store = self.build(str(tmp_path), vectors)
+        store.delete(["doc#3"], namespace="ns")
+
+        reloaded = LocalVectorStore(str(tmp_path), dimension=16, ann_threshold=1000, ann_probes=8)
+        assert reloaded.query(vectors[42]["values"], top_k=1, namespace="ns")[0].id == "doc#42"
+        ivf = reloaded._namespaces["ns"].ivf
+        assert isinstance(ivf.centroids, np.memmap) and isinstance(ivf.order, np.memmap)
+        np.testing.assert_array_equal(ivf.centroids, store._namespaces["ns"].ivf.centroids)
+        assert len(reloaded._namespaces["ns"]) == 1499
+        assert "doc#3" not in reloaded.list_ids("", namespace="ns")
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from app.services.embedding_cache import EmbeddingCache
+from app.services.local_vector_store import LocalVectorStore
+from app.services.quantization import decode_vector, encode_vector
+
+def cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+class TestQuantization:
+    @pytest.mark.parametrize("precision,size,min_cosine", [
+        ("float32", 6144, 1.0),
+        ("float16", 3072, 0.99999),
+        ("int8", 1540, 0.9999),
+    ])
+    def test_encoded_size_and_accuracy(self, precision, size, min_cosine):
+        vector = np.random.default_rng(0).normal(size=1536)
+
+        data = encode_vector(vector, precision)
+
+        assert len(data) == size
+        assert cosine(decode_vector(data, precision), vector) >= min_cosine - 1e-6
+
+    def test_cache_stores_compact_entries(self):
+        cache = EmbeddingCache(precision="int8")
+        vector = np.random.default_rng(1).normal(size=1536).tolist()
+
+        cache.set("model", "opening hours?", vector)
+
+        assert cache.bytes_used == 1540
+        assert cosine(cache.get("model", "Opening hours?"), vector) > 0.9999
+
+    @pytest.mark.parametrize("precision", ["float16", "int8"])
+    def test_rescoring_returns_exact_neighbours(self, tmp_path, precision):
+        rng = np.random.default_rng(2)
+        vectors = rng.normal(size=(2000, 64))
+        store = LocalVectorStore(str(tmp_path), dimension=64, precision=precision)
+        store.upsert([{"id": str(i), "values": v.tolist(), "metadata": {}} for i, v in enumerate(vectors)], namespace="ns")
+        exact = LocalVectorStore(None, dimension=64)
+        exact.upsert([{"id": str(i), "values": v.tolist(), "metadata": {}} for i, v in enumerate(vectors)], namespace="ns")
+
+        for query in rng.normal(size=(20, 64)):
+            matches = store.query(query.tolist(), top_k=10, namespace="ns")
+            expected = exact.query(query.tolist(), top_k=10, namespace="ns")
+            assert [m.id for m in matches] == [m.id for m in expected]
+            # Scores come from the full precision rows
+            assert [m.score for m in matches] == pytest.approx([m.score for m in expected], abs=1e-6)
+
+    def test_quantized_namespace_survives_delete_and_reload(self, tmp_path):
+        rng = np.random.default_rng(3)
+        vectors = rng.normal(size=(100, 32))
+        store = LocalVectorStore(str(tmp_path), dimension=32, precision="int8")
+        store.upsert([{"id": str(i), "values": v.tolist(), "metadata": {}} for i, v in enumerate(vectors)], namespace="ns")
+
+        store.delete(["0", "1"], namespace="ns")
+        # Deleted rows are skipped in the quantized scan as well
+        assert store.query(vectors[99].tolist(), top_k=1, namespace="ns")[0].id == "99"
+        assert isinstance(store._namespaces["ns"].matrix, np.memmap)
+
+        reloaded = LocalVectorStore(str(tmp_path), dimension=32, precision="int8")
+        assert reloaded.query(vectors[50].tolist(), top_k=1, namespace="ns")[0].id == "50"
+        assert reloaded._namespaces["ns"].quantized.codes.dtype == np.int8
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from app.services.embedding_models import EmbeddingModel
+from app.services.query_embedding_batcher import QueryEmbeddingBatcher
+
+SMALL = EmbeddingModel("text-embedding-3-small", 1536)
+SHORT = EmbeddingModel("text-embedding-3-small", 256)
+
+class FakeBatcher:
+    """Embeds each text as [len(text)] and records the texts of every request"""
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    async def embed(self, texts, model=None):
+        self.calls.append((list(texts), model))
+        await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+        return [[float(len(text))] for text in texts]
+
+class TestQueryEmbeddingBatcher:
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_share_one_request(self):
+        fake = FakeBatcher()
+        batcher = QueryEmbeddingBatcher(fake, max_wait=0.01)
+
+        embeddings = await asyncio.gather(*(batcher.embed(q, SMALL) for q in ["a", "bb", "ccc", "bb"]))
+
+        assert embeddings == [[1.0], [2.0], [3.0], [2.0]]
+        # The repeated query is embedded once
+        assert fake.calls == [(["a", "bb", "ccc"], SMALL)]
+        assert batcher.stats()["requests"] == 1
+        assert batcher.stats()["queries"] == 4
+
+    @pytest.mark.asyncio
+    async def test_full_batch_is_sent_without_waiting(self):
+        fake = FakeBatcher()
+        batcher = QueryEmbeddingBatcher(fake, max_wait=60, max_items=2)
+
+        first = asyncio.ensure_future(asyncio.gather(batcher.embed("a", SMALL), batcher.embed("bb", SMALL)))
+        third = asyncio.ensure_future(batcher.embed("ccc", SMALL))
+
+        assert await asyncio.wait_for(first, timeout=1) == [[1.0], [2.0]]
+        assert not third.done()
+        assert batcher.stats()["full_batches"] == 1
+        third.cancel()
+
+    @pytest.mark.asyncio
+    async def test_models_are_batched_separately(self):
+        fake = FakeBatcher()
+        batcher = QueryEmbeddingBatcher(fake, max_wait=0.01)
+
+        await asyncio.gather(batcher.embed("a", SMALL), batcher.embed("b", SHORT), batcher.embed("c", SMALL))
+
+        assert sorted((texts, model.dimensions) for texts, model in fake.calls) == [(["a", "c"], 1536), (["b"], 256)]
+
+    @pytest.mark.asyncio
+    async def test_failed_request_fails_every_caller(self):
+        batcher = QueryEmbeddingBatcher(FakeBatcher(RuntimeError("provider down")), max_wait=0.01)
+
+        results = await asyncio.gather(batcher.embed("a", SMALL), batcher.embed("b", SMALL), return_exceptions=True)
+
+        assert [str(result) for result in results] == ["provider down", "provider down"]
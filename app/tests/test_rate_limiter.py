@@ -0,0 +1,87 @@
+import pytest
+from starlette.requests import Request
+from app.middleware.rate_limiter import InMemoryBucketStore, RateLimiter, client_ip, parse_limit, parse_networks
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestRateLimiter:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def limiter(self, clock):
+        store = InMemoryBucketStore(shard_count=4, clock=clock)
+        limits = {
+            "chat": {
+                "client": parse_limit("2/10"),
+                "business": parse_limit("3/10")
+            }
+        }
+        return RateLimiter(store, limits)
+
+    def test_parse_limit(self):
+        """Test that limits are parsed as burst capacity and refill rate"""
+        assert parse_limit("10/60") == (10.0, 10.0 / 60)
+
+    def test_burst_then_reject(self, limiter):
+        """Test that a client is rejected once its burst is used up"""
+        keys = {"client": "a", "business": "shop"}
+        
+        assert limiter.check("chat", keys)[0]
+        assert limiter.check("chat", keys)[0]
+        
+        allowed, retry_after = limiter.check("chat", keys)
+        assert not allowed
+        assert retry_after == pytest.approx(5.0)
+
+    def test_refill(self, limiter, clock):
+        """Test that tokens come back over time"""
+        keys = {"client": "a"}
+        limiter.check("chat", keys)
+        limiter.check("chat", keys)
+        assert not limiter.check("chat", keys)[0]
+        
+        clock.now += 5.0
+        assert limiter.check("chat", keys)[0]
+
+    def test_business_limit_shared_by_clients(self, limiter):
+        """Test that the per-business bucket caps many different clients together"""
+        results = [limiter.check("chat", {"client": f"client_{i}", "business": "shop"})[0] for i in range(4)]
+        
+        assert results == [True, True, True, False]
+
+    def test_missing_keys_are_skipped(self, limiter):
+        """Test that keys without a value or without a configured limit are ignored"""
+        for _ in range(10):
+            assert limiter.check("chat", {"client": None, "ip": "1.2.3.4"})[0]
+
+    def test_rejected_request_takes_no_tokens(self, limiter):
+        """Test that a request rejected by one limit doesn't use up the other limits"""
+        assert limiter.check("chat", {"business": "shop"})[0]
+        assert limiter.check("chat", {"business": "shop"})[0]
+        assert limiter.check("chat", {"client": "a", "business": "shop"})[0]
+        
+        # The business bucket is empty, so client "b" keeps both of its tokens
+        assert not limiter.check("chat", {"client": "b", "business": "shop"})[0]
+        assert limiter.check("chat", {"client": "b"})[0]
+        assert limiter.check("chat", {"client": "b"})[0]
+
+    def test_client_ip_behind_trusted_proxy(self):
+        """Test that X-Forwarded-For is only believed when the connection comes from a trusted proxy"""
+        def request(peer, forwarded=None):
+            headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+            return Request({"type": "http", "client": (peer, 1234), "headers": headers})
+        
+        proxies = parse_networks("10.0.0.0/8, 127.0.0.1")
+        assert client_ip(request("10.0.0.5", "203.0.113.7"), proxies) == "203.0.113.7"
+        # Entries left of the first untrusted hop can be forged by the client
+        assert client_ip(request("10.0.0.5", "1.1.1.1, 203.0.113.7, 10.0.0.9"), proxies) == "203.0.113.7"
+        assert client_ip(request("198.51.100.2", "203.0.113.7"), proxies) == "198.51.100.2"
+        assert client_ip(request("10.0.0.5"), proxies) == "10.0.0.5"
+        assert client_ip(request("10.0.0.5", "203.0.113.7")) == "10.0.0.5"
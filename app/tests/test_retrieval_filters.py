@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from app.services.retrieval_filters import apply_similarity_threshold, maximal_marginal_relevance
+from app.services.vector_backends import Match
+
+class TestRetrievalFilters:
+    def test_threshold_drops_weak_matches(self):
+        matches = [Match("a", 0.91), Match("b", 0.82), Match("c", 0.64)]
+
+        assert [m.id for m in apply_similarity_threshold(matches, 0.8)] == ["a", "b"]
+        assert apply_similarity_threshold(matches, None) == matches
+
+    def test_mmr_skips_near_duplicates(self):
+        matches = [
+            Match("pricing", 0.90, values=[1.0, 0.0, 0.0]),
+            Match("pricing-copy", 0.89, values=[0.99, 0.01, 0.0]),
+            Match("shipping", 0.80, values=[0.0, 1.0, 0.0]),
+            Match("returns", 0.75, values=[0.0, 0.0, 1.0]),
+        ]
+
+        selected = maximal_marginal_relevance(matches, top_k=3, lambda_mult=0.5)
+
+        assert [m.id for m in selected] == ["pricing", "shipping", "returns"]
+
+    def test_relevance_only_keeps_ranking(self):
+        rng = np.random.default_rng(0)
+        matches = [Match(str(i), 1.0 - i / 10, values=rng.normal(size=8).tolist()) for i in range(6)]
+
+        selected = maximal_marginal_relevance(matches, top_k=4, lambda_mult=1.0)
+
+        assert [m.id for m in selected] == ["0", "1", "2", "3"]
+
+    def test_matches_without_values_are_not_redundant(self):
+        matches = [
+            Match("a", 0.030, values=[1.0, 0.0]),
+            Match("b", 0.029, values=[1.0, 0.0]),
+            Match("keyword-only", 0.028),
+        ]
+
+        selected = maximal_marginal_relevance(matches, top_k=2, lambda_mult=0.5)
+
+        assert [m.id for m in selected] == ["a", "keyword-only"]
+
+    @pytest.mark.parametrize("count", [0, 1])
+    def test_small_inputs(self, count):
+        matches = [Match("a", 0.9, values=[1.0])][:count]
+        assert maximal_marginal_relevance(matches, top_k=5) == matches
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from app.services.session_turns import SessionTurnQueue, SessionQueueFullError, TurnSupersededError
+
+class TestSessionTurnQueue:
+    @pytest.fixture
+    def turns(self):
+        return SessionTurnQueue(max_queue_depth=3)
+
+    @pytest.mark.asyncio
+    async def test_turns_in_same_session_are_serialized(self, turns):
+        """Test that turns of one session never overlap and keep arrival order"""
+        events = []
+        
+        def make_turn(name):
+            async def turn():
+                events.append(f"start {name}")
+                await asyncio.sleep(0.01)
+                events.append(f"end {name}")
+                return name
+            return turn
+        
+        results = await asyncio.gather(
+            turns.run("session_a", make_turn("first")),
+            turns.run("session_a", make_turn("second"))
+        )
+        
+        assert results == ["first", "second"]
+        assert events == ["start first", "end first", "start second", "end second"]
+        assert turns.pending("session_a") == 0
+
+    @pytest.mark.asyncio
+    async def test_different_sessions_run_in_parallel(self, turns):
+        """Test that turns of different sessions overlap"""
+        running = []
+        peak = []
+        
+        async def turn():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+        
+        await asyncio.gather(*(turns.run(f"session_{i}", turn) for i in range(3)))
+        
+        assert max(peak) == 3
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_is_bounded(self, turns):
+        """Test that a session rejects turns beyond the queue depth"""
+        release = asyncio.Event()
+        
+        async def turn():
+            await release.wait()
+        
+        tasks = [asyncio.create_task(turns.run("session_a", turn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        
+        with pytest.raises(SessionQueueFullError):
+            await turns.run("session_a", turn)
+        
+        release.set()
+        await asyncio.gather(*tasks)
+
+    @pytest.mark.asyncio
+    async def test_superseded_turn_is_skipped(self, turns):
+        """Test that a waiting turn is dropped when a newer turn arrives"""
+        release = asyncio.Event()
+        
+        async def blocking_turn():
+            await release.wait()
+            return "first"
+        
+        async def turn(name):
+            return name
+        
+        first = asyncio.create_task(turns.run("session_a", blocking_turn, supersede=True))
+        second = asyncio.create_task(turns.run("session_a", lambda: turn("second"), supersede=True))
+        third = asyncio.create_task(turns.run("session_a", lambda: turn("third"), supersede=True))
+        await asyncio.sleep(0)
+        release.set()
+        
+        assert await first == "first"
+        with pytest.raises(TurnSupersededError):
+            await second
+        assert await third == "third"
@@ -0,0 +1,101 @@
+import sys
+import pytest
+from app.services import text_chunker
+from app.services.text_chunker import PAGE_BREAK, chunk_document, get_tokenizer
+
+class TestChunkDocument:
+    @pytest.fixture
+    def tokenizer(self):
+        return get_tokenizer()
+
+    @pytest.fixture
+    def document(self):
+        with open("test_data/coffee_shop_knowledge.txt") as f:
+            return f.read()
+
+    def test_chunks_respect_size_and_offsets(self, document, tokenizer):
+        """Test that every chunk fits the token budget and points back into the document"""
+        chunks = list(chunk_document(document, "coffee.txt", chunk_size=120, overlap=20))
+        
+        assert len(chunks) > 1
+        assert [c.index for c in chunks] == list(range(len(chunks)))
+        for chunk in chunks:
+            assert tokenizer.count(chunk.text) <= 130
+            assert document[chunk.start:chunk.end] == chunk.text
+            assert chunk.source == "coffee.txt"
+
+    def test_headings_start_sections(self, document):
+        """Test that headings become chunk boundaries and are recorded in metadata"""
+        chunks = list(chunk_document(document, "coffee.txt", chunk_size=120, overlap=20))
+        
+        tea_chunk = next(c for c in chunks if c.heading == "Tea")
+        assert tea_chunk.text.startswith("Tea:")
+        assert tea_chunk.metadata()["heading"] == "Tea"
+
+    def test_page_numbers(self):
+        """Test that chunks record the page they start on"""
+        text = "First page paragraph with a few more words in it." + PAGE_BREAK + "Details:\nSecond page paragraph."
+        chunks = list(chunk_document(text, "doc.pdf", chunk_size=40, overlap=0))
+        
+        assert [(c.text, c.page) for c in chunks] == [
+            ("First page paragraph with a few more words in it.", 1),
+            ("Details:\nSecond page paragraph.", 2)
+        ]
+
+    def test_chunk_records_its_page_range(self):
+        """Test that a chunk of paragraphs from several pages records its first and last page"""
+        text = "Short first page." + PAGE_BREAK + "Short second page."
+        chunks = list(chunk_document(text, "doc.pdf", chunk_size=40, overlap=0))
+        
+        assert len(chunks) == 1
+        assert (chunks[0].page, chunks[0].end_page) == (1, 2)
+        assert chunks[0].metadata()["end_page"] == 2
+
+    def test_overlap_is_never_a_chunk_of_its_own(self, tokenizer):
+        """Test that a heading right after a full chunk doesn't emit the carried overlap alone"""
+        paragraphs = [" ".join(f"word{p}x{i}" for i in range(6)) for p in range(4)]
+        text = "\n\n".join(paragraphs[:3] + ["Prices:\nCoffee costs three dollars."])
+        size = tokenizer.count(paragraphs[0]) * 2 + 1
+        chunks = list(chunk_document(text, "doc.txt", chunk_size=size, overlap=size // 2))
+        
+        texts = [c.text for c in chunks]
+        assert texts[-1].startswith("Prices:")
+        # Every chunk adds text that the previous chunk doesn't end with
+        for previous, current in zip(texts, texts[1:]):
+            assert not previous.endswith(current)
+
+    def test_long_paragraph_is_windowed_with_overlap(self, tokenizer):
+        """Test that a paragraph larger than a chunk is split into overlapping windows"""
+        text = " ".join(f"item{i}" for i in range(300))
+        chunks = list(chunk_document(text, "doc.txt", chunk_size=50, overlap=10))
+        
+        assert len(chunks) > 1
+        for previous, current in zip(chunks, chunks[1:]):
+            assert current.start < previous.end
+        assert chunks[-1].end == len(text)
+
+    def test_is_a_generator(self):
+        """Test that chunks are produced lazily"""
+        chunks = chunk_document("Some text.", "doc.txt")
+        
+        assert next(chunks).text == "Some text."
+
+    def test_overlap_must_be_smaller_than_size(self):
+        with pytest.raises(ValueError):
+            list(chunk_document("text", "doc.txt", chunk_size=10, overlap=10))
+
+class TestGetTokenizer:
+    def test_approximate_tokenizer_is_replaced_once_tiktoken_loads(self, monkeypatch):
+        monkeypatch.setattr(text_chunker, "_tokenizers", {})
+        monkeypatch.setitem(sys.modules, "tiktoken", None)
+        fallback = get_tokenizer("test-model")
+        assert fallback.encoding is None
+        # Reused until it is time to try tiktoken again
+        assert get_tokenizer("test-model") is fallback
+
+        monkeypatch.setattr(text_chunker, "TOKENIZER_RETRY_SECONDS", 0)
+        monkeypatch.setattr(text_chunker.Tokenizer, "__init__", lambda self, model: setattr(self, "encoding", object()))
+
+        loaded = get_tokenizer("test-model")
+        assert loaded is not fallback and loaded.encoding is not None
+        assert get_tokenizer("test-model") is loaded
@@ -0,0 +1,180 @@
+import os
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models.knowledge import ChunkText
+from app.services import vector_store
+from app.services.bm25_index import BM25Index
+from app.services.chunk_store import ChunkStore
+from app.services.local_vector_store import LocalVectorStore
+from app.services.vector_backends import PineconeVectorStore
+
+class FakeIndexList:
+    def __init__(self, names):
+        self._names = names
+
+    def names(self):
+        return self._names
+
+class FakeIndex:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def upsert(self, vectors, batch_size, namespace=None):
+        self.calls.append("upsert")
+
+    def describe_index_stats(self):
+        self.calls.append("describe_index_stats")
+
+class FakePinecone:
+    """Records every call that would be a network round trip"""
+    def __init__(self):
+        self.calls = []
+
+    def list_indexes(self):
+        self.calls.append("list_indexes")
+        return FakeIndexList(["business-knowledge-base"])
+
+    def describe_index(self, name):
+        self.calls.append("describe_index")
+        return type("Description", (), {"status": {"ready": True}})()
+
+    def Index(self, name):
+        self.calls.append("Index")
+        return FakeIndex(self.calls)
+
+class FakeBatcher:
+    def __init__(self):
+        self.embedded = []
+
+    async def embed(self, texts, model=None, token_counts=None):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+def memory_chunk_store():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[ChunkText.__table__])
+    return ChunkStore(sessionmaker(bind=engine))
+
+class NoStatsStore(LocalVectorStore):
+    def stats(self):
+        raise AssertionError("ingest must not fetch index stats")
+
+class TestIngestRoundTrips:
+    def test_pinecone_readiness_and_index_handle_are_reused(self):
+        client = FakePinecone()
+        store = PineconeVectorStore(client=client)
+        vectors = [{"id": "a", "values": [1.0, 0.0], "metadata": {"text": "a"}}]
+
+        for _ in range(3):
+            store.upsert(vectors, namespace="business_1")
+
+        assert client.calls == ["list_indexes", "describe_index", "Index", "upsert", "upsert", "upsert"]
+
+    @pytest.mark.asyncio
+    async def test_store_embeddings_only_embeds_and_upserts(self, monkeypatch, tmp_path):
+        store = NoStatsStore(str(tmp_path), dimension=2)
+        monkeypatch.setattr(vector_store, "embedding_batcher", FakeBatcher())
+        monkeypatch.setattr(vector_store, "get_vector_store", lambda namespace=None, dimension=None: store)
+        monkeypatch.setattr(vector_store, "bm25_index", BM25Index(str(tmp_path / "bm25")))
+        monkeypatch.setattr(vector_store, "chunk_store", memory_chunk_store())
+        monkeypatch.setattr(vector_store, "ingested_vectors", vector_store.Counter())
+        monkeypatch.setattr(vector_store, "ingested_documents", vector_store.Counter())
+        text = "\n\n".join(f"Paragraph {i} " + "word " * 300 for i in range(5))
+
+        await vector_store.store_embeddings(text, namespace="business_1", source="doc.txt")
+
+        stored = len(store._namespaces["business_1"])
+        assert stored > 1
+        assert vector_store.get_ingest_stats() == {"business_1": {"documents": 1, "vectors": stored}}
+        keyword_match = vector_store.bm25_index.search("Paragraph 3", namespace="business_1")[0]
+        assert "text" not in keyword_match.metadata
+        assert vector_store.chunk_store.hydrate([keyword_match], "business_1")[0].metadata["source"] == "doc.txt"
+
+class TestIncrementalIngest:
+    @pytest.fixture
+    def ingest(self, monkeypatch, tmp_path):
+        store = LocalVectorStore(str(tmp_path), dimension=2)
+        batcher = FakeBatcher()
+        monkeypatch.setattr(vector_store, "embedding_batcher", batcher)
+        monkeypatch.setattr(vector_store, "get_vector_store", lambda namespace=None, dimension=None: store)
+        monkeypatch.setattr(vector_store, "bm25_index", BM25Index(str(tmp_path / "bm25")))
+        monkeypatch.setattr(vector_store, "chunk_store", memory_chunk_store())
+        return store, batcher
+
+    @pytest.mark.asyncio
+    async def test_reupload_embeds_only_changed_chunks(self, ingest):
+        store, batcher = ingest
+        # Each paragraph is a heading section of its own chunk
+        sections = [f"PRODUCT {i}\n\nItem {i} costs ${i}.99 " + "and is popular " * 40 for i in range(6)]
+
+        first = await vector_store.store_embeddings("\n\n".join(sections), namespace="business_1", source="catalog.pdf")
+        assert (first.added, first.reused, first.removed) == (6, 0, 0)
+
+        batcher.embedded.clear()
+        sections[2] = sections[2].replace("$2.99", "$3.49")
+        edited = sections[:4] + sections[5:] + ["PRODUCT 9\n\nItem 9 is new " + "and is popular " * 40]
+
+        second = await vector_store.store_embeddings("\n\n".join(edited), namespace="business_1", source="catalog.pdf")
+
+        assert second.document_id == first.document_id
+        assert (second.added, second.reused, second.removed) == (2, 4, 2)
+        assert len(batcher.embedded) == 2
+        assert len(store.list_ids(f"{first.document_id}#", namespace="business_1")) == 6
+        keyword_matches = vector_store.bm25_index.search("item costs", top_k=10, namespace="business_1")
+        indexed_texts = [m.metadata["text"] for m in vector_store.chunk_store.hydrate(keyword_matches, "business_1")]
+        assert len(indexed_texts) == 6
+        assert not any("$2.99" in text for text in indexed_texts)
+        assert any("$3.49" in text for text in indexed_texts)
+
+    @pytest.mark.asyncio
+    async def test_unchanged_reupload_embeds_nothing(self, ingest):
+        store, batcher = ingest
+        text = "Opening hours: 8am to 8pm.\n\nWe deliver within the city."
+
+        await vector_store.store_embeddings(text, namespace="business_1", source="info.txt")
+        batcher.embedded.clear()
+        report = await vector_store.store_embeddings(text, namespace="business_1", source="info.txt")
+
+        assert batcher.embedded == []
+        assert report.as_dict() == {"document_id": report.document_id, "added": 0, "reused": 1, "removed": 0}
+
+    @pytest.mark.asyncio
+    async def test_progress_is_reported_per_stage(self, ingest):
+        sections = [f"PRODUCT {i}\n\nItem {i} costs ${i}.99 " + "and is popular " * 40 for i in range(4)]
+        await vector_store.store_embeddings("\n\n".join(sections[:2]), namespace="business_1", source="catalog.pdf")
+        progress = {}
+        stages = []
+
+        def record(stage, chunks):
+            progress[stage] = progress.get(stage, 0) + chunks
+            if not stages or stages[-1] != stage:
+                stages.append(stage)
+
+        await vector_store.store_embeddings("\n\n".join(sections), namespace="business_1", source="catalog.pdf", progress=record)
+
+        assert progress == {"chunking": 4, "embedding": 2, "upserting": 2}
+        assert stages == ["chunking", "embedding", "upserting"]
+
+class TestHybridSearch:
+    def test_keyword_match_reaches_results_missed_by_vectors(self, monkeypatch, tmp_path):
+        store = LocalVectorStore(str(tmp_path), dimension=2)
+        keywords = BM25Index(str(tmp_path / "bm25"))
+        texts = {f"doc#{i}": f"General product information, part {i}." for i in range(10)}
+        texts["doc#9"] = "Replacement filter SKU FX-220 costs $12.50."
+        # The SKU chunk is the least similar by embedding
+        store.upsert([{"id": chunk_id, "values": [1.0, i / 10], "metadata": {"text": text}}
+                      for i, (chunk_id, text) in enumerate(texts.items())], namespace="business_1")
+        keywords.add([(chunk_id, text, {"text": text}) for chunk_id, text in texts.items()], namespace="business_1")
+        monkeypatch.setattr(vector_store, "get_vector_store", lambda namespace=None, dimension=None: store)
+        monkeypatch.setattr(vector_store, "bm25_index", keywords)
+        monkeypatch.setattr(vector_store.EmbeddingService, "get_query_embedding", staticmethod(lambda query, model=None: [1.0, 0.0]))
+
+        results = vector_store.search_similar_texts("How much is FX-220?", top_k=3, namespace="business_1")
+
+        assert len(results) == 3
+        assert "doc#9" in [m.id for m in results]
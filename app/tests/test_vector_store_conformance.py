@@ -0,0 +1,152 @@
+import os
+import time
+import uuid
+import numpy as np
+import pytest
+from app.services.local_vector_store import LocalVectorStore
+from app.services.vector_backends import ChromaVectorStore, PineconeVectorStore
+
+DIMENSION = 16
+PINECONE_TEST_INDEX = os.getenv("PINECONE_TEST_INDEX")
+
+def make_vectors(count, seed=0, prefix="doc"):
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": f"{prefix}#{i}", "values": rng.normal(size=DIMENSION).tolist(), "metadata": {"text": f"chunk {i}"}}
+        for i in range(count)
+    ]
+
+def settle(store):
+    """Pinecone is eventually consistent, give writes time to become visible"""
+    if isinstance(store, PineconeVectorStore):
+        time.sleep(15)
+
+@pytest.fixture(params=[
+    "local",
+    "local_int8",
+    "chroma",
+    pytest.param("pinecone", marks=pytest.mark.skipif(not PINECONE_TEST_INDEX, reason="PINECONE_TEST_INDEX not set"))
+])
+def store(request, tmp_path):
+    if request.param == "local":
+        return LocalVectorStore(str(tmp_path), dimension=DIMENSION)
+    if request.param == "local_int8":
+        return LocalVectorStore(str(tmp_path), dimension=DIMENSION, precision="int8")
+    if request.param == "chroma":
+        return ChromaVectorStore(path=str(tmp_path), dimension=DIMENSION)
+    return PineconeVectorStore(index_name=PINECONE_TEST_INDEX, dimension=DIMENSION)
+
+@pytest.fixture
+def namespace():
+    # Unique per test so a shared Pinecone test index starts out empty
+    return f"test_{uuid.uuid4().hex[:12]}"
+
+class TestVectorStoreConformance:
+    def test_query_ranks_by_cosine_similarity(self, store, namespace):
+        vectors = make_vectors(50)
+        store.upsert(vectors, namespace=namespace)
+        settle(store)
+        query = np.random.default_rng(1).normal(size=DIMENSION)
+
+        matches = store.query(query.tolist(), top_k=5, namespace=namespace)
+
+        matrix = np.array([v["values"] for v in vectors])
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query))
+        assert [m.id for m in matches] == [f"doc#{i}" for i in np.argsort(-scores)[:5]]
+        assert [m.score for m in matches] == pytest.approx(sorted(scores, reverse=True)[:5], abs=1e-4)
+        assert matches[0].metadata["text"].startswith("chunk")
+
+    def test_query_can_return_vectors(self, store, namespace):
+        vectors = make_vectors(5)
+        store.upsert(vectors, namespace=namespace)
+        settle(store)
+
+        match = store.query(vectors[3]["values"], top_k=1, namespace=namespace, include_values=True)[0]
+
+        original = np.array(vectors[3]["values"])
+        returned = np.array(match.values)
+        assert returned @ original / (np.linalg.norm(returned) * np.linalg.norm(original)) == pytest.approx(1.0, abs=1e-5)
+        assert store.query(vectors[3]["values"], top_k=1, namespace=namespace)[0].values is None
+
+    def test_namespaces_are_isolated(self, store, namespace):
+        store.upsert(make_vectors(3), namespace=namespace)
+        settle(store)
+
+        assert store.query([1.0] * DIMENSION, top_k=5, namespace=f"{namespace}_other") == []
+
+    def test_upsert_replaces_metadata(self, store, namespace):
+        vectors = make_vectors(5)
+        store.upsert(vectors, namespace=namespace)
+        store.upsert([{"id": "doc#2", "values": vectors[2]["values"], "metadata": {"text": "updated"}}], namespace=namespace)
+        settle(store)
+
+        matches = store.query(vectors[2]["values"], top_k=10, namespace=namespace)
+
+        assert len(matches) == 5
+        assert matches[0].id == "doc#2"
+        assert matches[0].metadata == {"text": "updated"}
+
+    def test_vectors_without_metadata(self, store, namespace):
+        store.upsert([{"id": "bare", "values": [1.0] * DIMENSION, "metadata": {}}], namespace=namespace)
+        settle(store)
+
+        match = store.query([1.0] * DIMENSION, top_k=1, namespace=namespace)[0]
+
+        assert match.id == "bare"
+        assert match.metadata == {}
+
+    def test_list_ids_by_prefix(self, store, namespace):
+        store.upsert(make_vectors(3, prefix="menu") + make_vectors(2, prefix="drinks"), namespace=namespace)
+        settle(store)
+
+        assert sorted(store.list_ids("menu#", namespace=namespace)) == ["menu#0", "menu#1", "menu#2"]
+        assert store.list_ids("menu#", namespace=f"{namespace}_other") == []
+
+    def test_fetch_by_id(self, store, namespace):
+        vectors = make_vectors(5)
+        store.upsert(vectors, namespace=namespace)
+        settle(store)
+
+        fetched = {vector["id"]: vector for vector in store.fetch(["doc#1", "doc#4", "missing"], namespace=namespace)}
+
+        assert sorted(fetched) == ["doc#1", "doc#4"]
+        assert fetched["doc#4"]["metadata"] == {"text": "chunk 4"}
+        original = np.array(vectors[4]["values"])
+        returned = np.array(fetched["doc#4"]["values"], dtype=np.float64)
+        assert returned @ original / (np.linalg.norm(returned) * np.linalg.norm(original)) == pytest.approx(1.0, abs=1e-5)
+        assert store.fetch(["doc#1"], namespace=f"{namespace}_other") == []
+
+    def test_delete_and_stats(self, store, namespace):
+        vectors = make_vectors(10)
+        store.upsert(vectors, namespace=namespace)
+        settle(store)
+
+        assert store.delete(["doc#0", "doc#9"], namespace=namespace) == 2
+        settle(store)
+
+        matches = store.query(vectors[0]["values"], top_k=20, namespace=namespace)
+        assert len(matches) == 8
+        assert "doc#0" not in {m.id for m in matches}
+        stats = store.stats()
+        assert stats["namespaces"][namespace]["vector_count"] == 8
+        assert stats["total_vector_count"] >= 8
+
+class TestVectorStoreLatency:
+    def test_query_latency(self, store, namespace):
+        """p95 query latency on a tenant-sized namespace stays interactive"""
+        if isinstance(store, PineconeVectorStore):
+            pytest.skip("Network latency is not a property of the adapter")
+        vectors = make_vectors(5000, prefix="lat")
+        for start in range(0, len(vectors), 1000):
+            store.upsert(vectors[start:start + 1000], namespace=namespace)
+        queries = np.random.default_rng(2).normal(size=(50, DIMENSION)).tolist()
+        store.query(queries[0], top_k=5, namespace=namespace)
+
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            store.query(query, top_k=5, namespace=namespace)
+            timings.append(time.perf_counter() - start)
+
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1]
+        assert p95 < 0.05, f"p95 query latency {p95 * 1000:.1f} ms"